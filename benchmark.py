@@ -0,0 +1,563 @@
+#!/usr/bin/python3
+
+# benchmarks for the performance critical parts of get_work.py and construct_examples.py
+#
+# usage:
+#     python.exe benchmark.py [name ...] [--json results.json]
+# runs all benchmarks if no name is given. The reports are taken from fixtures/reports.txt.xz,
+# the end-to-end benchmark serves them with the local stand-in server of primenet_standin.py.
+#     python.exe benchmark.py --record 100000 110000
+# replaces the fixture with the current reports of the PrimeNet server (one request per second).
+
+import os
+import re
+import sys
+import io
+import time
+import json
+import datetime
+import lzma
+import random
+import argparse
+import platform
+import contextlib
+
+from numbertheory import primes_between
+
+# runs f() repeat times and returns the best wall time in seconds
+def timeit(f, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+# saved reports which are used by the benchmarks, see --fixture and --record
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "reports.txt.xz")
+
+# settings of the end-to-end benchmark, see main()
+LATENCY = 0.
+ERROR_RATE = 0.
+BATCH_SIZE = 10
+PARALLEL = 4
+
+# returns {n: [lines]} from the fixture
+def load_fixture():
+    from primenet_standin import load_reports
+    return load_reports(FIXTURE)
+
+# the Fermat test of get_work.py before the segmented sieve, which bench_sieve() measures as the baseline
+def isprime_before(n):
+    sp = set([2,3,5,7,11,13,17,19])
+    if n < 20: return (n in sp)
+    for b in sp:
+        if pow(b,n-1,n) != 1:
+            return False
+    return True
+
+# enumeration of prime exponents: isprime() on every integer vs. the segmented sieve
+def bench_sieve():
+    results = {}
+    print(f"{'range':>24} {'primes':>8} {'isprime [s]':>12} {'sieve [s]':>10} {'speedup':>8}")
+    for start, stop in [(10**5, 2*10**5), (10**6, 2*10**6), (10**7, 10**7 + 10**6), (10**8, 10**8 + 10**6)]:
+        count = sum(1 for _ in primes_between(start, stop))
+        t_isprime = timeit(lambda: [n for n in range(start, stop) if isprime_before(n)], repeat=1)
+        t_sieve = timeit(lambda: list(primes_between(start, stop)))
+        print(f"{f'{start}-{stop}':>24} {count:>8} {t_isprime:>12.3f} {t_sieve:>10.3f} {t_isprime/t_sieve:>7.0f}x")
+        results[f"{start}-{stop}"] = {"primes": count, "isprime_seconds": t_isprime, "sieve_seconds": t_sieve}
+    return results
+
+# returns the lines of a report of exponent n in the format of report_exponent,
+# containing every record type and (unless the exponent is unfactored) real factors
+def synthetic_report(n, rng, ecm_lines=20):
+    lines = []
+    factors = [q for q in range(2*n+1, 2000*n, 2*n) if q % 8 in (1, 7) and pow(2, n, q) == 1][:2]
+    if factors:
+        lines.append(f"{n}\tFactored\t" + ";".join(str(f) for f in factors))
+        lines.append(f"{n}\tPRPCofactor\tVerified (Factored);2017-11-09;kkmrkkblmbrbk;PRP_PRP_PRP_PRP_;3;37261;1;3")
+    else:
+        lines.append(f"{n}\tUnfactored\t2^{rng.randint(66, 75)}")
+    lines.append(f"{n}\tLL\tVerified;2018-02-26;G0rfi3ld;F9042256B193FAA0;3178317")
+    lines.append(f"{n}\tPRP\tVerified;2020-10-12;gLauss;738AD2BB0D72E3AA;1276614;1;3")
+    B1 = rng.choice([1000000, 5000000, 30000000])
+    lines.append(f"{n}\tPM1\tB1={B1},B2={30*B1}")
+    lines.append(f"{n}\tHistory\t2007-07-04;ComputerraRU;NF;no factor to 2^{rng.randint(55, 64)}")
+    lines.append(f"{n}\tHistory\t2009-07-04;ComputerraRU;NF;no factor from 2^64 to 2^{rng.randint(65, 70)}")
+    lines.append(f"{n}\tHistory\t2018-12-21;Jocelyn Larouche;NF-PM1;B1={B1}, B2={30*B1}, E=12")
+    lines.append(f"{n}\tHistory\t2021-04-27;gLauss;NF-PP1;Start=2/7, B1={B1//2}, B2={50*B1}")
+    lines.append(f"{n}\tHistory\t2021-05-27;gLauss;C-PRP;D6A7E3FCB7B3A4C1")
+    for i in range(ecm_lines):
+        B1 = rng.choice([11000, 50000, 250000, 1000000, 3000000])
+        lines.append(f"{n}\tHistory\t2011-01-{1+i%28:02};James Hintz;NF-ECM;{rng.randint(1, 20)} curves, B1={B1}, B2={100*B1}")
+    for f in factors:
+        lines.append(f"{n}\tHistory\t2008-08-26;-Anonymous-;F;Factor: {f}")
+    if factors:
+        lines.append(f"{n}\tHistory\t2019-01-15;Jocelyn Larouche;F-PM1;Factor: {factors[0]} / (P-1, B1=1000000)")
+    lines.append(f"{n}\tAssigned\t2017-10-09;Chang Chia-Tche;PRP test;;0.0;updated on 2017-10-09;expired on 2017-10-13")
+    return lines
+
+# returns {n: lines} with synthetic reports for the first `count` prime exponents >= start
+def synthetic_corpus(start=100000, count=2000, seed=0):
+    rng = random.Random(seed)
+    corpus = {}
+    for n in primes_between(start, 2*start):
+        corpus[n] = synthetic_report(n, rng)
+        if len(corpus) == count:
+            break
+    return corpus
+
+# returns the reports of the fixture: synthetic reports of consecutive prime exponents, some of them with
+# a huge ECM history, composite factors (as the server sometimes reports them) and unusual records
+def synthetic_fixture(start=100000, count=300, seed=1):
+    rng = random.Random(seed)
+    corpus = synthetic_corpus(start, count, seed)
+    exponents = sorted(corpus)
+    for n in exponents[10:13]:
+        corpus[n] = synthetic_report(n, rng, ecm_lines=5000)
+    for n, f in composite_mersenne_factors(start, 3, 10**4):
+        lines = [l for l in synthetic_report(n, rng) if not any(t in l for t in ("\tFactored\t", ";F;", ";F-PM1;", "\tPRPCofactor\t"))]
+        corpus[n] = [f"{n}\tFactored\t{f}", f"{n}\tHistory\t2009-03-11;-Anonymous-;F;Factor: {f}"] + lines
+    n = exponents[20]
+    factor = corpus[n][0].split("\t")[2].split(";")[0] if "\tFactored\t" in corpus[n][0] else None
+    corpus[n] = corpus[n] + [
+        f"{n}\tPM1\tB1=2000000,B2=200000000,E=12",
+        f"{n}\tPRPCofactor\tUnverified;2019-06-01;someone;PRP_PRP_PRP_PRP_;3;37261;1;3",
+        f"{n}\tHistory\t2012-02-29;Jocelyn Larouche;NF;no factor from 2^70 to 2^71",
+        f"{n}\tHistory\t2016-05-01;James Hintz;NF-ECM;1 curve, B1=44000000, B2=4400000000",
+        f"{n}\tHistory\t2016-05-02;James Hintz;NF-ECM;3 curves, B1=11000",
+        f"{n}\tHistory\t2021-04-28;gLauss;NF-PP1;Start=6/5, B1=3000000",
+        f"{n}\tHistory\t2021-05-28;gLauss;CERT;D6A7E3FCB7B3A4C1",
+        f"{n}\tHistory\t2021-05-29;gLauss;C-LL;D6A7E3FCB7B3A4C1",
+    ]
+    if factor:
+        corpus[n] += [f"{n}\tHistory\t2015-04-26;Serge Batalov;F-ECM;Factor: {factor}",
+                      f"{n}\tHistory\t2021-06-01;gLauss;F-PP1;Start=2/7, B1=5000000, B2=500000000, Factor: {factor}"]
+    n = exponents[21]
+    corpus[n] = [f"{n}\tUnfactored\t2^67"]
+    return corpus
+
+# writes {n: [lines]} as text report compressed with xz, in the order of the exponents like the server
+def write_fixture(corpus, filename):
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    with lzma.open(filename, "wt", encoding="utf-8") as f:
+        for n in sorted(corpus):
+            for l in corpus[n]:
+                f.write(l + "\n")
+
+# fetches the reports of all prime exponents lo <= n < hi from the PrimeNet server
+def record_fixture(lo, hi):
+    from get_work import fetch_reports, RateLimiter
+    return dict(fetch_reports(list(primes_between(lo, hi)), batch_size=100, limiter=RateLimiter(1.)))
+
+# the line by line parser of get_work.py before parse_report() (with FATAL replaced by exceptions),
+# which bench_parse() measures as the baseline
+def is_recent_before(datestr):
+    age_days = (datetime.datetime.now() - datetime.datetime.strptime(datestr, "%Y-%m-%d")).days
+    return age_days <= 90
+
+def parse_report_before(n, lines):
+    factors = set()
+    ecm = {}    # (B1, B2) : count
+    pm1 = set() # (B1, B2, E)
+    pp1 = set() # (B1, B2, start1, start2)
+    is_recently_assigned = False
+    how_far_factored = [True] * 64 + [False] * (100-64) # how_far_factored[i] indicates if [2^(i-1); 2^(i)] was done
+    for l in lines:
+        if l.startswith(f"{n}\tFactored\t"):
+            #41681   Factored        1052945423;16647332713153;2853686272534246492102086015457
+            factors |= set([int(f) for f in l.split("\t")[2].split(";")])
+        elif l.startswith(f"{n}\tPRPCofactor\t"):
+            #41681   PRPCofactor     Verified (Factored);2017-11-09;kkmrkkblmbrbk;PRP_PRP_PRP_PRP_;3;37261;1;3
+            pass
+        elif l.startswith(f"{n}\tUnfactored\t"):
+            #100000007	Unfactored	2^79
+            result = l.split("\t")[2]
+            assert(result.startswith("2^"))
+            high = int(result[2:])
+            for i in range(high):
+                how_far_factored[i] = True
+        elif l.startswith(f"{n}\tLL\t"):
+            # 100000007	LL	Verified;2018-02-26;G0rfi3ld;F9042256B193FAA0;3178317
+            pass
+        elif l.startswith(f"{n}\tPRP\t"):
+            # 20825573	PRP	Verified;2020-10-12;gLauss;738AD2BB0D72E3AA;1276614;1;3
+            pass
+        elif l.startswith(f"{n}\tPM1\t"):
+            #100000007	PM1	B1=5000000,B2=150000000
+            result = l.split("\t")[2]
+            if   m:= re.match("^B1=([0-9]*),B2=([0-9]*),E=([0-9]*)$", result):
+                B1, B2, E = int(m.group(1)), int(m.group(2)), int(m.group(3))
+            elif m:= re.match("^B1=([0-9]*),B2=([0-9]*)$", result):
+                B1, B2 = int(m.group(1)), int(m.group(2))
+                E = 0
+            elif m:= re.match("^B1=([0-9]*)$", result):
+                B1 = int(m.group(1))
+                B2, E = B1, 0
+            else:
+                raise ValueError(f"could not parse PM1 result \"{result}\" in line \"{l}\"")
+            assert(B1 <= B2)
+            assert(E in [0,6,12,30,48])
+            pm1.add( (B1,B2,E))
+        elif l.startswith(f"{n}\tAssigned\t"):
+            h = l.split("\t")[2].split(";")
+            # 41081	Assigned	2017-10-09;Chang Chia-Tche;PRP test;;0.0;updated on 2017-10-09;expired on 2017-10-13
+            is_recently_assigned |= is_recent_before(h[0])
+        elif l.startswith(f"{n}\tHistory\t"):
+            h = l.split("\t")[2].split(";")
+            is_recently_assigned |= is_recent_before(h[0])
+            worktype, result = h[2], h[3]
+            if worktype == "F-ECM" or worktype == "F":
+                # 41681   History 2015-04-26;Serge Batalov;F-ECM;Factor: 2853686272534246492102086015457
+                # 41681   History 2008-08-26;-Anonymous-;F;Factor: 16647332713153
+                factors.add(int(result.split(" ")[1]))
+            elif worktype == "CERT" or worktype == "C-PRP" or worktype == "C-LL":
+                # we don't care for factorization purposes
+                pass
+            elif worktype == "NF":
+                # 100000007	History	2007-07-04;ComputerraRU;NF;no factor to 2^50
+                if   m:= re.match(r"^no factor from 2\^([0-9]*)[ ]*to 2\^([0-9]*)[ ]*$", result):
+                    low, high = int(m.group(1)), int(m.group(2))
+                    for i in range(low, high):
+                        how_far_factored[i] = True
+                elif m:= re.match(r"^no factor to 2\^([0-9]*)$", result):
+                    high = int(m.group(1))
+                    for i in range(high):
+                        how_far_factored[i] = True
+                else:
+                    raise ValueError(f"could not parse NF result \"{result}\" in line \"{l}\"")
+            elif worktype == "NF-ECM":
+                # 41681   History 2011-01-23;James Hintz;NF-ECM;3 curves, B1=250000, B2=25000000
+                if   m:=re.match("^([0-9]*) curve[s]?, B1=([0-9]*), B2=([0-9]*)$", result):
+                    c  = int(m.group(1))
+                    B1 = int(m.group(2))
+                    B2 = int(m.group(3))
+                elif m:=re.match("^([0-9]*) curve[s]?, B1=([0-9]*)", result):
+                    c  = int(m.group(1))
+                    B1 = int(m.group(2))
+                    B2 = B1
+                else:
+                    raise ValueError(f"could not parse NF-ECM result \"{result}\" in line \"{l}\"")
+                assert(B1 <= B2)
+                assert(c >= 0) # actually, there are entries where count == 0
+                if (B1,B2) not in ecm: ecm[(B1,B2)] = 0
+                ecm[(B1,B2)] += c
+            elif worktype == "NF-PM1":
+                # 3999971	History	2018-12-21;Jocelyn Larouche;NF-PM1;B1=3999971, B2=399997100, E=12
+                if   m:= re.match("^B1=([0-9]*), B2=([0-9]*), E=([0-9]*)$", result):
+                    B1, B2, E = int(m.group(1)), int(m.group(2)), int(m.group(3))
+                elif m:= re.match("^B1=([0-9]*), B2=([0-9]*)$", result):
+                    B1, B2 = int(m.group(1)), int(m.group(2))
+                    E = 0
+                elif m:= re.match("^B1=([0-9]*)$", result):
+                    B1 = int(m.group(1))
+                    B2, E = B1, 0
+                else:
+                    raise ValueError(f"could not parse NF-PM1 result \"{result}\" in line \"{l}\"")
+                assert(B1 <= B2)
+                assert(E in [0,6,12,30,48])
+                pm1.add( (B1,B2,E))
+            elif worktype == "F-PM1":
+                # 123031	History	2013-08-29;BloodIce;F-PM1;Factor: 3158950722867400921
+                # 2000177	History	2019-01-15;Jocelyn Larouche;F-PM1;Factor: 131059942116526306804441369 / (P-1, B1=1000000)
+                if   m:= re.match("^Factor: ([0-9]*)$", result):
+                    f = int(m.group(1))
+                    factors.add(f)
+                elif m:= re.match(r"^Factor: ([0-9]*) / \(P-1, B1=([0-9]*)\)$", result):
+                    f, B1 = int(m.group(1)), int(m.group(2))
+                    B2, E = B1, 0
+                    pm1.add( (B1,B2,E) )
+                    factors.add(f)
+                elif m:= re.match(r"^Factor: ([0-9]*) / \(P-1, B1=([0-9]*), B2=([0-9]*)\)$", result):
+                    f, B1, B2 = int(m.group(1)), int(m.group(2)), int(m.group(3))
+                    E = 0
+                    pm1.add( (B1,B2,E) )
+                    factors.add(f)
+                elif m:= re.match(r"^Factor: ([0-9]*) / \(P-1, B1=([0-9]*), B2=([0-9]*), E=([0-9]*)\)$", result):
+                    f, B1, B2, E = int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4))
+                    pm1.add( (B1,B2,E) )
+                    factors.add(f)
+                else:
+                    raise ValueError(f"Could not parse F-PM1 result \"{result}\" in line \"{l}\"")
+            elif worktype == "F-PP1":
+                if   m:= re.match("^Start=([0-9]*)/([0-9]*), B1=([0-9]*), B2=([0-9]*), Factor: ([0-9]*)$", result):
+                    start1, start2, B1, B2, f = int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4)), int(m.group(5))
+                    factors.add(f)
+                    assert(B1 <= B2)
+                    pp1.add( (B1, B2, start1, start2) )
+                else:
+                    raise ValueError(f"could not parse NF-PP1 result \"{result}\" in line \"{l}\"")
+            elif worktype == "NF-PP1":
+                # 41017	History	2021-04-27;gLauss;NF-PP1;Start=2/7, B1=10000000, B2=1000000000
+                if   m:= re.match("^Start=([0-9]*)/([0-9]*), B1=([0-9]*), B2=([0-9]*)$", result):
+                    start1, start2, B1, B2 = int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4))
+                elif m:= re.match("^Start=([0-9]*)/([0-9]*), B1=([0-9]*)$", result):
+                    start1, start2, B1 = int(m.group(1)), int(m.group(2)), int(m.group(3))
+                    B2 = B1
+                else:
+                    raise ValueError(f"could not parse NF-PP1 result \"{result}\" in line \"{l}\"")
+                assert(B1 <= B2)
+                pp1.add( (B1, B2, start1, start2) )
+            else:
+                raise ValueError(f"unknown worktype {worktype}")
+        else:
+            raise ValueError(f"could not parse line \"{l}\"")
+    return factors, ecm, pm1, pp1, is_recently_assigned, how_far_factored
+
+# parsing of the per-exponent reports, before (parse_report_before()) and after the dispatch table
+def bench_parse():
+    from planner import parse_report
+    corpus = load_fixture()
+    # the old parser does not know some of the unusual records, these exponents are left out of both
+    known = {}
+    for n, lines in corpus.items():
+        try:
+            parse_report_before(n, lines)
+            known[n] = lines
+        except ValueError:
+            pass
+    count = sum(len(lines) for lines in known.values())
+    before = timeit(lambda: [parse_report_before(n, lines) for n, lines in known.items()])
+    t = timeit(lambda: [parse_report(n, lines) for n, lines in known.items()])
+    print(f"{len(known)} exponents, {count} lines: before {before:.3f}s, {count/before:,.0f} lines/s, "
+          f"after {t:.3f}s, {count/t:,.0f} lines/s ({before/t:.1f}x)")
+    return {"exponents": len(known), "lines": count, "seconds_before": before, "lines_per_second_before": count/before,
+            "seconds": t, "lines_per_second": count/t}
+
+# planning of the worktodo lines from an ExponentStatus
+def bench_plan():
+    from planner import parse_report, make_status, plan
+    statuses = [make_status(n, parse_report(n, lines)) for n, lines in load_fixture().items()]
+    repeat = 50
+    t = timeit(lambda: [plan(status) for _ in range(repeat) for status in statuses])
+    print(f"{repeat*len(statuses)} calls of plan(): {t:.3f}s, {repeat*len(statuses)/t:,.0f} calls/s")
+    return {"calls": repeat*len(statuses), "seconds": t, "calls_per_second": repeat*len(statuses)/t}
+
+# ECM effort of exponents with thousands of ECM history lines
+def bench_ecm():
+    from planner import parse_report, make_status, get_ecm_level
+    rng = random.Random(0)
+    exponents = list(primes_between(200000, 201000))[:20]
+    reports = [parse_report(n, synthetic_report(n, rng, ecm_lines=5000)) for n in exponents]
+    t = timeit(lambda: [get_ecm_level(make_status(n, report, cofactor_limit=0).ecm) for n, report in zip(exponents, reports)])
+    print(f"{len(reports)} exponents with 5000 ECM lines each: {t:.3f}s, {len(reports)/t:,.0f} exponents/s")
+    return {"exponents": len(reports), "seconds": t, "exponents_per_second": len(reports)/t}
+
+# composite factors (n, factor) as the server reports them, i.e. products of known factors of 2^n-1
+COMPOSITE_FACTORS = [
+    (41681, 1052945423 * 16647332713153),
+    (41681, 16647332713153 * 2853686272534246492102086015457),
+    (41681, 1052945423 * 16647332713153 * 2853686272534246492102086015457),
+]
+
+# returns products of the two smallest factors 2*k*n+1 (k < kmax) of 2^n-1 for the first `count` exponents n >= start
+def composite_mersenne_factors(start, count, kmax=10**6):
+    from numbertheory import isprime
+    composites = []
+    for n in primes_between(start, 2*start):
+        factors = [2*k*n+1 for k in range(1, kmax) if pow(2, n, 2*k*n+1) == 1 and isprime(2*k*n+1)][:2]
+        if len(factors) == 2:
+            composites.append((n, factors[0] * factors[1]))
+            if len(composites) == count:
+                break
+    return composites
+
+# factoring of composite factors which are reported by the server (the ones of the fixture and COMPOSITE_FACTORS)
+def bench_factorize():
+    from numbertheory import factorize, isprime
+    from planner import parse_report
+    composites = list(COMPOSITE_FACTORS)
+    for n, lines in load_fixture().items():
+        composites += [(n, f) for f in sorted(parse_report(n, lines).factors) if not isprime(f)]
+    results = {}
+    for n, f in composites:
+        t = timeit(lambda: factorize(f, exponent=n), repeat=1)
+        print(f"M{n:<8} {len(str(f)):>3} digits: {t:8.3f}s {factorize(f, exponent=n)}")
+        results[f"M{n}:{f}"] = t
+    t = timeit(lambda: [factorize(f) for n, f in composites], repeat=1)
+    print(f"without exponent (no P-1 shortcut): {t:.3f}s")
+    return {"composites": results, "without_exponent_seconds": t}
+
+# smoothness of p-1 and p+1 for the unsmooth examples of construct_examples.py: factorization of every
+# number vs. the batch test with product and remainder trees
+def bench_smooth():
+    import construct_examples
+    from numbertheory import batch_smooth, isprime, factorize
+    results = {}
+    print(f"{'B1':>8} {'B2':>9} {'numbers':>8} {'smooth':>7} {'factorize [s]':>14} {'batch [s]':>10} {'speedup':>8}")
+    for B1, B2, count in [(10000, 100000, 5000), (100000, 1000000, 5000), (1000000, 10000000, 5000)]:
+        rng = random.Random(B1)
+        lower = 2 * (B1 // 4) * (B1 // 4) * (B1 + (B2-B1) // 4)
+        upper = 2 * (B1 * 3 // 2) * (B1 * 3 // 2) * (B1 + (B2-B1) *3 // 2)
+        primes = []
+        while len(primes) < count // 2:
+            p = rng.randrange(lower, upper)
+            if isprime(p):
+                primes.append(p)
+        numbers = [x for p in primes for x in (p-1, p+1)]
+        t = time.perf_counter()
+        expected = [construct_examples.is_smooth(factorize(x), 2*B1, 4*B2) for x in numbers]
+        t_factorize = time.perf_counter() - t
+        smooth = batch_smooth(numbers, 2*B1, 4*B2)
+        assert smooth == expected
+        t_batch = timeit(lambda: batch_smooth(numbers, 2*B1, 4*B2))
+        print(f"{B1:>8} {B2:>9} {len(numbers):>8} {sum(smooth):>7} "
+              f"{t_factorize:>14.3f} {t_batch:>10.3f} {t_factorize/t_batch:>7.0f}x")
+        results[f"{B1}-{B2}-{len(numbers)}"] = {"numbers": len(numbers), "smooth": sum(smooth),
+                                                 "factorize_seconds": t_factorize, "batch_seconds": t_batch}
+    return results
+
+# the big-integer arithmetic of numbertheory.py with gmpy2 and with the pure Python fallback
+def bench_backend():
+    import numbertheory
+    from numbertheory import isprime, next_prime, factorize, batch_smooth, powmod, ecm_curve
+    rng = random.Random(1)
+    odd = [rng.getrandbits(256) | 1 for _ in range(300)]
+    composites = [next_prime(rng.getrandbits(28)) * next_prime(rng.getrandbits(28)) for _ in range(5)]
+    smooth = [rng.getrandbits(64) for _ in range(2000)]
+    N = 2**10007 - 1 # the cofactor check of a 3000 digit number is a Fermat test like this
+    cases = {
+        "isprime":    lambda: [isprime(n) for n in odd],
+        "next_prime": lambda: [next_prime(n) for n in odd[:30]],
+        "fermat":     lambda: powmod(3, N-1, N),
+        "factorize":  lambda: [factorize(n) for n in composites],
+        "ecm":        lambda: [ecm_curve(16647332713153 * 2853686272534246492102086015457, 11000, 550000, random.Random(i)) for i in range(10)],
+        "smooth":     lambda: batch_smooth(smooth, 100000, 1000000),
+    }
+    backends = [False] + ([True] if numbertheory.gmpy2 else [])
+    if not numbertheory.gmpy2:
+        print("gmpy2 is not installed, only the pure Python backend is measured (pip install gmpy2)")
+    seconds = {}
+    results = {}
+    try:
+        for use_gmpy2 in backends:
+            numbertheory.USE_GMPY2 = use_gmpy2
+            for name, f in cases.items():
+                numbertheory.bpsw_memo.cache_clear()
+                results[name, use_gmpy2] = f()
+                numbertheory.bpsw_memo.cache_clear()
+                seconds[name, use_gmpy2] = timeit(f, repeat=1)
+    finally:
+        numbertheory.USE_GMPY2 = numbertheory.gmpy2 is not None
+    print(f"{'':>12} {'python [s]':>11} {'gmpy2 [s]':>10} {'speedup':>8}")
+    summary = {}
+    for name in cases:
+        t_python = seconds[name, False]
+        t_gmpy2 = seconds.get((name, True))
+        if t_gmpy2 is None:
+            print(f"{name:>12} {t_python:>11.3f}")
+        else:
+            assert results[name, True] == results[name, False]
+            print(f"{name:>12} {t_python:>11.3f} {t_gmpy2:>10.3f} {t_python/t_gmpy2:>7.1f}x")
+        summary[name] = {"python_seconds": t_python, "gmpy2_seconds": t_gmpy2}
+    return summary
+
+# the bound optimizer of the "optimal" policy (with numpy if it is installed)
+def bench_bounds():
+    import planner
+    from planner import optimal_bounds
+    exponents = list(primes_between(100000, 200000))[:1000]
+    optimal_bounds(exponents[0], 70) # precomputes the tables
+    t = timeit(lambda: [optimal_bounds(n, 70, 1000000, 30000000) for n in exponents], repeat=3)
+    backend = "numpy" if planner.numpy else "pure python"
+    print(f"{len(exponents)} calls of optimal_bounds() ({backend}): {t:.3f}s, {len(exponents)/t:,.0f} calls/s")
+    # plan_optimal() needs P-1 and P+1 bounds for every exponent
+    both = timeit(lambda: [(optimal_bounds(n, 70, 1000000, 30000000), optimal_bounds(n, 70, 500000, 500000, plus1=True))
+                           for n in exponents], repeat=3)
+    print(f"P-1 and P+1 bounds of {len(exponents)} exponents: {both:.3f}s, {len(exponents)/both:,.0f} exponents/s")
+    # the search of the numpy version has to find the same bounds as trying all candidates
+    if planner.numpy:
+        rng = random.Random(1)
+        cases = [(rng.choice(exponents) * rng.choice((1, 10, 100)) | 1, rng.randint(60, 80),
+                  rng.choice((0, 100000, 1000000, 10000000)), rng.choice((1, 30)), rng.random() < 0.3) for _ in range(20)]
+        found = [optimal_bounds(n, tf, B1, ratio * B1, plus1) for n, tf, B1, ratio, plus1 in cases]
+        numpy, planner.numpy = planner.numpy, None
+        try:
+            assert found == [optimal_bounds(n, tf, B1, ratio * B1, plus1) for n, tf, B1, ratio, plus1 in cases]
+        finally:
+            planner.numpy = numpy
+    return {"calls": len(exponents), "backend": backend, "seconds": t, "calls_per_second": len(exponents)/t,
+            "exponents_per_second": len(exponents)/both}
+
+# get_work.py as a whole for the range of the fixture, querying the local stand-in server
+def bench_e2e():
+    import get_work
+    from primenet_standin import StandInServer
+    corpus = load_fixture()
+    lo, hi = min(corpus), max(corpus) + 1
+    exponents = sum(1 for n in primes_between(lo, hi) if n >= get_work.MIN_EXPONENT)
+    server = StandInServer(corpus, LATENCY, ERROR_RATE).start()
+    argv = ["get_work.py", str(lo), str(hi), "0", "--server", server.url, "--rate", "1000",
+            "--batch-size", str(BATCH_SIZE), "--parallel", str(PARALLEL)]
+    output = io.StringIO()
+    t = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            get_work.main(argv)
+    except SystemExit:
+        pass # some exponents failed because of the error rate
+    t = time.perf_counter() - t
+    server.stop()
+    downloaded = get_work.STATS.counters["bytes_downloaded"]
+    print(f"{exponents} exponents, {server.requests} requests ({server.errors} failed), {downloaded:,} bytes, "
+          f"latency {LATENCY}s, batch size {BATCH_SIZE}, {PARALLEL} parallel: {t:.3f}s, {exponents/t:,.1f} exponents/s")
+    return {"exponents": exponents, "requests": server.requests, "failed_requests": server.errors,
+            "bytes_downloaded": downloaded,
+            "latency": LATENCY, "error_rate": ERROR_RATE, "batch_size": BATCH_SIZE, "parallel": PARALLEL,
+            "seconds": t, "exponents_per_second": exponents/t}
+
+BENCHMARKS = {
+    "sieve": bench_sieve,
+    "parse": bench_parse,
+    "plan":  bench_plan,
+    "ecm":   bench_ecm,
+    "factorize": bench_factorize,
+    "smooth": bench_smooth,
+    "backend": bench_backend,
+    "bounds": bench_bounds,
+    "e2e":   bench_e2e,
+}
+
+def main(argv):
+    global FIXTURE, LATENCY, ERROR_RATE, BATCH_SIZE, PARALLEL
+    parser = argparse.ArgumentParser(prog="benchmark.py",
+        description="benchmarks for get_work.py, runs all of them if no name is given")
+    parser.add_argument("names", nargs="*", metavar="name", help=f"one of: {' '.join(BENCHMARKS)}")
+    parser.add_argument("--json", metavar="FILE", help="save the results to FILE, e.g. to compare them with later runs")
+    parser.add_argument("--fixture", default=FIXTURE, metavar="FILE",
+        help="saved reports which are used by the benchmarks (default: fixtures/reports.txt.xz)")
+    parser.add_argument("--latency", type=float, default=LATENCY, metavar="SECONDS",
+        help="latency of the stand-in server in the e2e benchmark")
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE, metavar="P",
+        help="fraction of failing requests of the stand-in server in the e2e benchmark")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, metavar="N", help="--batch-size of get_work.py in the e2e benchmark")
+    parser.add_argument("--parallel", type=int, default=PARALLEL, metavar="N", help="--parallel of get_work.py in the e2e benchmark")
+    parser.add_argument("--record", nargs=2, type=int, metavar=("LO", "HI"),
+        help="write the reports of the PrimeNet server for the prime exponents LO <= n < HI to the fixture and exit")
+    parser.add_argument("--synthetic", action="store_true",
+        help="write synthetic reports (see synthetic_fixture()) to the fixture and exit")
+    args = parser.parse_args(argv[1:])
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name}, available are: {' '.join(BENCHMARKS)}")
+    FIXTURE, LATENCY, ERROR_RATE = args.fixture, args.latency, args.error_rate
+    BATCH_SIZE, PARALLEL = args.batch_size, args.parallel
+
+    if args.record or args.synthetic:
+        corpus = record_fixture(*args.record) if args.record else synthetic_fixture()
+        write_fixture(corpus, FIXTURE)
+        print(f"wrote {len(corpus)} exponents to {FIXTURE}")
+        return
+
+    results = {}
+    for name in args.names or list(BENCHMARKS):
+        print(f"### {name}")
+        results[name] = BENCHMARKS[name]()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"date": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+                       "platform": platform.platform(), "results": results}, f, indent=2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main(sys.argv)
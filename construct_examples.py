@@ -1,80 +1,63 @@
 #!/usr/bin/python
 
 import sys
+import os
+import argparse
 import random
-import math
-
-# actually, this should be called "is pseudoprime", but its safe enough
-def isprime(n):
-    sp = set([2,3,5,7,11,13,17,19])
-    if n < 20: return (n in sp)
-    for b in sp:
-        if pow(b,n-1,n) != 1:
-            return False
-    return True
+import sqlite3
+import collections
+import concurrent.futures
+from numbertheory import primes_between, batch_smooth, isprime, factorize
 
-# Jacobi-Symbol, implementation taken directly from wikipedia
-def jacobi(k,n):
-    k,n=n,k # wikipedia got it wrong
-    assert(k % 2 == 1)
-    n = n % k
-    t = 1
-    while n != 0:
-        while n % 2 == 0:
-            n //= 2
-            r = k % 8
-            if r == 3 or r == 5:
-                t = -t
-        n,k = k,n
-        if n % 4 == 3 and k % 4 == 3:
-            t = -t
-        n = n % k
-    if k == 1:
-        return t
-    return 0
-
-assert([jacobi(k,5) for k in range(1,5)] == [1,-1,-1,1])
-assert([jacobi(k,7) for k in range(1,7)] == [1,1,-1,1,-1,-1])
-assert([jacobi(k,9) for k in range(1,9)] == [1,1,0,1,1,0,1,1])
-assert([jacobi(k,11) for k in range(1,11)] == [1,-1,1,1,1,-1,-1,-1,1,-1])
-assert([jacobi(k,15) for k in range(1,15)] == [1,1,0,1,0,0,-1,1,0,0,-1,0,-1,-1])
-
-def factorize(n):
-    if n >= 10**60:
-        FATAL(f"Cannot factor {n}, it is too large.")
-        assert(False)
-    # stop recursion if prime is found
-    if isprime(n):
-        return [n]
-    # I don't want to implement a fancy algorithm either.
-    # So we just use some TF and then pollard rho...
-    for i in [2,3,5,7,11,13,17,19,23,29,31,37,39]:
-        if n % i == 0:
-            return [i] + factorize(n//i)
-    # pollard rho
-    while True:
-        x = random.randrange(3,n,2)
-        y = x
-        while True:
-            x = pow(x,2,n) + 1
-            y = pow(y,2,n) + 1
-            y = pow(y,2,n) + 1
-            p = math.gcd(x-y,n)
-            if p == n:
-                break # try with different start values
-            elif p != 1:
-                # we found a (potentially composite) factor!
-                return sorted(factorize(n//p) + factorize(p))
-
-
-def genprimes(start, end):
+# ranges smaller than this are sieved, larger ones are sampled with isprime()
+SIEVE_LIMIT = 10**7
+
+# returns `count` random primes start <= p < end (sorted), which only depend on the seed
+def genprimes(start, end, count=100, seed=None):
+    rng = random.Random(f"{seed}:primes:{start}:{end}:{count}")
+    if end - start <= SIEVE_LIMIT:
+        primes = list(primes_between(start, end))
+        return sorted(rng.sample(primes, min(count, len(primes))))
     primes = set()
-    while len(primes) < 100:
-        candidate = random.randrange(start, end)
+    while len(primes) < count:
+        candidate = rng.randrange(start, end)
         if isprime(candidate):
             primes.add(candidate)
     return sorted(list(primes))
 
+# SQLite file with the prime pools of genprimes(), so that the next run with the same bounds and seed
+# does not have to sieve or sample them again, see --cache
+class PoolCache:
+    def __init__(self, filename):
+        self.db = sqlite3.connect(filename)
+        self.db.execute("CREATE TABLE IF NOT EXISTS pools (start TEXT NOT NULL, end TEXT NOT NULL, "
+                        "count INTEGER NOT NULL, seed TEXT NOT NULL, primes TEXT NOT NULL, "
+                        "PRIMARY KEY (start, end, count, seed))")
+        self.db.commit()
+
+    # the numbers are stored as text, as they might not fit into 64 bits
+    def get(self, start, end, count, seed):
+        row = self.db.execute("SELECT primes FROM pools WHERE start = ? AND end = ? AND count = ? AND seed = ?",
+                              (str(start), str(end), count, str(seed))).fetchone()
+        return None if row is None else [int(p) for p in row[0].split()]
+
+    def put(self, start, end, count, seed, primes):
+        self.db.execute("INSERT OR REPLACE INTO pools VALUES (?, ?, ?, ?, ?)",
+                        (str(start), str(end), count, str(seed), " ".join(map(str, primes))))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+# genprimes(), but taken from the cache if possible
+def prime_pool(start, end, count, seed, cache=None):
+    primes = cache.get(start, end, count, seed) if cache else None
+    if primes is None:
+        primes = genprimes(start, end, count, seed)
+        if cache:
+            cache.put(start, end, count, seed, primes)
+    return primes
+
 def is_smooth(factors, B1, B2):
     factors = sorted(factors)
     if factors[-1] > B2:
@@ -83,66 +66,119 @@ def is_smooth(factors, B1, B2):
         return False
     return True
 
+# number of candidates which are tested by a single task of the process pool
+# the search for unsmooth primes uses larger chunks, so that the batch smoothness test gets enough numbers
+CHUNK_SIZE = 256
+UNSMOOTH_CHUNK_SIZE = 4096
 
+# every chunk of candidates has its own random stream, which only depends on the seed and the
+# number of the chunk, so the result is the same no matter which process tests it
+def chunk_rng(seed, name, index):
+    return random.Random(f"{seed}:{name}:{index}")
+
+# tests CHUNK_SIZE candidates 2*a*b*c+-1 with a, b from small and c from medium
+# returns a list of ("both"|"pminus"|"pplus", prime)
+def search_smooth(seed, index, small, medium, B1, B2):
+    rng = chunk_rng(seed, "smooth", index)
+    tests = [] # (bucket if the other side is not smooth, prime, other side)
+    for _ in range(CHUNK_SIZE):
+        a,b,c = rng.choice(small), rng.choice(small), rng.choice(medium)
+        candidate = 2*a*b*c
+        if isprime(candidate+1): # P-1 is smooth
+            tests.append(("pminus", candidate+1, candidate+2))
+        if isprime(candidate-1): # P+1 is smooth
+            tests.append(("pplus", candidate-1, candidate-2))
+    smooth = batch_smooth([x for _, _, x in tests], B1, B2)
+    return [("both" if s else bucket, p) for (bucket, p, _), s in zip(tests, smooth)]
+
+# tests UNSMOOTH_CHUNK_SIZE random candidates lower <= p < upper and returns the primes where
+# neither p-1 nor p+1 is (2*B1, 4*B2) smooth
+def search_unsmooth(seed, index, lower, upper, B1, B2):
+    rng = chunk_rng(seed, "unsmooth", index)
+    primes = [p for p in (rng.randrange(lower, upper) for _ in range(UNSMOOTH_CHUNK_SIZE)) if isprime(p)]
+    smooth = batch_smooth([x for p in primes for x in (p-1, p+1)], 2*B1, 4*B2)
+    return [p for i, p in enumerate(primes) if not smooth[2*i] and not smooth[2*i+1]]
+
+# runs task(seed, index, *args) for the chunks index = 0, 1, 2, ... (in the executor, if any) and
+# passes their results to done() in the order of the index, until done() returns True.
+# A few chunks more than processes are in flight, the remaining ones are cancelled at the end.
+# As the results are taken in order, they are the same for any number of processes.
+def search(executor, processes, task, args, seed, done):
+    if executor is None:
+        index = 0
+        while not done(task(seed, index, *args)):
+            index += 1
+        return
+    pending = collections.deque()
+    index = 0
+    try:
+        while True:
+            while len(pending) < 2 * processes:
+                pending.append(executor.submit(task, seed, index, *args))
+                index += 1
+            if done(pending.popleft().result()):
+                return
+    finally:
+        for future in pending:
+            future.cancel()
 
 def main(argv):
-    B1 = int(argv[1])
-    B2 = int(argv[2])
+    parser = argparse.ArgumentParser(prog="construct_examples.py",
+        description="constructs products of two primes p whose p-1 and p+1 are (not) smooth for the bounds B1 and B2")
+    parser.add_argument("B1", type=int)
+    parser.add_argument("B2", type=int)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, metavar="N",
+        help="search with N processes (default: number of CPUs)")
+    parser.add_argument("--seed", type=int, metavar="S",
+        help="seed of the random numbers, the same seed gives the same examples for any number of processes "
+             "(default: random, it is printed to stderr)")
+    parser.add_argument("--cache", metavar="FILE",
+        help="SQLite file in which the random primes for the bounds and the seed are kept, "
+             "so that the next run with the same arguments starts immediately")
+    args = parser.parse_args(argv[1:])
+    B1, B2 = args.B1, args.B2
     assert(B1 < B2 and B1 >= 1000 and B2>=2*B1)
+    if args.processes < 1:
+        parser.error("--processes must be at least 1")
+    seed = args.seed
+    if seed is None:
+        seed = random.randrange(2**32)
+        print(f"seed: {seed}", file=sys.stderr)
+    random.seed(seed)
 
     # generate primes in relevant ranges first
-    small  = genprimes(2,   B1) 
-    medium = genprimes(B1+1,B2)
-
-    # now we try to find primes p where p-1 is B1/B2 smooth   
-    both = set()
-    pminus = set()
-    pplus = set()
-    while len(pminus) < 100 or len(pplus) < 100 or len(both) < 100:
-        a,b,c = random.choice(small), random.choice(small), random.choice(medium)
-        candidate = 2*a*b*c 
-        if isprime(candidate+1): # P-1 is smooth
-            #print(f"found P-1 smooth prime 2*{a}*{b}*{c}+1 = {candidate+1}")
-            f = factorize(candidate+2)
-            if is_smooth(f,B1,B2):
-                #print(f"-> P+1 smooth! (factors are: {f})")
-                both.add(candidate+1)
-            else:
-                #print(f"-> NOT P+1 smooth! (factors are: {f})")
-                pminus.add(candidate+1)
-        if isprime(candidate-1):
-            #print(f"found P+1 smooth prime 2*{a}*{b}*{c}+1 = {candidate-1}")
-            f = factorize(candidate-2)
-            if is_smooth(f,B1,B2):
-                #print(f"-> P-1 smooth! (factors are: {f})")
-                both.add(candidate-1)
-            else:
-                #print(f"-> NOT P-1 smooth! (factors are: {f})")
-                pplus.add(candidate-1)
-
-    #print("-------------------------------------------------------------")
-    #print("Now trying to find non-smooth numbers")
-    none = set()
-    candidate_lower = 2 * (B1 // 4) * (B1 // 4) * (B1 + (B2-B1) // 4) 
-    candidate_upper = 2 * (B1 * 3 // 2) * (B1 * 3 // 2) * (B1 + (B2-B1) *3 // 2)
-    while len(none) < 100:
-        candidate = random.randrange(candidate_lower, candidate_upper)
-        # we start somewhere in the middle of the range
-        if isprime(candidate):
-            #print(f"current candidate {candidate}")
-            fminus = factorize(candidate-1)
-            if is_smooth(fminus, 2*B1, 4*B2):
-                #print(f"-> P-1 smooth! (factors are: {f})")
-                pass
-            else:
-                fplus = factorize(candidate + 1)
-                if is_smooth(fplus, 2*B1, 4*B2):
-                    #print(f"-> P+1 smooth! (factors are: {f})")
-                    pass
-                else:
-                    #print(f"-> both P+-1 unsmooth (factors P-1 / P+1 are: {fminus}, {fplus})")
-                    none.add(candidate)
-            #print(f"--------------------------------------------------")
+    cache = PoolCache(args.cache) if args.cache else None
+    try:
+        small  = prime_pool(2,    B1, 100, seed, cache)
+        medium = prime_pool(B1+1, B2, 100, seed, cache)
+    finally:
+        if cache:
+            cache.close()
+
+    executor = None
+    if args.processes > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(args.processes)
+    try:
+        # now we try to find primes p where p-1 is B1/B2 smooth
+        buckets = {"both": set(), "pminus": set(), "pplus": set()}
+        def smooth_done(found):
+            for bucket, p in found:
+                buckets[bucket].add(p)
+            return all(len(b) >= 100 for b in buckets.values())
+        search(executor, args.processes, search_smooth, (small, medium, B1, B2), seed, smooth_done)
+        both, pminus, pplus = buckets["both"], buckets["pminus"], buckets["pplus"]
+
+        # now trying to find non-smooth numbers, we start somewhere in the middle of the range
+        none = set()
+        candidate_lower = 2 * (B1 // 4) * (B1 // 4) * (B1 + (B2-B1) // 4) 
+        candidate_upper = 2 * (B1 * 3 // 2) * (B1 * 3 // 2) * (B1 + (B2-B1) *3 // 2)
+        def unsmooth_done(found):
+            none.update(found)
+            return len(none) >= 100
+        search(executor, args.processes, search_unsmooth, (candidate_lower, candidate_upper, B1, B2), seed, unsmooth_done)
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
 
     none   = sorted(list(none))
     pminus = sorted(list(pminus))
@@ -214,6 +250,8 @@ def main(argv):
         p2 = random.choice(both)
         print(f"(yes yes) (yes yes) {p1*p2} = {p1} * {p2}")
         print_B1B2_bounds(p1,p2)
-        
-main(sys.argv)
+
+# the processes of the pool import this file, they must not run main()
+if __name__ == "__main__":
+    main(sys.argv)
 
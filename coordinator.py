@@ -0,0 +1,335 @@
+#!/usr/bin/python3
+
+# splits a large range of exponents (e.g. 50k-100M) into shards, which several machines scan with
+# get_work.py without coordinating by hand and without querying the server twice for an exponent.
+# The shards are kept in a SQLite file which all workers can access, e.g. on a network share with
+# working file locks (or on a single machine with several workers). A worker claims a shard with a
+# lease, which is renewed while get_work.py runs. If a worker dies, its lease expires and the shard
+# is taken over by another worker. The worktodo lines and the statistics (see --stats of get_work.py)
+# of the finished shards are merged into one result, ordered by exponent.
+#
+# usage:
+#     python.exe coordinator.py init scan.sqlite 50000 100000000 --shard-size 100000
+#     python.exe coordinator.py work scan.sqlite -- --batch-size 100 --cache primenet.sqlite
+#     python.exe coordinator.py status scan.sqlite
+#     python.exe coordinator.py merge scan.sqlite --output worktodo.txt --stats stats.json
+
+import os
+import sys
+import argparse
+import collections
+import json
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+import get_work
+
+# seconds after which the shard of a worker which did not renew its lease is given to another worker
+LEASE_SECONDS = 600.
+
+# a shard which could not be scanned this many times (e.g. because the server was not reachable)
+# is not claimed again, see "status"
+MAX_ATTEMPTS = 5
+
+# options of get_work.py (the names in its parser) which are set by the coordinator, whose output cannot be merged,
+# or with which exponents could be missing from a finished shard: --offline skips the exponents which are not
+# cached, and with --delta a shard which is scanned again skips the exponents of the failed attempt.
+# --log would be overwritten by every shard, the coordinator has its own --log with one file per shard.
+RESERVED_OPTIONS = ("output", "stats", "format", "input", "rank", "budget", "workers", "worker_files", "journal",
+                    "resume", "prometheus", "profile", "delta", "offline", "allow_partial", "log")
+
+# returns the reserved options which are set in the options for get_work.py. They are parsed with the parser
+# of get_work.py, so abbreviations like --form are found as well.
+def reserved_options(get_work_args):
+    parser = get_work.make_parser()
+    args = parser.parse_args(["0", "1", "0", *get_work_args])
+    return ["--" + name.replace("_", "-") for name in RESERVED_OPTIONS if getattr(args, name) != parser.get_default(name)]
+
+# the shards in a SQLite file. Every shard lo <= n < hi is either "todo", "leased" by an owner until
+# `expires` (which is renewed while the owner works on it) or "done" with its worktodo lines and statistics.
+# A lease which expired counts as "todo" again. All changes of a lease check the owner, so a worker whose
+# lease has been taken over cannot overwrite the result of the new owner.
+class Shards:
+    def __init__(self, filename):
+        # autocommit, the claims use explicit transactions
+        self.db = sqlite3.connect(filename, timeout=60, isolation_level=None)
+        self.db.execute("CREATE TABLE IF NOT EXISTS shards ("
+                        "lo INTEGER PRIMARY KEY, hi INTEGER NOT NULL, state TEXT NOT NULL DEFAULT 'todo', "
+                        "owner TEXT, expires REAL, attempts INTEGER NOT NULL DEFAULT 0, "
+                        "finished REAL, output TEXT, stats TEXT)")
+
+    # splits start <= n < stop into shards of `size` exponents
+    def create(self, start, stop, size):
+        if self.db.execute("SELECT COUNT(*) FROM shards").fetchone()[0]:
+            raise ValueError("the shards have already been created")
+        self.db.execute("BEGIN")
+        self.db.executemany("INSERT INTO shards (lo, hi) VALUES (?, ?)",
+                            [(lo, min(lo + size, stop)) for lo in range(start, stop, size)])
+        self.db.execute("COMMIT")
+
+    # returns (lo, hi) of the first free shard, which is leased to owner for `lease` seconds, or None
+    def claim(self, owner, lease=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        now = time.time()
+        # the write lock is taken immediately, so two workers cannot claim the same shard
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute("SELECT lo, hi FROM shards WHERE (state = 'todo' OR (state = 'leased' AND expires < ?)) "
+                                  "AND attempts < ? ORDER BY lo LIMIT 1", (now, max_attempts)).fetchone()
+            if row:
+                self.db.execute("UPDATE shards SET state = 'leased', owner = ?, expires = ?, attempts = attempts + 1 "
+                                "WHERE lo = ?", (owner, now + lease, row[0]))
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return row
+
+    # extends the lease, returns False if it has been taken over by another worker
+    def renew(self, lo, owner, lease=LEASE_SECONDS):
+        cursor = self.db.execute("UPDATE shards SET expires = ? WHERE lo = ? AND owner = ? AND state = 'leased'",
+                                 (time.time() + lease, lo, owner))
+        return cursor.rowcount == 1
+
+    # stores the result of a shard, returns False if the lease has been taken over by another worker
+    def finish(self, lo, owner, lines, stats):
+        cursor = self.db.execute("UPDATE shards SET state = 'done', expires = NULL, finished = ?, output = ?, stats = ? "
+                                 "WHERE lo = ? AND owner = ? AND state = 'leased'",
+                                 (time.time(), "\n".join(lines), json.dumps(stats), lo, owner))
+        return cursor.rowcount == 1
+
+    # gives the shard back after a failed attempt
+    def release(self, lo, owner):
+        self.db.execute("UPDATE shards SET state = 'todo', owner = NULL, expires = NULL "
+                        "WHERE lo = ? AND owner = ? AND state = 'leased'", (lo, owner))
+
+    # returns a dict with the number of shards per state, where "expired" leases and
+    # "failed" shards (which reached max_attempts) are counted separately
+    def counts(self, max_attempts=MAX_ATTEMPTS):
+        counts = collections.Counter({"todo": 0, "leased": 0, "expired": 0, "failed": 0, "done": 0})
+        now = time.time()
+        for state, expires, attempts in self.db.execute("SELECT state, expires, attempts FROM shards"):
+            if state != "done" and attempts >= max_attempts and (state == "todo" or expires < now):
+                state = "failed"
+            elif state == "leased" and expires < now:
+                state = "expired"
+            counts[state] += 1
+        return counts
+
+    # returns (owner, lo, hi, seconds until the lease expires) of all leased shards
+    def leases(self):
+        now = time.time()
+        return [(owner, lo, hi, expires - now) for owner, lo, hi, expires in
+                self.db.execute("SELECT owner, lo, hi, expires FROM shards WHERE state = 'leased' ORDER BY lo")]
+
+    # generator which yields (lo, hi, worktodo lines, statistics) of the finished shards in the order of the exponents
+    def results(self):
+        for lo, hi, output, stats in self.db.execute("SELECT lo, hi, output, stats FROM shards "
+                                                     "WHERE state = 'done' ORDER BY lo"):
+            yield lo, hi, output.split("\n") if output else [], json.loads(stats)
+
+    def close(self):
+        self.db.close()
+
+# renews the lease of a shard every lease/3 seconds in its own thread (and SQLite connection) until stop() is called
+class Heartbeat:
+    def __init__(self, filename, lo, owner, lease):
+        self.stopped = threading.Event()
+        self.lost = False # True if the lease has been taken over by another worker
+        self.thread = threading.Thread(target=self.run, args=(filename, lo, owner, lease), daemon=True)
+        self.thread.start()
+
+    def run(self, filename, lo, owner, lease):
+        shards = Shards(filename)
+        try:
+            while not self.stopped.wait(lease / 3):
+                if not shards.renew(lo, owner, lease):
+                    self.lost = True
+                    return
+        finally:
+            shards.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+# scans lo <= n < hi with get_work.py (in this process) and returns (worktodo lines, statistics),
+# or None if the shard has to be scanned again. With log (e.g. "shard{}.log"), the debug output goes to
+# the file with {} replaced by lo, a shard which is scanned again overwrites the log of the failed attempt.
+def scan_shard(lo, hi, get_work_args, directory, log=None):
+    output = os.path.join(directory, "worktodo.txt")
+    stats = os.path.join(directory, "stats.json")
+    for filename in (output, stats):
+        if os.path.exists(filename):
+            os.remove(filename)
+    # the debug output is only enabled if it goes to a log file
+    print_debug = "1" if log else "0"
+    argv = ["get_work.py", str(lo), str(hi), print_debug, *get_work_args, "--output", output, "--stats", stats]
+    if log:
+        argv += ["--log", log.format(lo)]
+    try:
+        get_work.main(argv)
+    except SystemExit as e:
+        # some exponents could not be processed or their reports could not be fetched
+        if e.code:
+            get_work.ERROR(f"scanning {lo}..{hi} failed")
+            return None
+    except Exception as e:
+        get_work.ERROR(f"scanning {lo}..{hi} failed: {e!r}")
+        return None
+    if not os.path.exists(output) or not os.path.exists(stats):
+        return None
+    with open(stats, encoding="utf-8") as f:
+        summary = json.load(f)
+    with open(output, encoding="utf-8") as f:
+        lines = [l.rstrip("\n") for l in f]
+    return lines, summary
+
+# claims and scans shards until none is left. With wait, the worker also waits for the leases
+# of other workers, in order to take over their shards if they expire.
+def work(filename, get_work_args, lease=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS, wait=False, log=None):
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    shards = Shards(filename)
+    directory = tempfile.mkdtemp(prefix="coordinator")
+    scanned = 0
+    try:
+        while True:
+            shard = shards.claim(owner, lease, max_attempts)
+            if shard is None:
+                counts = shards.counts(max_attempts)
+                if wait and counts["leased"] + counts["expired"]:
+                    time.sleep(min(lease / 3, 60))
+                    continue
+                break
+            lo, hi = shard
+            print(f"{owner}: scanning {lo}..{hi}", file=sys.stderr)
+            heartbeat = Heartbeat(filename, lo, owner, lease)
+            try:
+                result = scan_shard(lo, hi, get_work_args, directory, log)
+            finally:
+                heartbeat.stop()
+            if result is None:
+                shards.release(lo, owner)
+            elif heartbeat.lost or not shards.finish(lo, owner, *result):
+                get_work.ERROR(f"the lease of {lo}..{hi} has been taken over by another worker, dropping the result")
+            else:
+                scanned += 1
+    finally:
+        shards.close()
+        shutil.rmtree(directory, ignore_errors=True)
+    print(f"{owner}: scanned {scanned} shards", file=sys.stderr)
+
+# adds up the statistics of get_work.py (see get_work.Stats.summary()) of several shards
+def merge_stats(summaries):
+    merged = {"shards": 0, "wall_seconds": 0., "counters": collections.Counter(), "phases": {}}
+    for summary in summaries:
+        merged["shards"] += 1
+        merged["wall_seconds"] += summary["wall_seconds"]
+        merged["counters"].update(summary["counters"])
+        for phase, h in summary["phases"].items():
+            m = merged["phases"].setdefault(phase, {"count": 0, "seconds": 0., "max_seconds": 0.,
+                                                   "buckets": dict.fromkeys(h["buckets"], 0)})
+            m["count"] += h["count"]
+            m["seconds"] += h["seconds"]
+            m["max_seconds"] = max(m["max_seconds"], h["max_seconds"])
+            for bucket, count in h["buckets"].items():
+                m["buckets"][bucket] += count
+    merged["wall_seconds"] = round(merged["wall_seconds"], 3)
+    merged["counters"] = dict(sorted(merged["counters"].items()))
+    for m in merged["phases"].values():
+        m["seconds"] = round(m["seconds"], 6)
+    merged["phases"] = dict(sorted(merged["phases"].items()))
+    return merged
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="coordinator.py",
+        description="scans a large range with get_work.py on several machines, see the comment at the top")
+    commands = parser.add_subparsers(dest="command", required=True)
+    p = commands.add_parser("init", help="split start <= n < stop into shards")
+    p.add_argument("shards", help="SQLite file with the shards, which all workers can access")
+    p.add_argument("start", type=int)
+    p.add_argument("stop", type=int)
+    p.add_argument("--shard-size", type=int, default=100000, metavar="N",
+        help="exponents per shard (default: 100000)")
+    p = commands.add_parser("work", help="claim and scan shards until all of them are done. "
+        "Options for get_work.py follow after --, e.g. -- --batch-size 100 --cache primenet.sqlite")
+    p.add_argument("shards")
+    p.add_argument("--lease", type=float, default=LEASE_SECONDS, metavar="SECONDS",
+        help=f"the shard of a worker which does not renew its lease for this time is given to another worker "
+             f"(default: {LEASE_SECONDS:.0f})")
+    p.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS, metavar="N",
+        help=f"give up a shard which could not be scanned N times (default: {MAX_ATTEMPTS})")
+    p.add_argument("--wait", action="store_true",
+        help="do not stop while other workers hold leases, take over their shards if the leases expire")
+    p.add_argument("--log", metavar="PATTERN",
+        help="write the debug output of get_work.py for every shard to the file PATTERN with {} replaced by "
+             "the first exponent of the shard, e.g. shard{}.log")
+    p = commands.add_parser("status", help="print the state of the shards")
+    p.add_argument("shards")
+    p.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS, metavar="N")
+    p = commands.add_parser("merge", help="write the worktodo lines and statistics of all finished shards")
+    p.add_argument("shards")
+    p.add_argument("--output", metavar="FILE", help="write the worktodo lines to FILE instead of stdout")
+    p.add_argument("--stats", metavar="FILE", help="write the added up statistics as JSON to FILE, - for stderr")
+    p.add_argument("--partial", action="store_true", help="merge even if not all shards are done")
+    # everything after -- is passed to get_work.py
+    get_work_args = []
+    if "--" in argv:
+        get_work_args = argv[argv.index("--")+1:]
+        argv = argv[:argv.index("--")]
+    args = parser.parse_args(argv[1:])
+    if get_work_args and args.command != "work":
+        parser.error("options for get_work.py can only be given to work")
+
+    if not os.path.exists(args.shards) and args.command != "init":
+        parser.error(f"{args.shards} does not exist, create it with init")
+    shards = Shards(args.shards)
+    try:
+        if args.command == "init":
+            if args.shard_size < 1 or args.start >= args.stop:
+                parser.error("start must be below stop and --shard-size must be at least 1")
+            try:
+                shards.create(args.start, args.stop, args.shard_size)
+            except ValueError as e:
+                get_work.FATAL(e)
+            print(f"{shards.counts()['todo']} shards", file=sys.stderr)
+        elif args.command == "work":
+            reserved = reserved_options(get_work_args)
+            if reserved:
+                parser.error(f"{', '.join(reserved)} cannot be passed to get_work.py by the coordinator")
+            if args.log and "{}" not in args.log:
+                parser.error("--log must contain {}")
+            work(args.shards, get_work_args, args.lease, args.max_attempts, args.wait, args.log)
+        elif args.command == "status":
+            counts = shards.counts(args.max_attempts)
+            print(f"{counts['done']} done, {counts['leased']} leased, {counts['expired']} expired leases, "
+                  f"{counts['todo']} to do and {counts['failed']} failed of {sum(counts.values())} shards")
+            for owner, lo, hi, remaining in shards.leases():
+                state = f"expires in {remaining:.0f}s" if remaining >= 0 else "expired"
+                print(f"{lo}..{hi}: {owner}, {state}")
+        elif args.command == "merge":
+            counts = shards.counts()
+            missing = sum(counts.values()) - counts["done"]
+            if missing and not args.partial:
+                get_work.FATAL(f"{missing} shards are not done yet, use --partial to merge the others")
+            writer = get_work.WorktodoWriter(args.output)
+            summaries = []
+            for lo, hi, lines, stats in shards.results():
+                writer.work(lines)
+                summaries.append(stats)
+            writer.close()
+            if args.stats:
+                text = json.dumps(merge_stats(summaries), indent=2)
+                if args.stats == "-":
+                    print(text, file=sys.stderr)
+                else:
+                    with open(args.stats, "w", encoding="utf-8") as f:
+                        f.write(text + "\n")
+    finally:
+        shards.close()
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -1,517 +1,1031 @@
 #!/usr/bin/python3
 
 import sys
-import re
+import argparse
 import time
 import urllib3
-import datetime
-import math
-http = urllib3.PoolManager(headers={"User-Agent":"keisentraut/prime95-optimal-worktodo"})
+import sqlite3
+import gzip
+import lzma
+import threading
+import collections
+import concurrent.futures
+import json
+import csv
+import io
+import os
+import random
+import email.utils
+import bisect
+import contextlib
+import cProfile
+import pstats
+from numbertheory import primes_between, factorize
+from planner import parse_report, make_status, plan, fingerprint, is_recent, LocalWork, ParseError
+from planner import estimate, rank_work, split_work, describe, BOUNDS_POLICIES
+# the reports are transferred compressed. urllib3 does not retry, see fetch_batch().
+http = urllib3.PoolManager(
+    headers=urllib3.make_headers(user_agent="keisentraut/prime95-optimal-worktodo", accept_encoding="gzip,deflate"),
+    retries=urllib3.Retry(total=None, connect=0, read=0, status=0, other=0, redirect=5,
+                          raise_on_status=False, respect_retry_after_header=False))
 
-# print error message and exit hard
+# print error message to stderr and exit hard, stdout may be the worktodo, csv or jsonl output
 def FATAL(msg):
-    print(f"FATAL: {msg}")
+    print(f"FATAL: {msg}", file=sys.stderr)
     sys.exit(1)
 
+# print error message to stderr, but continue
+def ERROR(msg):
+    print(f"ERROR: {msg}", file=sys.stderr)
+
 PRINT_DEBUG=1
+# the diagnostics go to stdout together with the worktodo lines unless this is set, see --log
+LOG = None
 def DEBUG(msg):
     if PRINT_DEBUG:
-        print(f"# {msg}")
-
-# prints usage
-def usage():
-    DEBUG("This is a script which queries the PrimeNet server in order ")
-    DEBUG("to get the status of exponents. Please don't run this with ")
-    DEBUG("large ranges, it might create high load on the server.")
-    DEBUG("")
-    DEBUG("see https://mersenneforum.org/showthread.php?t=26750")
-    DEBUG("")
-    DEBUG("usage:")
-    DEBUG("    python.exe get_work.py <from> <to> <print_debug>")
-    DEBUG("example:")
-    DEBUG("    python.exe get_work.py 123000 124000 True")
-    DEBUG("        generates P-1/P+1 worktodo.txt file for Mersenne numbers with exponents between")
-    DEBUG("        123000 and 124000.If all Mersenne numbers in this range have appropriate P-1/P+1,")
-    DEBUG("        then no output is generated. The last argument \"True\" enables debug output.")
-    DEBUG("        Set the debug output to False, if you want to pass the output directly to Prime95.")
-
-
-# Bounds defined by gut feeling.
-# see also posting by ATH at https://mersenneforum.org/showthread.php?t=26750 where he suggests:
-#
-#	      No known factors	     With known factors
-#Exponent       P-1 B1  P+1 B1          P-1 B1  P+1 B1
-#50K-250K 	100M	50M		30M 	15M
-#250K-500K	 30M	15M		15M	 8M
-#500K-1M		 15M	 8M		10M	 5M
-#
-def PM1_B1_should(n, known_factors=False):
-    if known_factors == False:
-        if n<  100000: return 250000000
-        if n<  250000: return 100000000
-        if n<  500000: return  30000000
-        if n< 1000000: return  15000000
-        if n< 4000000: return   5000000
-        if n<10000000: return   2500000
-        return                  2000000
-    else:
-        if n<  100000: return 100000000
-        if n<  250000: return  30000000
-        if n<  500000: return  15000000
-        if n< 1000000: return  10000000
-        if n< 4000000: return   5000000
-        if n<10000000: return   2500000
-        return                  2000000
-
-def PP1_B1_should(n, known_factors=False):
-    # half of P-1 bound
-    return PM1_B1_should(n, known_factors) // 2
-
-# actually, this should be called "is pseudoprime", but its safe enough
-def isprime(n):
-    sp = set([2,3,5,7,11,13,17,19])
-    if n < 20: return (n in sp)
-    for b in sp:
-        if pow(b,n-1,n) != 1:
-            return False
-    return True
-
-# takes a string like "2020-02-12" as input, returns True if it was less than 3 months ago.
-def is_recent(datestr):
-    age_days = (datetime.datetime.now() - datetime.datetime.strptime(datestr, "%Y-%m-%d")).days
-    return age_days <= 90
-
-ECMBOUNDS = [  (11000,100,20), \
-                (50000,280,25), \
-                (250000,640,30), \
-                (1000000,1580,35), \
-                (3000000,4700,40), \
-                (11000000,9700,45), \
-                (44000000,17100,50), \
-                (110000000,46500,55), \
-                (260000000,112000,60), \
-                (800000000,360000,65)]
-def get_ecm_level(ecm):
-    level = 0 # number of digits
-    for minB1, desired, digits in ECMBOUNDS:
-        count = 0
-        for (B1, B2) in ecm:
-            if B1 >= minB1:
-                count += ecm[(B1,B2)]
-        count = count / desired
-        if count >= 2.:
-            # twice as many curves as required
-            # chance to miss factor is exp(-2) = 0.1353352832366127
-            # therefore, increase digits by 1
-            level = max(level, digits+1)
-        elif count >= 1.:
-            # exactly as many curves as required
-            # chance to miss factor is exp(-1) = 0.36787944117144233
-            level = max(level, digits)
-        elif count >= 0.5:
-            # half of curves required
-            # chance to miss factor is exp(-0.5) = 0.6065306597126334
-            # therefore, reduce digits by 3
-            level = max(level, digits-3)
-    return level
-
-# returns t30 B1 bound where you should continue when having t25 completed
-def ecm_level_to_B1(level):
-    B1 = 1000000000000 # larger than any reasonable B1 bound
-    for minB1, desired, digits in ECMBOUNDS:
-        if level < digits:
-            B1 = min(B1, minB1)
-    return B1
-
-# sometimes, composite factors are reported by the server
-# we need to factor them, but we obviously can only do this for "sane" sized numbers
-# TODO: implement something better than pollard rho
-def factorize(n):
-    if n >= 10**60:
-        FATAL(f"Cannot factor {n}, it is too large.")
-        assert(False)
-    # stop recursion if prime is found
-    if isprime(n):
-        return [n]
-    # I don't want to implement a fancy algorithm either.
-    # So we just use some TF and then pollard rho...
-    for i in [2,3,5,7,11,13,17,19,23,29,31,37,39]:
-        if n % i == 0:
-            return [i] + factorize(n//i)
-    # pollard rho
-    x,y = 2,2
-    while True:
-        x = pow(x,2,n) + 1
-        y = pow(y,2,n) + 1
-        y = pow(y,2,n) + 1
-        if math.gcd(x-y,n) != 1:
-            f = math.gcd(x-y,n)
-            return sorted(factorize(n//f) + factorize(f))
-
-def worktodo_PM1(n,B1,B2=None, how_far_factored=67, factors=[]):
-    assert(B1 >= 11000)
-    if factors:
-        factors = ",\"" + ",".join([str(f) for f in factors]) + "\""
-    else:
-        factors = ""
-    if B2:
-        assert(B1 <= B2 and B2 <= 100000 * B1)
-    else:
-        B2 = 0
-    return f"Pminus1=N/A,1,2,{n},-1,{B1},{B2},{how_far_factored}" + factors
+        print(f"# {msg}", file=LOG or sys.stdout)
 
-def worktodo_PP1(n,B1,B2=None,nth_run=1, how_far_factored=67, factors=[]):
-    assert(B1 >= 11000)
-    if factors:
-        factors = ",\"" + ",".join([str(f) for f in factors]) + "\""
-    else:
-        factors = ""
-    if B2:
-        assert(B1 <= B2 and B2 <= 100000 * B1)
+USAGE = """\
+This is a script which queries the PrimeNet server in order
+to get the status of exponents. Please don't run this with
+large ranges, it might create high load on the server.
+
+see https://mersenneforum.org/showthread.php?t=26750
+
+example:
+    python.exe get_work.py 123000 124000 1
+        generates P-1/P+1 worktodo.txt file for Mersenne numbers with exponents between
+        123000 and 124000.If all Mersenne numbers in this range have appropriate P-1/P+1,
+        then no output is generated. The last argument "1" enables debug output.
+        Set the debug output to "0", if you want to pass the output directly to Prime95.
+    python.exe get_work.py 123000 124000 1 --batch-size 100
+        same as above, but queries the server for 100 exponents at once.
+    python.exe get_work.py 123000 124000 1 --cache primenet.sqlite
+        caches the reports of the server, a second run within 24 hours does not query the server again.
+    python.exe get_work.py 123000 124000 1 --cache primenet.sqlite --offline
+        only uses cached reports and never queries the server.
+    python.exe get_work.py --input report_100k_1M.txt.xz --quiet
+        reads the reports from a saved (and possibly compressed) export instead of querying the server.
+        --quiet disables the debug output, because the "0" cannot be given without start and stop.
+    python.exe get_work.py 123000 124000 1 --journal scan.journal --resume
+        records the progress in scan.journal. If the run is interrupted, the same command continues it.
+    python.exe get_work.py 123000 124000 0 --delta state.sqlite
+        only prints the worktodo lines which are new since the previous run with state.sqlite.
+    python.exe get_work.py 123000 124000 1 --worktodo worktodo.txt --results results.json.txt
+        does not generate P-1/P+1 work which is already queued or done, but not yet reported.
+    python.exe get_work.py 123000 124000 0 --budget 50
+        prints the P-1/P+1 lines with the most expected factors per GHz-day which take 50 GHz-days together.
+    python.exe get_work.py 123000 124000 0 --workers 4 --worker-files worktodo{}.txt
+        distributes the lines to four files worktodo1.txt, ..., worktodo4.txt which take about the same time.
+    python.exe get_work.py 123000 124000 1 --output worktodo.txt --log get_work.log
+        replaces worktodo.txt at the end of the run and writes the debug output to get_work.log.
+    python.exe get_work.py 123000 124000 0 --format jsonl > plan.jsonl
+        writes the decision for every exponent (bounds, TF and ECM level, reason for skipping it) as JSON.
+"""
+
+
+# the PrimeNet server, see --server (e.g. primenet_standin.py for benchmarks)
+SERVER = "https://www.mersenne.org"
+
+# PrimeNet's text report, either for a single exponent (exp_hi empty) or for a whole range
+REPORT_URL = "{server}/report_exponent/?exp_lo={lo}&exp_hi={hi}&text=1&full=1&ecmhist=1"
+
+# counters which are always reported, even if they are 0
+STATS_COUNTERS = ("exponents_scanned", "skipped_small", "skipped_recent", "skipped_fully_factored", "skipped_unchanged",
+                  "errors", "fetch_failed", "lines_emitted", "requests", "retries", "bytes_downloaded", "cache_hits", "factorize_calls")
+
+# upper bounds (in seconds) of the buckets of the wall time histograms, see Stats
+STATS_BUCKETS = (0.0001, 0.001, 0.01, 0.1, 1., 10., 60.)
+
+# counters and wall time histograms per phase of a run, see --stats and --prometheus
+# the phases of the requests are measured in the fetch threads, so everything is protected by a lock
+class Stats:
+    def __init__(self):
+        self.counters = collections.Counter(dict.fromkeys(STATS_COUNTERS, 0))
+        self.phases = {} # phase -> [count, total seconds, max seconds, [count per bucket, the last one is +Inf]]
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, phase, seconds):
+        with self.lock:
+            h = self.phases.get(phase)
+            if h is None:
+                h = self.phases[phase] = [0, 0., 0., [0] * (len(STATS_BUCKETS) + 1)]
+            h[0] += 1
+            h[1] += seconds
+            h[2] = max(h[2], seconds)
+            h[3][bisect.bisect_left(STATS_BUCKETS, seconds)] += 1
+
+    # with STATS.timer("parse"): ...
+    @contextlib.contextmanager
+    def timer(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - start)
+
+    # generator which yields the items of `iterable` and measures the time spent waiting for each of them
+    def timed(self, phase, iterable):
+        it = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                self.observe(phase, time.perf_counter() - start)
+            yield item
+
+    # dict for --stats, the buckets are not cumulative
+    def summary(self):
+        with self.lock:
+            phases = {}
+            for phase, (count, total, longest, buckets) in sorted(self.phases.items()):
+                bounds = [f"{b:g}" for b in STATS_BUCKETS] + ["+Inf"]
+                phases[phase] = {"count": count, "seconds": round(total, 6), "max_seconds": round(longest, 6),
+                                 "buckets": dict(zip(bounds, buckets))}
+            return {"wall_seconds": round(time.monotonic() - self.started, 3),
+                    "counters": dict(sorted(self.counters.items())), "phases": phases}
+
+    # text format of Prometheus (e.g. for the textfile collector of node_exporter)
+    def prometheus(self):
+        out = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                out.append(f"# TYPE get_work_{name}_total counter")
+                out.append(f"get_work_{name}_total {value}")
+            out.append("# TYPE get_work_phase_seconds histogram")
+            for phase, (count, total, longest, buckets) in sorted(self.phases.items()):
+                cumulative = 0
+                for b, c in zip(STATS_BUCKETS, buckets):
+                    cumulative += c
+                    out.append(f'get_work_phase_seconds_bucket{{phase="{phase}",le="{b:g}"}} {cumulative}')
+                out.append(f'get_work_phase_seconds_bucket{{phase="{phase}",le="+Inf"}} {count}')
+                out.append(f'get_work_phase_seconds_sum{{phase="{phase}"}} {total:.6f}')
+                out.append(f'get_work_phase_seconds_count{{phase="{phase}"}} {count}')
+            out.append("# TYPE get_work_wall_seconds gauge")
+            out.append(f"get_work_wall_seconds {time.monotonic() - self.started:.3f}")
+        return "\n".join(out) + "\n"
+
+# the statistics of the current run
+STATS = Stats()
+
+# writes the statistics as JSON to filename ("-" is stderr)
+def write_stats(filename):
+    text = json.dumps(STATS.summary(), indent=2)
+    if filename == "-":
+        print(text, file=sys.stderr)
     else:
-        B2 = 0
-    return f"Pplus1=N/A,1,2,{n},-1,{B1},{B2},{nth_run},{how_far_factored}" + factors
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
 
-#############################################################################################3
+# writes the statistics in the Prometheus text format to filename
+# the file is replaced atomically, so the collector never reads a partial file
+def write_prometheus(filename):
+    tmp = filename + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(STATS.prometheus())
+    os.replace(tmp, filename)
 
-if len(sys.argv) < 3 or len(sys.argv) > 4:
-    usage()
-    sys.exit(1)
-else:
-    start = int(sys.argv[1])
-    stop  = int(sys.argv[2])
-    if len(sys.argv) == 4:
-        PRINT_DEBUG = int(sys.argv[3])
+# token bucket which limits the number of requests per second over all threads,
+# in order to not stress the server
+class RateLimiter:
+    def __init__(self, rate=1., burst=1):
+        self.rate = rate   # requests per second
+        self.burst = burst # maximum number of requests which may be sent at once
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
 
-sleep_time = 1.
+    # blocks until the next request may be sent
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            # the token is reserved immediately, so a negative value means
+            # that other threads are already waiting for the next tokens
+            self.tokens -= 1
+            wait = -self.tokens / self.rate
+        if wait > 0:
+            STATS.observe("sleep", wait)
+            time.sleep(wait)
 
-for n in range(start,stop):
-    if isprime(n):
-        DEBUG("-"*80)
-        if n < 50000:
-            DEBUG(f"You should use GMP-ECM for this. Ignoring M{n}.")
+# seconds until a connection to the server is established and between two reads, see --timeout
+CONNECT_TIMEOUT = 10.
+READ_TIMEOUT = 60.
+
+# a request which fails because of a timeout, a connection error, a broken transfer or one of these
+# HTTP status codes is repeated up to RETRIES times. The k-th retry waits RETRY_BACKOFF * 2**k seconds
+# (at most RETRY_MAX_DELAY) plus a random jitter of up to the same amount, or as long as the Retry-After
+# header of the server says, if that is longer.
+RETRIES = 4
+RETRY_BACKOFF = 1.
+RETRY_MAX_DELAY = 60.
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# response with an HTTP status other than 200, an error page must not be taken for an empty report
+class HTTPStatusError(urllib3.exceptions.HTTPError):
+    def __init__(self, status, lo, retry_after=None):
+        super().__init__(f"HTTP status {status} for M{lo}")
+        self.status = status
+        self.retry_after = retry_after # seconds or None
+
+# returns the seconds of a Retry-After header, which is either a number of seconds or a date
+def parse_retry_after(value):
+    if value is None:
+        return None
+    try:
+        return max(0., float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0., email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# fetches the report of the exponents in the (sorted) list `exponents` with a single request
+# and returns a dict {n: [lines]} like split_report(). The (compressed) response is decoded and split
+# while it is downloaded, so the whole report of a large range is never in memory at once.
+def fetch_report(exponents):
+    lo = exponents[0]
+    hi = exponents[-1] if len(exponents) > 1 else ""
+    with STATS.timer("network"):
+        response = http.request('GET', REPORT_URL.format(server=SERVER, lo=lo, hi=hi), preload_content=False,
+                                timeout=urllib3.Timeout(connect=min(CONNECT_TIMEOUT, READ_TIMEOUT), read=READ_TIMEOUT))
+    STATS.count("requests")
+    try:
+        if response.status != 200:
+            response.drain_conn()
+            raise HTTPStatusError(response.status, lo, parse_retry_after(response.headers.get("Retry-After")))
+        # the response must stay open at the end of the body for the io wrapper
+        response.auto_close = False
+        with STATS.timer("download"):
+            return split_report(io.TextIOWrapper(response, encoding="utf-8"), exponents)
+    finally:
+        # the bytes on the wire, i.e. compressed
+        STATS.count("bytes_downloaded", response.tell())
+        response.release_conn()
+
+# splits the lines of a text report into lines per exponent, lines of other exponents are dropped
+# returns a dict {n: [lines]} with an entry for every exponent in `exponents`
+def split_report(report, exponents):
+    lines = {n: [] for n in exponents}
+    for l in report:
+        l = l.strip()
+        # every data line starts with the exponent, followed by a tab
+        exponent, tab, _ = l.partition("\t")
+        if tab and exponent.isdigit() and int(exponent) in lines:
+            lines[int(exponent)].append(l)
+    return lines
+
+# local on-disk cache of the per-exponent reports, so that re-running a range
+# (e.g. in order to try different bounds) does not query the server again
+class ReportCache:
+    def __init__(self, filename, ttl=24*3600):
+        self.db = sqlite3.connect(filename)
+        self.db.execute("CREATE TABLE IF NOT EXISTS reports ("
+                        "exponent INTEGER PRIMARY KEY, fetched REAL NOT NULL, report TEXT NOT NULL)")
+        self.db.commit()
+        self.ttl = ttl # seconds after which a cached report is outdated, None means never
+
+    # returns a dict {n: [lines]} for all exponents lo <= n <= hi which are cached and not outdated
+    def get(self, lo, hi, ttl=None):
+        oldest = 0 if ttl is None else time.time() - ttl
+        rows = self.db.execute("SELECT exponent, report FROM reports WHERE exponent BETWEEN ? AND ? AND fetched >= ?",
+                               (lo, hi, oldest))
+        return {n: report.split("\n") if report else [] for n, report in rows}
+
+    # stores a dict {n: [lines]}
+    def put(self, reports):
+        now = time.time()
+        self.db.executemany("INSERT OR REPLACE INTO reports VALUES (?, ?, ?)",
+                            [(n, now, "\n".join(lines)) for n, lines in reports.items()])
+        self.db.commit()
+
+    # removes all reports older than max_age seconds and afterwards
+    # the oldest reports until at most max_entries are left
+    def evict(self, max_age=None, max_entries=None):
+        if max_age is not None:
+            self.db.execute("DELETE FROM reports WHERE fetched < ?", (time.time() - max_age,))
+        if max_entries is not None:
+            self.db.execute("DELETE FROM reports WHERE exponent NOT IN "
+                            "(SELECT exponent FROM reports ORDER BY fetched DESC LIMIT ?)", (max_entries,))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+# fetches the reports of the exponents in the (sorted) list `missing` with one request,
+# which is repeated with exponential backoff if it fails (see RETRIES)
+# this is executed in the worker threads of fetch_reports()
+def fetch_batch(missing, limiter):
+    for attempt in range(RETRIES + 1):
+        limiter.acquire()
+        delay = min(RETRY_MAX_DELAY, RETRY_BACKOFF * 2**attempt)
+        delay += random.uniform(0, delay)
+        try:
+            return fetch_report(missing)
+        except HTTPStatusError as e:
+            if e.status not in RETRY_STATUS or attempt == RETRIES:
+                raise
+            delay = max(delay, e.retry_after or 0)
+        except urllib3.exceptions.HTTPError:
+            # timeouts, connection errors and broken (or badly compressed) transfers
+            if attempt == RETRIES:
+                raise
+        STATS.count("retries")
+        STATS.observe("backoff", delay)
+        time.sleep(delay)
+
+# generator which yields (n, lines) for every exponent in the (sorted) list `exponents`
+# it queries batch_size exponents with a single request
+# up to `parallel` requests are in flight while the previous reports are processed,
+# the number of requests per second is limited by `limiter`. The order of `exponents` is kept.
+# if a cache is given, only exponents which are not cached (or outdated) are queried.
+# in offline mode, the server is never queried and any cached report is used regardless of its age.
+def fetch_reports(exponents, batch_size=1, cache=None, offline=False, parallel=1, limiter=None):
+    if limiter is None:
+        limiter = RateLimiter()
+    batches = (exponents[i:i+batch_size] for i in range(0, len(exponents), batch_size))
+    pending = collections.deque() # (batch, cached lines, future or None), in order of exponents
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=parallel)
+    try:
+        while True:
+            # keep up to `parallel` requests in flight
+            # the cache is only used from this thread, sqlite connections must not be shared
+            while len(pending) < parallel:
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                lines = {}
+                if cache:
+                    with STATS.timer("cache"):
+                        lines = cache.get(batch[0], batch[-1], None if offline else cache.ttl)
+                    STATS.count("cache_hits", len(lines))
+                missing = [n for n in batch if n not in lines]
+                future = None
+                if missing and not offline:
+                    future = executor.submit(fetch_batch, missing, limiter)
+                pending.append((batch, lines, future))
+            if not pending:
+                break
+            batch, lines, future = pending.popleft()
+            if future:
+                try:
+                    fetched = future.result()
+                except Exception as e:
+                    # the exponents are skipped, they will be queried again if the run is resumed
+                    ERROR(f"could not fetch M{batch[0]}..M{batch[-1]}, skipping them: {e!r}")
+                    STATS.count("fetch_failed", len(batch) - len(lines))
+                    fetched = {}
+                if cache:
+                    with STATS.timer("cache"):
+                        cache.put(fetched)
+                lines.update(fetched)
+            for n in batch:
+                if n in lines:
+                    yield n, lines[n]
+                elif offline:
+                    DEBUG("-"*80)
+                    DEBUG(f"M{n} is not cached, skipping it because of offline mode.")
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+# opens a locally saved report (e.g. a bulk export of a whole range) for reading,
+# which may be compressed with gzip or xz. "-" is stdin.
+def open_input(filename):
+    if filename == "-":
+        return sys.stdin
+    with open(filename, "rb") as f:
+        magic = f.read(6)
+    if magic.startswith(b"\x1f\x8b"):
+        return gzip.open(filename, "rt", encoding="utf-8")
+    if magic.startswith(b"\xfd7zXZ\x00"):
+        return lzma.open(filename, "rt", encoding="utf-8")
+    return open(filename, encoding="utf-8", buffering=1<<20)
+
+# generator which yields (n, lines) for every exponent start <= n < stop in a locally saved report
+# The lines of an exponent have to be consecutive and the exponents ascending (as they are in the
+# reports of the server), so only the lines of the current exponent are kept in memory.
+# Because of the order, the rest of the file is not read (and decompressed) once an exponent >= stop is reached.
+def read_reports(f, start=0, stop=None):
+    current, n, lines = None, None, []
+    for l in f:
+        l = l.strip()
+        # every data line starts with the exponent, followed by a tab
+        exponent, tab, _ = l.partition("\t")
+        if not tab or not exponent.isdigit():
             continue
-        response = http.request('GET', f"https://www.mersenne.org/report_exponent/?exp_lo={n}&exp_hi=&text=1&full=1&ecmhist=1")
-        html = response.data.decode('utf-8')
-        lines = [l.strip() for l in html.split("\n") if l.strip().startswith(f"{n}\t")]
-        factors = set()
-        ecm = {}    # (B1, B2) : count
-        pm1 = set() # (B1, B2, E)
-        pp1 = set() # (B1, B2, start1, start2)
-        is_recently_assigned = False
-        is_fully_factored = False
-        how_far_factored = [True] * 64 + [False] * (100-64) # how_far_factored[i] indicates if [2^(i-1); 2^(i)] was done
-        for l in lines:
-            if l.startswith(f"{n}\tFactored\t"):
-                #41681   Factored        1052945423;16647332713153;2853686272534246492102086015457
-                factors |= set([int(f) for f in l.split("\t")[2].split(";")])
-            elif l.startswith(f"{n}\tPRPCofactor\t"):
-                #41681   PRPCofactor     Verified (Factored);2017-11-09;kkmrkkblmbrbk;PRP_PRP_PRP_PRP_;3;37261;1;3
-                pass
-            elif l.startswith(f"{n}\tUnfactored\t"):
-                #100000007	Unfactored	2^79
-                result = l.split("\t")[2]
-                assert(result.startswith("2^"))
-                high = int(result[2:])
-                for i in range(high):
-                    how_far_factored[i] = True
-            elif l.startswith(f"{n}\tLL\t"):
-                # 100000007	LL	Verified;2018-02-26;G0rfi3ld;F9042256B193FAA0;3178317
-                pass
-            elif l.startswith(f"{n}\tPRP\t"):
-                # 20825573	PRP	Verified;2020-10-12;gLauss;738AD2BB0D72E3AA;1276614;1;3
+        if exponent != current:
+            if lines:
+                yield n, lines
+                lines = []
+            previous, current, n = n, exponent, int(exponent)
+            if previous is not None and n < previous:
+                raise ValueError(f"the input is not sorted by exponent, M{n} follows M{previous}")
+            if stop is not None and n >= stop:
+                return
+        if n >= start:
+            lines.append(l)
+    if lines:
+        yield n, lines
+
+# seconds after which factoring a composite factor reported by the server is given up
+FACTOR_TIMEOUT = 60.
+
+# exponents below this are ignored, GMP-ECM is the better tool for them
+MIN_EXPONENT = 50000
+
+# the cofactor of 2^n-1 is checked locally for exponents up to this limit,
+# if the server does not report it as probable prime
+COFACTOR_LIMIT = 50000
+
+# append-only journal with one JSON line per processed exponent, e.g.
+#     {"n": 100003, "work": ["Pminus1=N/A,1,2,100003,-1,30000000,0,70", ...]}
+#     {"n": 100019, "error": "ParseError('unknown worktype X')"}
+# with --rank, the entries also contain the estimates [GHz-days, probability] of the worktodo lines
+# and with --format jsonl or csv the decision record (see planner.describe()),
+# so that an interrupted run can be resumed
+class Journal:
+    def __init__(self, filename, resume=False):
+        # n -> (worktodo lines, estimates or None, decision record or None) of all exponents which have been processed successfully
+        self.completed = {}
+        if resume:
+            try:
+                with open(filename, encoding="utf-8") as f:
+                    for l in f:
+                        try:
+                            entry = json.loads(l)
+                        except ValueError:
+                            continue # the last line is incomplete if the run was killed while writing it
+                        if "work" in entry:
+                            self.completed[entry["n"]] = (entry["work"], entry.get("estimates"), entry.get("record"))
+            except FileNotFoundError:
                 pass
-            elif l.startswith(f"{n}\tPM1\t"):
-                #100000007	PM1	B1=5000000,B2=150000000
-                result = l.split("\t")[2]
-                if   m:= re.match("^B1=([0-9]*),B2=([0-9]*),E=([0-9]*)$", result):
-                    B1, B2, E = int(m.group(1)), int(m.group(2)), int(m.group(3))
-                elif m:= re.match("^B1=([0-9]*),B2=([0-9]*)$", result):
-                    B1, B2 = int(m.group(1)), int(m.group(2))
-                    E = 0
-                elif m:= re.match("^B1=([0-9]*)$", result):
-                    B1 = int(m.group(1))
-                    B2, E = B1, 0
+        self.f = open(filename, "a" if resume else "w", encoding="utf-8")
+
+    def record(self, n, work=None, error=None, estimates=None, record=None):
+        entry = {"n": n, "work": work} if error is None else {"n": n, "error": error}
+        if estimates is not None:
+            entry["estimates"] = estimates
+        if record is not None:
+            entry["record"] = record
+        self.f.write(json.dumps(entry) + "\n")
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+# seconds between the commits of the delta state while a journal is written, see run()
+DELTA_COMMIT_SECONDS = 10.
+
+# SQLite file with the fingerprint (see planner.fingerprint()) and the worktodo lines of every exponent
+# of the previous runs, so that unchanged exponents are neither parsed nor planned again.
+# The changes are only committed once the worktodo lines have been written (or journaled).
+class DeltaState:
+    def __init__(self, filename):
+        self.db = sqlite3.connect(filename)
+        self.committed = time.monotonic()
+        self.db.execute("CREATE TABLE IF NOT EXISTS exponents ("
+                        "exponent INTEGER PRIMARY KEY, last_date TEXT NOT NULL, digest TEXT NOT NULL, "
+                        "recent INTEGER NOT NULL, work TEXT NOT NULL, updated REAL NOT NULL)")
+        self.db.commit()
+
+    # returns (digest, recent, worktodo lines) of the previous run or None if n is new
+    def get(self, n):
+        row = self.db.execute("SELECT digest, recent, work FROM exponents WHERE exponent = ?", (n,)).fetchone()
+        if row is None:
+            return None
+        digest, recent, work = row
+        return digest, bool(recent), work.split("\n") if work else []
+
+    def put(self, n, last_date, digest, recent, work):
+        self.db.execute("INSERT OR REPLACE INTO exponents VALUES (?, ?, ?, ?, ?, ?)",
+                        (n, last_date, digest, int(recent), "\n".join(work), time.time()))
+
+    # changes the digest and the worktodo lines which have been written of an exponent stored with put()
+    def update(self, n, digest, work):
+        self.db.execute("UPDATE exponents SET digest = ?, work = ?, updated = ? WHERE exponent = ?",
+                        (digest, "\n".join(work), time.time(), n))
+
+    def commit(self):
+        self.db.commit()
+        self.committed = time.monotonic()
+
+    # without commit, the changes since the last commit are discarded
+    def close(self, commit=True):
+        if commit:
+            self.db.commit()
+        else:
+            self.db.rollback()
+        self.db.close()
+
+# how the P-1 / P+1 bounds are chosen, see planner.plan()
+BOUNDS_POLICY = "table"
+
+# P-1 / P+1 work from local worktodo and results files (see --worktodo and --results), None if there is none
+LOCAL_WORK = None
+
+# numbertheory.factorize() for make_status(), which counts the calls and measures them
+def counted_factorize(f, timeout=None, exponent=1):
+    STATS.count("factorize_calls")
+    with STATS.timer("factorize"):
+        return factorize(f, timeout=timeout, exponent=exponent)
+
+# parses the lines of the report for exponent n and returns its ExponentStatus and the worktodo lines
+def process_exponent(n, lines):
+    with STATS.timer("parse"):
+        report = parse_report(n, lines)
+    if LOCAL_WORK and LOCAL_WORK.merge(n, report):
+        DEBUG(f"added local P-1/P+1 work: P-1 {sorted(LOCAL_WORK.pm1.get(n, ()))}, P+1 {sorted(LOCAL_WORK.pp1.get(n, ()))}")
+    # includes factorize
+    with STATS.timer("status"):
+        status = make_status(n, report, FACTOR_TIMEOUT, COFACTOR_LIMIT, counted_factorize)
+    with STATS.timer("plan"):
+        work = plan(status, DEBUG if PRINT_DEBUG else None, BOUNDS_POLICY)
+    return status, work
+
+# writers for the result of a run, see --format and --output
+# record(r) is called with the decision record of every exponent (see planner.describe(), or only
+# {"n": ..., "skip": ...} if it was not planned), work(lines) with the worktodo lines in the order
+# in which they should be written. A file is written to a temporary file with large buffers and only
+# replaces the file at close(), so Prime95 never sees a partial worktodo.txt. None writes to stdout.
+class WorktodoWriter:
+    NEWLINE = None
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        if filename:
+            self.tmp = filename + ".tmp"
+            self.f = open(self.tmp, "w", encoding="utf-8", newline=self.NEWLINE, buffering=1<<20)
+        else:
+            self.f = sys.stdout
+
+    def record(self, r):
+        pass
+
+    def work(self, lines):
+        for l in lines:
+            self.f.write(l + "\n")
+
+    # an incomplete run (complete=False) keeps the previous file
+    def close(self, complete=True):
+        if not self.filename:
+            self.f.flush()
+            return
+        if complete:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+        self.f.close()
+        if complete:
+            os.replace(self.tmp, self.filename)
+        else:
+            os.remove(self.tmp)
+
+# one JSON object per exponent with its decision record
+class JSONLinesWriter(WorktodoWriter):
+    def record(self, r):
+        self.f.write(json.dumps(r) + "\n")
+
+    def work(self, lines):
+        pass
+
+# one row per worktodo line, or a single row with the reason if an exponent was skipped
+class CSVWriter(WorktodoWriter):
+    NEWLINE = ""
+    COLUMNS = ("n", "skip", "tf", "ecm_level", "worktype", "B1", "B2", "nth_run", "how_far_factored", "line")
+
+    def __init__(self, filename=None):
+        super().__init__(filename)
+        self.csv = csv.writer(self.f)
+        self.csv.writerow(self.COLUMNS)
+
+    def record(self, r):
+        row = [r["n"], r.get("skip") or "", r.get("tf", ""), r.get("ecm_level", "")]
+        for w in r.get("work") or [{}]:
+            self.csv.writerow(row + ["" if w.get(c) is None else w[c] for c in self.COLUMNS[4:]])
+
+    def work(self, lines):
+        pass
+
+WRITERS = {"worktodo": WorktodoWriter, "jsonl": JSONLinesWriter, "csv": CSVWriter}
+
+# distributes the worktodo lines to the workers (see planner.split_work()) and writes them
+# in [Worker #k] sections, or writes them to one file per worker if pattern (e.g. "worktodo{}.txt") is given
+def write_workers(writer, lines, workers, memory=None, pattern=None, complete=True):
+    assigned, load, too_large = split_work(lines, workers, memory)
+    for line, need in too_large:
+        ERROR(f"no worker has the {need:.1f} MB for stage 2 of {line}, it goes to the worker with the most memory")
+    for k, work in enumerate(assigned, 1):
+        if pattern:
+            f = WorktodoWriter(pattern.format(k))
+            f.work(work)
+            f.close(complete)
+        else:
+            writer.work([f"[Worker #{k}]"] + work)
+    for k, work in enumerate(assigned, 1):
+        print(f"worker {k}: {len(work)} worktodo lines, {load[k-1]:.2f} GHz-days", file=sys.stderr)
+    print(f"predicted makespan: {max(load):.2f} GHz-days (total {sum(load):.2f} GHz-days)", file=sys.stderr)
+
+#############################################################################################3
+
+# the parser of the command line, also used by coordinator.py to check the options it passes on
+def make_parser():
+    parser = argparse.ArgumentParser(prog="get_work.py",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=USAGE)
+    parser.add_argument("start", type=int, nargs="?", help="first exponent")
+    parser.add_argument("stop",  type=int, nargs="?", help="last exponent (exclusive)")
+    parser.add_argument("print_debug", type=int, nargs="?", default=PRINT_DEBUG,
+        help="1 enables debug output (default), 0 disables it")
+    parser.add_argument("--quiet", action="store_true",
+        help="disable the debug output, the same as print_debug 0 (which needs start and stop)")
+    parser.add_argument("--batch-size", type=int, default=1, metavar="N",
+        help="query N prime exponents with a single request (default: 1). "
+             "Larger values mean less requests but larger responses.")
+    parser.add_argument("--rate", type=float, default=1., metavar="R",
+        help="send at most R requests per second to the server (default: 1)")
+    parser.add_argument("--parallel", type=int, default=2, metavar="N",
+        help="keep up to N requests in flight while the reports are processed (default: 2)")
+    parser.add_argument("--server", default=SERVER, metavar="URL",
+        help=f"query this server instead of {SERVER}, e.g. a local primenet_standin.py")
+    parser.add_argument("--timeout", type=float, default=READ_TIMEOUT, metavar="SECONDS",
+        help=f"give up a request if the server does not send anything for this time (default: {READ_TIMEOUT:.0f}), "
+             f"the timeout for establishing the connection is at most {CONNECT_TIMEOUT:.0f} seconds")
+    parser.add_argument("--retries", type=int, default=RETRIES, metavar="N",
+        help="repeat a failed request up to N times with exponential backoff, "
+             f"respecting the Retry-After of the server (default: {RETRIES})")
+    parser.add_argument("--cache", metavar="FILE",
+        help="SQLite file in which the reports of the server are cached")
+    parser.add_argument("--cache-ttl", type=float, default=24., metavar="HOURS",
+        help="cached reports older than this are queried again (default: 24)")
+    parser.add_argument("--cache-max-age", type=float, metavar="DAYS",
+        help="remove cached reports older than this after the run")
+    parser.add_argument("--cache-max-entries", type=int, metavar="N",
+        help="keep at most N (the most recent) cached reports after the run")
+    parser.add_argument("--offline", action="store_true",
+        help="never query the server, only use cached reports (requires --cache)")
+    parser.add_argument("--factor-timeout", type=float, default=FACTOR_TIMEOUT, metavar="SECONDS",
+        help="give up factoring a composite factor reported by the server after this time, "
+             f"the composite factor is used as it is (default: {FACTOR_TIMEOUT:.0f})")
+    parser.add_argument("--min-exponent", type=int, default=MIN_EXPONENT, metavar="N",
+        help=f"ignore exponents below N (default: {MIN_EXPONENT})")
+    parser.add_argument("--cofactor-limit", type=int, default=COFACTOR_LIMIT, metavar="N",
+        help="if the server does not report a probable prime cofactor, check it locally for exponents "
+             f"up to N (default: {COFACTOR_LIMIT}). This is slow for large exponents.")
+    parser.add_argument("--journal", metavar="FILE",
+        help="record every processed exponent and its worktodo lines in FILE")
+    parser.add_argument("--resume", action="store_true",
+        help="continue an interrupted run: exponents which have been completed according to the "
+             "journal are not processed again, their worktodo lines are printed from the journal (requires --journal)")
+    parser.add_argument("--delta", metavar="FILE",
+        help="SQLite file with the status of every exponent from the previous runs. Exponents whose report "
+             "did not change are skipped and only worktodo lines which are new since the previous run are printed.")
+    parser.add_argument("--worktodo", metavar="FILE", action="append", default=[],
+        help="P-1/P+1 lines in this worktodo.txt of Prime95 count as done, so they are not generated again. "
+             "Can be given several times.")
+    parser.add_argument("--results", metavar="FILE", action="append", default=[],
+        help="P-1/P+1 results in this results.txt or results.json.txt of Prime95 which have not been "
+             "reported yet count as done. Can be given several times.")
+    parser.add_argument("--bounds", choices=BOUNDS_POLICIES, default=BOUNDS_POLICY,
+        help="\"table\" uses fixed B1 bounds depending on the size of the exponent and lets Prime95 choose B2, "
+             "\"optimal\" chooses B1 and B2 with the best probability to find a new factor for the work "
+             f"(default: {BOUNDS_POLICY})")
+    parser.add_argument("--rank", action="store_true",
+        help="estimate the GHz-days and the probability to find a factor of every worktodo line and print them "
+             "at the end, sorted by the expected number of factors per GHz-day")
+    parser.add_argument("--budget", type=float, metavar="GHZDAYS",
+        help="only print the best worktodo lines (see --rank) which take at most GHZDAYS together")
+    parser.add_argument("--workers", type=int, metavar="N",
+        help="distribute the worktodo lines to N workers, balanced by their estimated GHz-days, "
+             "and print them in [Worker #k] sections")
+    parser.add_argument("--worker-memory", metavar="MB[,MB...]",
+        help="memory for stage 2 of every worker (or a single value for all of them), "
+             "a worker only gets lines whose stage 2 fits (requires --workers)")
+    parser.add_argument("--worker-files", metavar="PATTERN",
+        help="write the lines of worker k to the file PATTERN with {} replaced by k, "
+             "e.g. worktodo{}.txt, instead of printing them (requires --workers)")
+    parser.add_argument("--output", metavar="FILE",
+        help="write the result to FILE instead of stdout. The file is only replaced at the end of a "
+             "successful run, so it can be the worktodo.txt of Prime95.")
+    parser.add_argument("--allow-partial", action="store_true",
+        help="replace the files of --output and --worker-files even if some exponents could not be "
+             "processed or fetched, by default the previous files are kept in that case")
+    parser.add_argument("--format", choices=WRITERS, default="worktodo",
+        help="\"worktodo\" writes the worktodo lines (default), \"jsonl\" one JSON object per exponent with "
+             "the decision (bounds, TF and ECM level, reason for skipping it), \"csv\" one row per worktodo line")
+    parser.add_argument("--log", metavar="FILE",
+        help="write the debug output to FILE (- for stderr). By default, it goes to stdout together with the "
+             "worktodo lines, or to stderr if --format is jsonl or csv.")
+    parser.add_argument("--stats", metavar="FILE",
+        help="write counters and the wall time per phase (network, parse, factorize, plan, ...) "
+             "as JSON to FILE at the end of the run, - writes them to stderr")
+    parser.add_argument("--prometheus", metavar="FILE",
+        help="write the same statistics in the Prometheus text format to FILE, "
+             "e.g. for the textfile collector of node_exporter")
+    parser.add_argument("--profile", metavar="FILE",
+        help="run with cProfile, save the profile to FILE and print the slowest functions to stderr")
+    parser.add_argument("--input", metavar="FILE",
+        help="read the reports from FILE (e.g. a saved bulk export of a whole range, "
+             "optionally compressed with gzip or xz) instead of querying the server. "
+             "start and stop are optional in this case.")
+    return parser
+
+def main(argv):
+    global PRINT_DEBUG, FACTOR_TIMEOUT, MIN_EXPONENT, COFACTOR_LIMIT, LOCAL_WORK, BOUNDS_POLICY, SERVER, STATS, LOG
+    global READ_TIMEOUT, RETRIES
+    parser = make_parser()
+    args = parser.parse_args(argv[1:])
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.rate <= 0 or args.parallel < 1:
+        parser.error("--rate must be positive and --parallel must be at least 1")
+    if args.timeout <= 0 or args.retries < 0:
+        parser.error("--timeout must be positive and --retries must not be negative")
+    if args.offline and not args.cache:
+        parser.error("--offline requires --cache")
+    if args.resume and not args.journal:
+        parser.error("--resume requires --journal")
+    if args.budget is not None and args.budget <= 0:
+        parser.error("--budget must be positive")
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if (args.worker_memory or args.worker_files) and not args.workers:
+        parser.error("--worker-memory and --worker-files require --workers")
+    if args.worker_files and "{}" not in args.worker_files:
+        parser.error("--worker-files must contain {}")
+    if args.worker_files and args.output:
+        parser.error("--worker-files and --output cannot be combined")
+    if args.format != "worktodo" and (args.rank or args.budget is not None or args.workers):
+        parser.error("--rank, --budget and --workers only work with --format worktodo")
+    memory = None
+    if args.worker_memory:
+        try:
+            memory = [float(m) for m in args.worker_memory.split(",")]
+        except ValueError:
+            parser.error("--worker-memory must be a comma separated list of numbers")
+        if len(memory) == 1:
+            memory *= args.workers
+        if len(memory) != args.workers:
+            parser.error("--worker-memory needs a single value or one value for every worker")
+    if not args.input and (args.start is None or args.stop is None):
+        parser.error("start and stop are required unless --input is given")
+    PRINT_DEBUG = 0 if args.quiet else args.print_debug
+    FACTOR_TIMEOUT = args.factor_timeout
+    MIN_EXPONENT = args.min_exponent
+    COFACTOR_LIMIT = args.cofactor_limit
+    BOUNDS_POLICY = args.bounds
+    SERVER = args.server.rstrip("/")
+    READ_TIMEOUT = args.timeout
+    RETRIES = args.retries
+
+    if args.worktodo or args.results:
+        LOCAL_WORK = LocalWork()
+        try:
+            for filename in args.worktodo:
+                with open_input(filename) as f:
+                    LOCAL_WORK.read_worktodo(f)
+            for filename in args.results:
+                with open_input(filename) as f:
+                    unknown = LOCAL_WORK.read_results(f)
+                if unknown:
+                    ERROR(f"{unknown} P-1/P+1 results in {filename} could not be parsed and are ignored")
+        except (OSError, ParseError) as e:
+            FATAL(f"could not read local work: {e}")
+        DEBUG(f"local work: P-1 of {len(LOCAL_WORK.pm1)} and P+1 of {len(LOCAL_WORK.pp1)} exponents")
+
+    LOG = None
+    if args.log == "-" or (args.log is None and args.format != "worktodo" and not args.output):
+        LOG = sys.stderr
+    elif args.log:
+        LOG = open(args.log, "w", encoding="utf-8")
+    STATS = Stats()
+    writer = WRITERS[args.format](args.output)
+    delta = None
+    complete = False
+    try:
+        if args.delta:
+            delta = DeltaState(args.delta)
+        if args.profile:
+            profiler = cProfile.Profile()
+            try:
+                errors = profiler.runcall(run, args, memory, writer, delta)
+            finally:
+                profiler.dump_stats(args.profile)
+                pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(25)
+        else:
+            errors = run(args, memory, writer, delta)
+        # the exponents which could not be processed or fetched would be missing from the files
+        complete = not errors or args.allow_partial
+        if not complete and (args.output or args.worker_files):
+            ERROR("the result is incomplete, keeping the previous files (see --allow-partial)")
+    finally:
+        try:
+            writer.close(complete)
+        except BaseException:
+            complete = False
+            raise
+        finally:
+            # the delta state must not count lines as written which are not in the result
+            if delta:
+                delta.close(complete)
+        if args.log and args.log != "-":
+            LOG.close()
+        if args.stats:
+            write_stats(args.stats)
+        if args.prometheus:
+            write_prometheus(args.prometheus)
+    if errors:
+        ERROR(f"{errors} exponents could not be processed or fetched")
+        sys.exit(1)
+
+# the actual run after the arguments have been checked, memory is the parsed --worker-memory and delta the
+# DeltaState of --delta (or None). The result goes to writer (see WorktodoWriter), returns the number of exponents which could not be processed
+# or whose reports could not be fetched
+def run(args, memory, writer, delta=None):
+    ranking = args.rank or args.budget is not None
+    candidates = [] # (line, GHz-days, probability) for --rank
+    ranked = {} # exponent -> its lines in candidates, for --delta
+    pending = {} # exponent -> (digest, planned lines) for --delta, stored after the ranking
+    output = [] # worktodo lines for --workers, which are distributed at the end
+    keep_records = args.format != "worktodo" # the decision records are needed to resume
+
+    journal = None
+    completed = {}
+    if args.journal:
+        journal = Journal(args.journal, args.resume)
+        completed = journal.completed
+        # the work of the exponents which have been completed before is written again (or ranked),
+        # so that the output of the resumed run is complete
+        for n in sorted(completed):
+            work, estimates, record = completed[n]
+            if ranking and estimates is not None:
+                candidates.extend((l, cost, p) for l, (cost, p) in zip(work, estimates))
+                ranked[n] = work
+                continue
+            STATS.count("lines_emitted", len(work))
+            if args.workers:
+                output.extend(work)
+            else:
+                # the journal of a run with --format worktodo has no records
+                writer.record(record or {"n": n, "skip": None if work else "unknown", "work": [{"line": l} for l in work]})
+                writer.work(work)
+        if completed:
+            DEBUG(f"resuming, {len(completed)} exponents have been completed before")
+
+    cache = None
+    f = None
+    if args.input:
+        f = open_input(args.input)
+        reports = read_reports(f, args.start or 0, args.stop)
+    else:
+        exponents = []
+        for n in primes_between(args.start, args.stop):
+            if n < MIN_EXPONENT:
+                # counted like in the loop below, so that --input gives the same stats
+                STATS.count("exponents_scanned")
+                DEBUG("-"*80)
+                DEBUG(f"You should use GMP-ECM for this. Ignoring M{n}.")
+                STATS.count("skipped_small")
+                writer.record({"n": n, "skip": "below min exponent"})
+            elif n not in completed:
+                exponents.append(n)
+        if args.cache:
+            cache = ReportCache(args.cache, ttl=args.cache_ttl*3600)
+        limiter = RateLimiter(args.rate)
+        reports = fetch_reports(exponents, args.batch_size, cache, args.offline, args.parallel, limiter)
+
+    errors = 0
+    counts = {"new": 0, "changed": 0, "unchanged": 0}
+    try:
+        for n, lines in STATS.timed("wait", reports):
+            if n in completed:
+                continue
+            STATS.count("exponents_scanned")
+            DEBUG("-"*80)
+            if n < MIN_EXPONENT:
+                DEBUG(f"You should use GMP-ECM for this. Ignoring M{n}.")
+                STATS.count("skipped_small")
+                writer.record({"n": n, "skip": "below min exponent"})
+                continue
+            if delta:
+                with STATS.timer("delta"):
+                    last_date, digest = fingerprint(lines)
+                recent = bool(last_date) and is_recent(last_date)
+                previous = delta.get(n)
+                # the status is the same unless the report changed or the last activity is no longer recent
+                if previous and previous[:2] == (digest, recent):
+                    DEBUG(f"M{n} did not change since the previous run, skipping it.")
+                    counts["unchanged"] += 1
+                    STATS.count("skipped_unchanged")
+                    record = {"n": n, "skip": "unchanged"}
+                    writer.record(record)
+                    if journal:
+                        journal.record(n, [], record=record if keep_records else None)
+                    continue
+            # a single exponent which cannot be processed should not stop the whole run
+            try:
+                status, work = process_exponent(n, lines)
+            except Exception as e:
+                ERROR(f"skipping M{n}: {e!r}")
+                errors += 1
+                STATS.count("errors")
+                writer.record({"n": n, "skip": "error", "error": repr(e)})
+                if journal:
+                    journal.record(n, error=repr(e))
+                continue
+            if status.recent:
+                STATS.count("skipped_recent")
+            elif status.fully_factored:
+                STATS.count("skipped_fully_factored")
+            planned = work
+            if delta:
+                if previous:
+                    counts["changed"] += 1
+                    # the other lines have already been written by the previous run
+                    work = [l for l in work if l not in previous[2]]
                 else:
-                    FATAL(f"could not parse PM1 result \"{result}\" in line \"{l}\"")
-                assert(B1 <= B2)
-                assert(E in [0,6,12,30,48])
-                pm1.add( (B1,B2,E))
-            elif l.startswith(f"{n}\tAssigned\t"):
-                h = l.split("\t")[2].split(";")
-                # 41081	Assigned	2017-10-09;Chang Chia-Tche;PRP test;;0.0;updated on 2017-10-09;expired on 2017-10-13
-                is_recently_assigned |= is_recent(h[0])
-            elif l.startswith(f"{n}\tHistory\t"):
-                h = l.split("\t")[2].split(";")
-                is_recently_assigned |= is_recent(h[0])
-                worktype, result = h[2], h[3]
-                if worktype == "F-ECM" or worktype == "F":
-                    # 41681   History 2015-04-26;Serge Batalov;F-ECM;Factor: 2853686272534246492102086015457
-                    # 41681   History 2008-08-26;-Anonymous-;F;Factor: 16647332713153
-                    factors.add(int(result.split(" ")[1]))
-                elif worktype == "CERT" or worktype == "C-PRP" or worktype == "C-LL":
-                    # we don't care for factorization purposes
-                    pass
-                elif worktype == "NF":
-                    # 100000007	History	2007-07-04;ComputerraRU;NF;no factor to 2^50
-                    if   m:= re.match("^no factor from 2\^([0-9]*)[ ]*to 2\^([0-9]*)[ ]*$", result):
-                        low, high = int(m.group(1)), int(m.group(2))
-                        for i in range(low, high):
-                            how_far_factored[i] = True
-                    elif m:= re.match("^no factor to 2\^([0-9]*)$", result):
-                        high = int(m.group(1))
-                        for i in range(high):
-                            how_far_factored[i] = True
-                    else:
-                        FATAL(f"could not parse NF result \"{result}\" in line \"{l}\"")
-                        assert(False)
-                elif worktype == "NF-ECM":
-                    # 41681   History 2011-01-23;James Hintz;NF-ECM;3 curves, B1=250000, B2=25000000
-                    if   m:=re.match("^([0-9]*) curve[s]?, B1=([0-9]*), B2=([0-9]*)$", result):
-                        c  = int(m.group(1))
-                        B1 = int(m.group(2))
-                        B2 = int(m.group(3))
-                    elif m:=re.match("^([0-9]*) curve[s]?, B1=([0-9]*)", result):
-                        c  = int(m.group(1))
-                        B1 = int(m.group(2))
-                        B2 = B1
-                    else:
-                        FATAL(f"could not parse NF-ECM result \"{result}\" in line \"{l}\"")
-                        assert(False)
-                    assert(B1 <= B2)
-                    assert(c >= 0) # actually, there are entries where count == 0
-                    if (B1,B2) not in ecm: ecm[(B1,B2)] = 0
-                    ecm[(B1,B2)] += c
-                elif worktype == "NF-PM1":
-                    # 3999971	History	2018-12-21;Jocelyn Larouche;NF-PM1;B1=3999971, B2=399997100, E=12
-                    if   m:= re.match("^B1=([0-9]*), B2=([0-9]*), E=([0-9]*)$", result):
-                        B1, B2, E = int(m.group(1)), int(m.group(2)), int(m.group(3))
-                    elif m:= re.match("^B1=([0-9]*), B2=([0-9]*)$", result):
-                        B1, B2 = int(m.group(1)), int(m.group(2))
-                        E = 0
-                    elif m:= re.match("^B1=([0-9]*)$", result):
-                        B1 = int(m.group(1))
-                        B2, E = B1, 0
-                    else:
-                        FATAL(f"could not parse NF-PM1 result \"{result}\" in line \"{l}\"")
-                        assert(False)
-                    assert(B1 <= B2)
-                    assert(E in [0,6,12,30,48])
-                    pm1.add( (B1,B2,E))
-                elif worktype == "F-PM1":
-                    # 123031	History	2013-08-29;BloodIce;F-PM1;Factor: 3158950722867400921
-                    # 2000177	History	2019-01-15;Jocelyn Larouche;F-PM1;Factor: 131059942116526306804441369 / (P-1, B1=1000000)
-                    if   m:= re.match("^Factor: ([0-9]*)$", result):
-                        f = int(m.group(1))
-                        factors.add(f)
-                    elif m:= re.match("^Factor: ([0-9]*) / \(P-1, B1=([0-9]*)\)$", result):
-                        f, B1 = int(m.group(1)), int(m.group(2))
-                        B2, E = B1, 0
-                        pm1.add( (B1,B2,E) )
-                        factors.add(f)
-                    elif m:= re.match("^Factor: ([0-9]*) / \(P-1, B1=([0-9]*), B2=([0-9]*)\)$", result):
-                        f, B1, B2 = int(m.group(1)), int(m.group(2)), int(m.group(3))
-                        E = 0
-                        pm1.add( (B1,B2,E) )
-                        factors.add(f)
-                    elif m:= re.match("^Factor: ([0-9]*) / \(P-1, B1=([0-9]*), B2=([0-9]*), E=([0-9]*)\)$", result):
-                        f, B1, B2, E = int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4))
-                        pm1.add( (B1,B2,E) )
-                        factors.add(f)
-                    else:
-                        FATAL(f"Could not parse F-PM1 result \"{result}\" in line \"{l}\"")
-                        assert(False)
-                elif worktype == "F-PP1":
-                    if   m:= re.match("^Start=([0-9]*)/([0-9]*), B1=([0-9]*), B2=([0-9]*), Factor: ([0-9]*)$", result):
-                        start1, start2, B1, B2, f = int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4)), int(m.group(5))
-                        factors.add(f)
-                        assert(B1 <= B2)
-                        pp1.add( (B1, B2, start1, start2) )
-                    else:
-                        FATAL(f"could not parse NF-PP1 result \"{result}\" in line \"{l}\"")
-                        assert(False)
-                elif worktype == "NF-PP1":
-                    # 41017	History	2021-04-27;gLauss;NF-PP1;Start=2/7, B1=10000000, B2=1000000000
-                    if   m:= re.match("^Start=([0-9]*)/([0-9]*), B1=([0-9]*), B2=([0-9]*)$", result):
-                        start1, start2, B1, B2 = int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4))
-                    elif m:= re.match("^Start=([0-9]*)/([0-9]*), B1=([0-9]*)$", result):
-                        start1, start2, B1 = int(m.group(1)), int(m.group(2)), int(m.group(3))
-                        B2 = B1
-                    else:
-                        FATAL(f"could not parse NF-PP1 result \"{result}\" in line \"{l}\"")
-                        assert(False)
-                    assert(B1 <= B2)
-                    pp1.add( (B1, B2, start1, start2) )
+                    counts["new"] += 1
+                if ranking:
+                    # only the lines selected by rank_work() are written. Until then, the exponent is stored
+                    # with an empty digest, which never matches, so it is planned again by the next run.
+                    delta.put(n, last_date, "", recent, [l for l in planned if l not in work])
+                    pending[n] = (digest, planned)
                 else:
-                    FATAL(f"unknown worktype {worktype}")
-                    assert(False)
+                    delta.put(n, last_date, digest, recent, planned)
+            record = None
+            if keep_records:
+                record = describe(status, work)
+                if planned and not work:
+                    record["skip"] = "written before"
+                writer.record(record)
+            estimates = None
+            if ranking:
+                with STATS.timer("estimate"):
+                    estimates = [estimate(status, l) for l in work]
+                candidates.extend((l, cost, p) for l, (cost, p) in zip(work, estimates))
+                ranked[n] = work
+            elif args.workers:
+                output.extend(work)
+                STATS.count("lines_emitted", len(work))
             else:
-                FATAL(f"could not parse line \"{l}\"")
-                assert(False)
-        # check if factors are actually correct:
-        for f in factors:
-            assert(pow(2,n,f) == 1)
-
-        # check if all reported factors are actually prime
-        # (sometimes, composite factors are reported by server)
-        factors = sorted(list(factors))
-        def split_composite_factors(l):
-            # l is a ascending list of factors. check if l[i] is divisor of l[j] for i<j.
-            for j in range(len(l)):
-                for i in range(j):
-                    if l[j] % l[i] == 0:
-                        all_factors = set(l)
-                        all_factors.remove(l[j])
-                        all_factors.add(l[j] // l[i])
-                        return split_composite_factors(sorted(list(all_factors)))
-            return l
-        factors = set(split_composite_factors(sorted(list(set(factors)))))
-
-        # we can still have composite factors when the server reported only a*b but neither a nor b as factor
-        # Then, we need to factorize ourselves.
-        all_factors = set()
-        for f in factors:
-            for i in factorize(f):
-                all_factors.add(i)
-        factors = all_factors
-
-
-        # for small numbers, we also check if fully factored
-        # TODO: improve this, it is not considering probable prime factors (PRP-CF)
-        if n <= 50000:
-            remaining = 2**n-1
-            for f in factors:
-                remaining //= f
-            # check if fully factored
-            if remaining == 1:
-                is_fully_factored = True
-            elif isprime(remaining):
-                is_fully_factored = True
-                factors.add(remaining)
-        # convert how_far_factored from a bit array to an integer
-        # please note that TJAOI factored everything up to 66 bit
-        for i in range(66): how_far_factored[i] = True
-        hff = 0
-        while how_far_factored[hff]: hff += 1
-        how_far_factored = hff
-
-        # use ECM bounds to adapt how_far_factored
-        # as ECM is probabilistic, we want to be conservative and remove an extra 8 bits / 3 digits of factor size
-        # see ATH's reply at https://mersenneforum.org/showpost.php?p=577509&postcount=51
-        ecm_level = get_ecm_level(ecm)
-        ecm_factored = int(ecm_level * math.log2(10)) - 8
-        if how_far_factored < ecm_factored:
-            DEBUG(f"increased how_far_factored from {how_far_factored} to {ecm_factored} because of substantial ECM")
-            how_far_factored = ecm_factored
-
-        # B1 should be chosen accordingly, if you have done TF very high, you should start with larger bound
-        # e.g. TF = 80 makes ECM t20 useless
-        ECM_B1 = ecm_level_to_B1(ecm_level)
-        ECM_B1 = max(ECM_B1, ecm_level_to_B1(int(how_far_factored / math.log2(10))))
-
-        # hard cut off at 99, because prime95 cannot do larger
-        how_far_factored = min(how_far_factored, 99)
-
-        # boolean
-        if factors:
-            factors_known = True
-        else:
-            factors_known = False
-
-        # debug output
-        DEBUG(f"n:                {n}")
-        DEBUG(f"how_far_factored: {how_far_factored}")
-        DEBUG(f"Factors:          {factors}")
-        DEBUG(f"factors known:    {factors_known}")
-        DEBUG(f"ECM Factoring:    {ecm}")
-        DEBUG(f"ECM level:        t{ecm_level}")
-        DEBUG(f"ECM current B1:   {ECM_B1}")
-        DEBUG(f"P-1 Factoring:    {pm1}")
-        DEBUG(f"P+1 Factoring:    {pp1}")
-        DEBUG(f"recent results:   {is_recently_assigned}")
-        DEBUG(f"fully factored:   {is_fully_factored}")
-
-
-        #####################################################################
-        # now the interesting part where the calculation what to do is done
-        #####################################################################
-
-        # only do P-1 / P+1 assigments, if B1 bound will increase by at least this factor
-        # If it is set to 2 and P-1 was done until 10M, then no new 15M assignment will be generated
-        DUPLICATE_WORK_FACTOR_PROPER_STAGE2 = 2.
-        DUPLICATE_WORK_FACTOR_NO_STAGE2     = 1.3
-
-        # recently assigned or fully factored exponents will be skipped
-        if is_recently_assigned:
-            DEBUG(f"skipping exponent {n}, because it is assigned or there has been work done <90 days ago")
-            continue
-        if is_fully_factored:
-            DEBUG(f"skipping exponent {n}, because it is fully factored")
-            continue
-
-        # calculate bounds
-        PM1_B1 = PM1_B1_should(n, factors_known)
-        PP1_B1 = PP1_B1_should(n, factors_known)
-        # if substantial ECM is already done, we might want to increase those bounds!
-        if ecm:
-            if 20*ECM_B1 > PM1_B1:
-                DEBUG(f"increased desired P+1 B1 to 20*ECM_B1 because current ECM bound is already at B1={ECM_B1}")
-                PM1_B1 = 20*ECM_B1
-            if 10*ECM_B1 > PP1_B1:
-                DEBUG(f"increased desired P+1 B1 to 10*ECM_B1 because current ECM bound is already at B1={ECM_B1}")
-                PP1_B1 = 10*ECM_B1
-
-        # check if it needs P-1 factoring
-        should_do_pm1 = True
-        B1_max_PM1 = 0 # will be required for calculating P+1 bounds
-        for (B1, B2, E) in pm1:
-            B1_max_PM1 = max(B1_max_PM1, B1)
-            # don't do P-1 again if there was a proper run already
-            if B2 / B1 >= 10 and B1 > PM1_B1 / DUPLICATE_WORK_FACTOR_PROPER_STAGE2:
-                DEBUG(f"should not do P-1: B1={PM1_B1} recommended but {B1} already done with B2={B2/B1:.1f}*B1")
-                should_do_pm1 = False
-            elif B1 > PM1_B1 / DUPLICATE_WORK_FACTOR_NO_STAGE2:
-                DEBUG(f"should not do P-1: B1={PM1_B1} recommended but {B1} already done (albeit without stage2)")
-                should_do_pm1 = False
-        if should_do_pm1:
-            print(worktodo_PM1(n,PM1_B1,how_far_factored=how_far_factored,factors=factors))
-
-        # check if it needs P+1 factoring
-        should_do_pp1 = True
-        B1_max_start1_2 = 0
-        B1_max_start1_6 = 0
-        if B1_max_PM1//2 > PP1_B1:
-            PP1_B1 = B1_max_PM1 // 2
-            DEBUG(f"increased desired P+1 B1 to {PP1_B1} which is half of the already done P-1 bound")
-        for (B1, B2, start1, start2) in pp1:
-            # update B1 bound for start values 2 and 6
-            if start1 == 2:
-                B1_max_start1_2 = max(B1_max_start1_2, B1)
-            elif start1 == 6:
-                B1_max_start1_6 = max(B1_max_start1_6, B1)
-            # ignore it, if there was a proper P+1 run with or without stage 2
-            if B2 / B1 > 10 and B1 > PP1_B1 / DUPLICATE_WORK_FACTOR_PROPER_STAGE2:
-                DEBUG(f"should not do PP1: B1={PP1_B1} recommended but {B1} already done with B2={B2/B1:.1f}*B1")
-                should_do_pp1 = False
-            elif B1 > PP1_B1 / DUPLICATE_WORK_FACTOR_NO_STAGE2:
-                DEBUG(f"should not do PP1: B1={PP1_B1} recommended but {B1} already done (albeit without stage2)")
-                should_do_pp1 = False
-        if should_do_pp1:
-            # determine if we should use 2, 6 or a random value as start values
-            # we want to use random only if there has been no 2 or 6 run before because they have higher likelyhood
-            nth_run = 3 # random
-            if B1_max_start1_2 == 0:
-                nth_run = 1
-            elif B1_max_start1_6 == 0:
-                nth_run = 2
+                writer.work(work)
+                STATS.count("lines_emitted", len(work))
+            if journal:
+                journal.record(n, work, estimates=estimates, record=record)
+                # the lines are in the journal now, so a run continued with --resume writes them
+                if delta and time.monotonic() - delta.committed > DELTA_COMMIT_SECONDS:
+                    delta.commit()
+    except ValueError as e:
+        FATAL(e)
+    finally:
+        if f:
+            f.close()
+        if journal:
+            journal.close()
+        if cache:
+            max_age = None if args.cache_max_age is None else args.cache_max_age*86400
+            cache.evict(max_age, args.cache_max_entries)
+            cache.close()
+    if ranking:
+        selected = rank_work(candidates, args.budget)
+        STATS.count("lines_emitted", len(selected))
+        DEBUG("-"*80)
+        for l, cost, p in selected:
+            DEBUG(f"{cost:.4f} GHz-days, probability {p:.4f}, {p/cost:.3f} factors per GHz-day")
+            if args.workers:
+                output.append(l)
             else:
-                # in degenerate cases where there was a run with the optimal values 2 or 6 run,
-                # but only to very low bounds, we still want to use it.
-                if B1_max_start1_2 < PP1_B1 * 0.01:
-                    nth_run = 1
-                elif B1_max_start1_6 < PP1_B1 * 0.01:
-                    nth_run = 2
-            print(worktodo_PP1(n,PP1_B1,B2=0,nth_run=nth_run,how_far_factored=how_far_factored,factors=factors))
-
-        # sleep in order to not stress the server
-        time.sleep(sleep_time)
+                writer.work([l])
+        DEBUG(f"{len(selected)} of {len(candidates)} worktodo lines, {sum(c for _, c, _ in selected):.2f} GHz-days, "
+              f"{sum(p for _, _, p in selected):.3f} expected factors")
+        if delta:
+            # the lines which were not selected are written by a later run
+            written = {l for l, _, _ in selected}
+            for n, lines in ranked.items():
+                previous = delta.get(n)
+                if previous is None:
+                    continue
+                work = previous[2] + [l for l in lines if l in written]
+                digest, planned = pending.get(n, (previous[0], None))
+                if planned is not None and any(l not in work for l in planned):
+                    digest = ""
+                delta.update(n, digest, work)
+    # the exponents which were skipped because their reports could not be fetched are missing from the result
+    errors += STATS.counters["fetch_failed"]
+    if args.workers:
+        write_workers(writer, output, args.workers, memory, args.worker_files, not errors or args.allow_partial)
+    if delta:
+        print(f"{counts['new']} new, {counts['changed']} changed and {counts['unchanged']} unchanged exponents "
+              "since the previous run", file=sys.stderr)
+    return errors
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,558 @@
+#!/usr/bin/python3
+
+# number theory helpers which are shared by get_work.py and construct_examples.py
+
+import math
+import itertools
+import functools
+import random
+import time
+
+# gmpy2 (pip install gmpy2) makes the big-integer arithmetic much faster. It is used if it is installed,
+# the results are exactly the same as with the pure Python fallback. USE_GMPY2 = False switches it off.
+try:
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+USE_GMPY2 = gmpy2 is not None
+
+# a^e mod m
+def powmod(a, e, m):
+    if USE_GMPY2:
+        return int(gmpy2.powmod(a, e, m))
+    return pow(a, e, m)
+
+def gcd(a, b):
+    if USE_GMPY2:
+        return int(gmpy2.gcd(a, b))
+    return math.gcd(a, b)
+
+# a^-1 mod m, a must be coprime to m
+def invert(a, m):
+    if USE_GMPY2:
+        return int(gmpy2.invert(a, m))
+    return pow(a, -1, m)
+
+# residues mod m in the inner loops of brent_rho() and ecm_curve() are converted with this,
+# so that their multiplications and reductions are done by gmpy2 if it is used
+def residue(x):
+    if USE_GMPY2:
+        return gmpy2.mpz(x)
+    return x
+
+# returns a list of all primes p < n (simple sieve of Eratosthenes)
+def small_primes(n):
+    if n <= 2:
+        return []
+    sieve = bytearray([1]) * n
+    sieve[0] = sieve[1] = 0
+    for p in range(2, math.isqrt(n-1) + 1):
+        if sieve[p]:
+            sieve[p*p::p] = bytes(len(range(p*p, n, p)))
+    return list(itertools.compress(range(n), sieve))
+
+# generator which yields all primes start <= p < stop in ascending order
+# This is a segmented sieve of Eratosthenes which only stores odd numbers. Apart from the
+# primes up to sqrt(stop), the memory usage is constant (segment_size bytes).
+def primes_between(start, stop, segment_size=1<<18):
+    start = max(start, 2)
+    if start >= stop:
+        return
+    if start == 2:
+        yield 2
+        start = 3
+    base = small_primes(math.isqrt(stop-1) + 1)[1:] # odd primes only
+    lo = start | 1 # first odd number of the segment
+    while lo < stop:
+        size = min(segment_size, (stop - lo + 1) // 2) # segment[i] represents lo + 2*i
+        hi = lo + 2*size
+        segment = bytearray([1]) * size
+        for p in base:
+            if p*p >= hi:
+                break
+            # first odd multiple of p in the segment which is not p itself
+            m = max(p*p, (lo + p - 1) // p * p)
+            if m % 2 == 0:
+                m += p
+            i = (m - lo) // 2
+            if i < size:
+                segment[i::p] = bytes((size - i - 1) // p + 1)
+        if lo == 1:
+            segment[0] = 0 # 1 is not a prime
+        yield from itertools.compress(range(lo, hi, 2), segment)
+        lo = hi
+
+# product of all numbers, multiplied pairwise in a balanced tree
+# This is much faster than multiplying them one after another if the product is large.
+def balanced_product(numbers):
+    numbers = list(numbers) or [1]
+    while len(numbers) > 1:
+        numbers = [numbers[i] * numbers[i+1] for i in range(0, len(numbers)-1, 2)] + numbers[len(numbers) & ~1:]
+    return numbers[0]
+
+#############################################################################
+# primality test
+#############################################################################
+
+SMALL_PRIMES = small_primes(1000)
+
+# Jacobi symbol (a/n) for odd n > 0
+def jacobi(a, n):
+    assert(n > 0 and n % 2 == 1)
+    a %= n
+    t = 1
+    while a != 0:
+        while a % 2 == 0:
+            a //= 2
+            if n % 8 in (3, 5):
+                t = -t
+        a, n = n, a
+        if a % 4 == 3 and n % 4 == 3:
+            t = -t
+        a %= n
+    return t if n == 1 else 0
+
+# strong probable prime test to base a for odd n > 2
+def is_strong_probable_prime(n, a):
+    d, s = n-1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    x = pow(a, d, n)
+    if x == 1 or x == n-1:
+        return True
+    for _ in range(s-1):
+        x = x*x % n
+        if x == n-1:
+            return True
+    return False
+
+# strong Lucas probable prime test with Selfridge's parameters (method A) for odd n > 2 which is no square
+def is_strong_lucas_probable_prime(n):
+    D = 5
+    while True:
+        j = jacobi(D, n)
+        if j == -1:
+            break
+        if j == 0 and abs(D) != n:
+            return False
+        D = -D-2 if D > 0 else -D+2
+    P, Q = 1, (1-D)//4
+    d, s = n+1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    # U_k, V_k and Q^k for k = 1, then left-to-right binary method up to k = d
+    U, V, Qk = 1, P, Q % n
+    for bit in bin(d)[3:]:
+        U, V, Qk = U*V % n, (V*V - 2*Qk) % n, Qk*Qk % n
+        if bit == "1":
+            U, V = P*U + V, D*U + P*V
+            U = (U + n if U % 2 else U) // 2 % n
+            V = (V + n if V % 2 else V) // 2 % n
+            Qk = Qk*Q % n
+    if U == 0 or V == 0:
+        return True
+    for _ in range(s-1):
+        V, Qk = (V*V - 2*Qk) % n, Qk*Qk % n
+        if V == 0:
+            return True
+    return False
+
+# Baillie-PSW test for odd n without small factors, gmpy2 implements the same test
+def bpsw(n):
+    if USE_GMPY2:
+        return bool(gmpy2.is_strong_bpsw_prp(n))
+    if not is_strong_probable_prime(n, 2):
+        return False
+    if math.isqrt(n)**2 == n:
+        return False
+    return is_strong_lucas_probable_prime(n)
+
+# numbers with more bits are remembered by isprime(), as the same factors and cofactors
+# are tested again and again (e.g. by factorize() and the search for smooth primes)
+PRIME_MEMO_BITS = 128
+
+@functools.lru_cache(maxsize=4096)
+def bpsw_memo(n):
+    return bpsw(n)
+
+# Baillie-PSW test. There is no known composite number for which it returns True,
+# and it has been verified that there is none below 2^64.
+def isprime(n):
+    if n < 2:
+        return False
+    for p in SMALL_PRIMES:
+        if n % p == 0:
+            return n == p
+    if n < SMALL_PRIMES[-1]**2:
+        return True
+    if n.bit_length() > PRIME_MEMO_BITS:
+        return bpsw_memo(n)
+    return bpsw(n)
+
+# returns the smallest prime > n
+def next_prime(n):
+    if USE_GMPY2:
+        # gmpy2 uses Miller-Rabin, which never misses a prime, so isprime() gives the same result
+        p = int(gmpy2.next_prime(n))
+        while not isprime(p):
+            p = int(gmpy2.next_prime(p))
+        return p
+    p = max(n + 1, 2)
+    if p > 2 and p % 2 == 0:
+        p += 1
+    while not isprime(p):
+        p += 1 if p == 2 else 2
+    return p
+
+#############################################################################
+# factorization
+#############################################################################
+
+# returns the pairwise coprime numbers > 1 which can be obtained from `numbers` by gcds and divisions,
+# i.e. every prime which divides one of the numbers divides exactly one element of the result.
+# This is used to split composite factors reported by the server, e.g. [a, a*b] -> [a, b].
+def coprime_base(numbers):
+    base = []
+    todo = [x for x in numbers if x > 1]
+    while todo:
+        x = todo.pop()
+        for i, b in enumerate(base):
+            g = gcd(x, b)
+            if g > 1:
+                # replace b and x by b/g, x/g and g; the product decreases, so this terminates
+                base[i] = base[-1]
+                base.pop()
+                todo.extend(y for y in (g, b//g, x//g) if y > 1)
+                break
+        else:
+            base.append(x)
+    return sorted(base)
+
+# P-1 stage 1. Factors of Mersenne numbers are q = 2*k*n+1, so q-1 is divisible by 2*n
+# and it is enough that k is B1-smooth if the exponent n is passed.
+# returns a proper factor of m or None, also None if the deadline was reached
+def pminus1(m, B1, exponent=1, deadline=None):
+    a = powmod(3, 2*exponent, m)
+    checkpoint = 1000
+    chunk = 1
+    for p in primes_between(2, B1+1):
+        pk = p
+        while pk * p <= B1:
+            pk *= p
+        chunk *= pk
+        if p >= checkpoint or chunk.bit_length() > 4096:
+            a = powmod(a, chunk, m)
+            chunk = 1
+            if deadline_reached(deadline):
+                return None
+        if p >= checkpoint:
+            g = gcd(a-1, m)
+            if g == m:
+                return None
+            if g > 1:
+                return g
+            checkpoint *= 10
+    a = powmod(a, chunk, m)
+    g = gcd(a-1, m)
+    return g if 1 < g < m else None
+
+# Pollard rho with Brent's cycle detection, using random starting values from rng
+# returns a proper factor of m or None if none was found after max_iterations
+def brent_rho(m, rng, max_iterations):
+    y, c = rng.randrange(1, m), rng.randrange(1, m-2)
+    y, c, m = residue(y), residue(c), residue(m)
+    g, r, q = 1, 1, 1
+    x = ys = y
+    while g == 1:
+        x = y
+        for _ in range(r):
+            y = (y*y + c) % m
+        k = 0
+        while k < r and g == 1:
+            ys = y
+            for _ in range(min(128, r-k)):
+                y = (y*y + c) % m
+                q = q * abs(x-y) % m
+            g = gcd(q, m)
+            k += 128
+        r *= 2
+        if r > max_iterations and g == 1:
+            return None
+    if g == m:
+        # we collected too many differences at once, go back step by step
+        g = 1
+        while g == 1:
+            ys = (ys*ys + c) % m
+            g = gcd(abs(x-ys), m)
+    return g if g != m else None
+
+# arithmetic on Montgomery curves B*y^2 = x^3 + A*x^2 + x in projective (X:Z) coordinates, a24 = (A+2)/4
+def ecm_double(X, Z, a24, m):
+    s, d = (X+Z)**2 % m, (X-Z)**2 % m
+    t = s - d
+    return s*d % m, t*(d + a24*t) % m
+
+# returns P+Q, given P, Q and P-Q
+def ecm_add(XP, ZP, XQ, ZQ, Xd, Zd, m):
+    u = (XP-ZP)*(XQ+ZQ)
+    v = (XP+ZP)*(XQ-ZQ)
+    return Zd*(u+v)**2 % m, Xd*(u-v)**2 % m
+
+# returns k*P with the Montgomery ladder
+def ecm_multiply(k, X, Z, a24, m):
+    R0, R1 = (X, Z), ecm_double(X, Z, a24, m)
+    for bit in bin(k)[3:]:
+        if bit == "1":
+            R0, R1 = ecm_add(*R1, *R0, X, Z, m), ecm_double(*R1, a24, m)
+        else:
+            R0, R1 = ecm_double(*R0, a24, m), ecm_add(*R1, *R0, X, Z, m)
+    return R0
+
+# product of all maximal prime powers p^k <= B1
+@functools.lru_cache(maxsize=16)
+def prime_power_product(B1):
+    k = 1
+    for p in primes_between(2, B1+1):
+        pk = p
+        while pk * p <= B1:
+            pk *= p
+        k *= pk
+    return k
+
+# the same product split into numbers of about ECM_CHUNK_BITS bits, so that ecm_curve() can check its deadline
+# between them. Multiplying the point by one chunk after the other gives the same point as by the whole product.
+ECM_CHUNK_BITS = 1 << 14
+
+@functools.lru_cache(maxsize=16)
+def prime_power_chunks(B1):
+    chunks = []
+    k = 1
+    for p in primes_between(2, B1+1):
+        pk = p
+        while pk * p <= B1:
+            pk *= p
+        k *= pk
+        if k.bit_length() > ECM_CHUNK_BITS:
+            chunks.append(k)
+            k = 1
+    if k > 1:
+        chunks.append(k)
+    return chunks
+
+# one ECM curve (Suyama's parametrization) with stage 1 bound B1 and stage 2 bound B2
+# returns a proper factor of m or None, also None if the deadline was reached
+def ecm_curve(m, B1, B2, rng, deadline=None):
+    sigma = rng.randrange(6, m-1)
+    sigma, m = residue(sigma), residue(m)
+    u, v = (sigma*sigma - 5) % m, 4*sigma % m
+    X, Z = u*u*u % m, v*v*v % m
+    denominator = 16 * X * v % m
+    g = gcd(denominator, m)
+    if g > 1:
+        return g if g < m else None
+    a24 = (v-u)**3 % m * (3*u+v) * residue(invert(denominator, m)) % m
+
+    # stage 1
+    for k in prime_power_chunks(B1):
+        X, Z = ecm_multiply(k, X, Z, a24, m)
+        if deadline_reached(deadline):
+            return None
+    g = gcd(Z, m)
+    if g > 1:
+        return g if g < m else None
+
+    # stage 2 (baby-step giant-step): every prime B1 < q <= B2 is written as q = i*D +- j and
+    # X(iD*P)*Z(j*P) - X(j*P)*Z(iD*P) is accumulated, which is 0 mod p if q*P is the neutral element mod p
+    D = 210
+    baby = {1: (X, Z)} # j -> j*P for odd j < D/2
+    P2 = ecm_double(X, Z, a24, m)
+    baby[3] = ecm_add(*P2, X, Z, X, Z, m)
+    for j in range(5, D//2, 2):
+        baby[j] = ecm_add(*baby[j-2], *P2, *baby[j-4], m)
+    PD = ecm_multiply(D, X, Z, a24, m)
+    i = max(1, (B1 + D//2) // D)
+    previous = ecm_multiply((i-1)*D, X, Z, a24, m) if i > 1 else None
+    current = ecm_multiply(i*D, X, Z, a24, m)
+    g = 1
+    for q in primes_between(B1+1, B2+1):
+        while q > i*D + D//2:
+            # next giant step, (i+1)*D*P = i*D*P + D*P with difference (i-1)*D*P
+            if previous is None:
+                previous, current = current, ecm_double(*current, a24, m)
+            else:
+                previous, current = current, ecm_add(*current, *PD, *previous, m)
+            i += 1
+            if deadline_reached(deadline):
+                return None
+        Xj, Zj = baby[abs(q - i*D)]
+        g = g * (current[0]*Zj - Xj*current[1]) % m
+    g = gcd(g, m)
+    return g if 1 < g < m else None
+
+# ECM parameters (B1, number of curves) which are tried in this order, see ECMBOUNDS in planner.py
+ECM_SCHEDULE = [(2000, 25), (11000, 90), (50000, 300), (250000, 700), (1000000, 1800), (3000000, 5100)]
+
+# deadline is a time.monotonic() value or None for no deadline
+def deadline_reached(deadline):
+    return deadline is not None and time.monotonic() > deadline
+
+# returns a proper factor of the composite number m or None if the deadline was reached
+def find_factor(m, rng, deadline=None, exponent=1):
+    for p in SMALL_PRIMES:
+        if m % p == 0:
+            return p
+    r = math.isqrt(m)
+    if r*r == m:
+        return r
+    # P-1 finds factors which have been found by P-1 before (and many TF factors)
+    f = pminus1(m, 100000, exponent, deadline)
+    if f:
+        return f
+    if deadline_reached(deadline):
+        return None
+    # rho is the fastest method for small factors
+    for _ in range(3):
+        f = brent_rho(m, rng, 1 << 16)
+        if f:
+            return f
+        if deadline_reached(deadline):
+            return None
+    # ECM with increasing bounds for the large ones
+    for B1, curves in ECM_SCHEDULE:
+        for _ in range(curves):
+            f = ecm_curve(m, B1, 50*B1, rng, deadline)
+            if f:
+                return f
+            if deadline_reached(deadline):
+                return None
+    # give up, this should not happen with reported factors
+    return None
+
+# returns the sorted list of prime factors of n (with multiplicity)
+# if a timeout (in seconds) is given and reached, the remaining composite cofactors are returned as they are.
+# exponent can be passed if n is a divisor of 2^exponent-1, this speeds up the P-1 stage.
+def factorize(n, timeout=None, exponent=1):
+    deadline = None if timeout is None else time.monotonic() + timeout
+    rng = random.Random(n) # same result for the same number
+    factors = []
+    todo = [n] if n > 1 else []
+    while todo:
+        m = todo.pop()
+        if isprime(m):
+            factors.append(m)
+            continue
+        f = find_factor(m, rng, deadline, exponent)
+        if f is None:
+            factors.append(m)
+        else:
+            todo += [f, m//f]
+    return sorted(factors)
+
+#############################################################################
+# batch smoothness test
+#############################################################################
+
+# product tree of the numbers: tree[0] are the numbers and tree[k+1][i] = tree[k][2i] * tree[k][2i+1]
+# (the last number of a level with odd length is taken over as it is), tree[-1] is [product of all numbers]
+def product_tree(numbers):
+    tree = [list(numbers) or [1]]
+    while len(tree[-1]) > 1:
+        level = tree[-1]
+        tree.append([level[i] * level[i+1] for i in range(0, len(level)-1, 2)] + level[len(level) & ~1:])
+    return tree
+
+# returns [n mod x for x in tree[0]] by reducing n down the product tree (remainder tree),
+# which is much faster than reducing the large number n modulo every x
+def remainder_tree(n, tree):
+    remainders = [n % tree[-1][0]]
+    for level in reversed(tree[:-1]):
+        remainders = [remainders[i // 2] % x for i, x in enumerate(level)]
+    return remainders
+
+# returns for every number x >= 1 if it is B1-smooth except for at most one prime factor <= B2,
+# i.e. if P-1 (P+1) with the bounds B1 and B2 finds a prime p with p-1 = x (p+1 = x).
+# This is Bernstein's batch test ("How to find smooth parts of integers"): the product P of the primes up to B1
+# is reduced modulo all numbers with a remainder tree, then gcd(x, (P mod x)^(2^e)) with 2^e >= log2(x)
+# is the B1-smooth part of x. Only the remaining cofactors have to be checked, no number is factored.
+def batch_smooth(numbers, B1, B2):
+    numbers = list(numbers)
+    if not numbers:
+        return []
+    smooth = []
+    for x, r in zip(numbers, remainder_tree(prime_power_product(B1), product_tree(numbers))):
+        e = max(x.bit_length() - 1, 1).bit_length()
+        cofactor = x // gcd(x, powmod(r, 1 << e, x))
+        smooth.append(cofactor == 1 or (cofactor <= B2 and isprime(cofactor)))
+    return smooth
+
+# step width and range of the table of the Dickman rho function
+DICKMAN_STEPS = 256 # per unit of u
+DICKMAN_MAX_U = 40
+
+# table of rho(i / DICKMAN_STEPS) for 0 <= i <= DICKMAN_MAX_U * DICKMAN_STEPS, solving the integral
+# equation u*rho(u) = integral of rho(t) from u-1 to u with the trapezoidal rule. The sum over the
+# window is updated at every step, but its rounding error stays at about 1e-17 while rho falls to
+# 1e-73 at u = 40. So it is summed up again once per unit of u, which keeps the error relative.
+@functools.lru_cache(maxsize=1)
+def dickman_table():
+    h, N = 1 / DICKMAN_STEPS, DICKMAN_STEPS
+    rho = [1.] * (N + 1)
+    inner = sum(rho[1:N]) # sum of rho[i-N+1], ..., rho[i-1]
+    for i in range(N + 1, DICKMAN_MAX_U * N + 1):
+        if i % N == 0:
+            inner = math.fsum(rho[i-N+1:i])
+        else:
+            inner += rho[i-1] - rho[i-N]
+        rho.append(h * (rho[i-N] / 2 + inner) / (i*h - h/2))
+    return rho
+
+# Dickman's rho function, i.e. the probability that a random integer N is N^(1/u)-smooth
+def dickman_rho(u):
+    if u <= 1:
+        return 1.
+    if u >= DICKMAN_MAX_U:
+        return 0.
+    rho = dickman_table()
+    i, frac = divmod(u * DICKMAN_STEPS, 1)
+    i = int(i)
+    return rho[i] + frac * (rho[i+1] - rho[i])
+
+# resolution and range of the semismooth table
+SEMISMOOTH_STEPS = 32 # per unit of u and r
+SEMISMOOTH_MAX_R = 4
+
+# table of the probability that a random integer N is B1-smooth except for at most one prime factor below B2
+# (Buchstab), depending on u = log(N)/log(B1) and r = log(B2)/log(B1):
+#     sigma(u, r) = rho(u) + integral of rho(u-t)/t for t from 1 to min(r, u)
+# as the largest prime factor N^(t/u) has probability rho(u-t)/t dt.
+# table[j][i] is sigma(i/SEMISMOOTH_STEPS, 1 + j/SEMISMOOTH_STEPS), u <= DICKMAN_MAX_U and r <= SEMISMOOTH_MAX_R
+@functools.lru_cache(maxsize=1)
+def semismooth_table():
+    S, h = SEMISMOOTH_STEPS, 1 / SEMISMOOTH_STEPS
+    rho = [dickman_rho(i * h) for i in range(DICKMAN_MAX_U * S + 1)]
+    table = [rho]
+    # every row adds the integral from t-h to t with the trapezoidal rule, where u >= t
+    for j in range(1, (SEMISMOOTH_MAX_R - 1) * S + 1):
+        t = 1 + j*h
+        previous = table[-1]
+        row = previous[:S+j]
+        row += [previous[i] + h/2 * (rho[i-S-j+1] / (t-h) + rho[i-S-j] / t) for i in range(S+j, len(rho))]
+        table.append(row)
+    return table
+
+# sigma(u, r) from the semismooth table with bilinear interpolation
+def semismooth(u, r):
+    if u <= 1:
+        return 1.
+    if u >= DICKMAN_MAX_U:
+        return 0.
+    table = semismooth_table()
+    x = u * SEMISMOOTH_STEPS
+    y = (min(max(r, 1.), SEMISMOOTH_MAX_R) - 1) * SEMISMOOTH_STEPS
+    i, j = int(x), min(int(y), len(table) - 2)
+    x, y = x - i, y - j
+    low = table[j][i] + x * (table[j][i+1] - table[j][i])
+    high = table[j+1][i] + x * (table[j+1][i+1] - table[j+1][i])
+    return low + y * (high - low)
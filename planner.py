@@ -0,0 +1,1006 @@
+#!/usr/bin/python3
+
+# This is the planning part of get_work.py, which can be imported without querying the server:
+#
+#     report = parse_report(n, lines)   # lines of the report_exponent text report for exponent n
+#     status = make_status(n, report)   # compact summary of the work which has been done
+#     lines  = plan(status)             # worktodo lines which should be done next
+
+import re
+import datetime
+import math
+import bisect
+import functools
+import hashlib
+import json
+from numbertheory import factorize, coprime_base, balanced_product, semismooth, semismooth_table, powmod
+from numbertheory import DICKMAN_MAX_U, SEMISMOOTH_STEPS, SEMISMOOTH_MAX_R
+try:
+    import numpy
+except ImportError:
+    numpy = None # optimal_bounds() is much slower without it
+
+# raised if a line of the report cannot be parsed
+class ParseError(Exception):
+    pass
+
+# Bounds defined by gut feeling.
+# see also posting by ATH at https://mersenneforum.org/showthread.php?t=26750 where he suggests:
+#
+#	      No known factors	     With known factors
+#Exponent       P-1 B1  P+1 B1          P-1 B1  P+1 B1
+#50K-250K 	100M	50M		30M 	15M
+#250K-500K	 30M	15M		15M	 8M
+#500K-1M		 15M	 8M		10M	 5M
+#
+def PM1_B1_should(n, known_factors=False):
+    if known_factors == False:
+        if n<  100000: return 250000000
+        if n<  250000: return 100000000
+        if n<  500000: return  30000000
+        if n< 1000000: return  15000000
+        if n< 4000000: return   5000000
+        if n<10000000: return   2500000
+        return                  2000000
+    else:
+        if n<  100000: return 100000000
+        if n<  250000: return  30000000
+        if n<  500000: return  15000000
+        if n< 1000000: return  10000000
+        if n< 4000000: return   5000000
+        if n<10000000: return   2500000
+        return                  2000000
+
+def PP1_B1_should(n, known_factors=False):
+    # half of P-1 bound
+    return PM1_B1_should(n, known_factors) // 2
+
+# takes a string like "2020-02-12" as input, returns True if it was less than 3 months ago.
+def is_recent(datestr):
+    age_days = (datetime.datetime.now() - datetime.datetime.strptime(datestr, "%Y-%m-%d")).days
+    return age_days <= 90
+
+ECMBOUNDS = [  (11000,100,20), \
+                (50000,280,25), \
+                (250000,640,30), \
+                (1000000,1580,35), \
+                (3000000,4700,40), \
+                (11000000,9700,45), \
+                (44000000,17100,50), \
+                (110000000,46500,55), \
+                (260000000,112000,60), \
+                (800000000,360000,65)]
+# (minB1, desired, digits): `desired` curves with B1=minB1 and B2=100*minB1 find a factor with
+# `digits` digits with probability 1-exp(-1), which is called t<digits> (e.g. t25)
+
+# the group order of a curve behaves like a random number which is this many times smaller than the factor
+# (Montgomery's estimate for the torsion of Suyama's parametrization)
+ECM_SMOOTHNESS = 23.4
+
+LN10 = math.log(10)
+
+# returns the number of curves at every ECMBOUNDS level which are equivalent to one curve with bounds B1 and B2,
+# i.e. the ratio of the probabilities to find a factor with the level's number of digits.
+# Curves with a smaller B1 get partial credit, a larger B2 counts as well. This is a lookup table,
+# there are only a few different bounds in practice.
+@functools.lru_cache(maxsize=None)
+def ecm_curve_equivalents(B1, B2):
+    equivalents = []
+    for minB1, desired, digits in ECMBOUNDS:
+        log_N = digits * LN10 - math.log(ECM_SMOOTHNESS)
+        equivalents.append(smooth_probability(log_N, B1, B2) / smooth_probability(log_N, minB1, 100*minB1))
+    return tuple(equivalents)
+
+# returns the ECM level in digits, e.g. 30.0 if t30 is done exactly (see ECMBOUNDS) and about 31.5 if twice
+# as many curves are done. ecm[i] is the number of curves which are equivalent to curves of ECMBOUNDS[i],
+# see ecm_curve_equivalents(). The level is interpolated between the levels where the fraction of the
+# desired curves crosses 1, the logarithm of this fraction is almost linear in the number of digits.
+def get_ecm_level(ecm):
+    done = [max(ecm[i] / desired, 1e-300) for i, (minB1, desired, digits) in enumerate(ECMBOUNDS)]
+    if done[0] <= 1e-300:
+        return 0.
+    # first level which is not done, or the last one to extrapolate
+    i = next((i for i in range(1, len(done)) if done[i] < 1), len(done) - 1)
+    low, high = ECMBOUNDS[i-1][2], ECMBOUNDS[i][2]
+    level = low + (high - low) * math.log(done[i-1]) / math.log(done[i-1] / done[i])
+    return max(level, 0.)
+
+# returns t30 B1 bound where you should continue when having t25 completed
+def ecm_level_to_B1(level):
+    B1 = 1000000000000 # larger than any reasonable B1 bound
+    for minB1, desired, digits in ECMBOUNDS:
+        if level < digits:
+            B1 = min(B1, minB1)
+    return B1
+
+def worktodo_PM1(n,B1,B2=None, how_far_factored=67, factors=[]):
+    assert(B1 >= 11000)
+    if factors:
+        factors = ",\"" + ",".join([str(f) for f in factors]) + "\""
+    else:
+        factors = ""
+    if B2:
+        assert(B1 <= B2 and B2 <= 100000 * B1)
+    else:
+        B2 = 0
+    return f"Pminus1=N/A,1,2,{n},-1,{B1},{B2},{how_far_factored}" + factors
+
+def worktodo_PP1(n,B1,B2=None,nth_run=1, how_far_factored=67, factors=[]):
+    assert(B1 >= 11000)
+    if factors:
+        factors = ",\"" + ",".join([str(f) for f in factors]) + "\""
+    else:
+        factors = ""
+    if B2:
+        assert(B1 <= B2 and B2 <= 100000 * B1)
+    else:
+        B2 = 0
+    return f"Pplus1=N/A,1,2,{n},-1,{B1},{B2},{nth_run},{how_far_factored}" + factors
+
+# structured result of parse_report()
+class Report:
+    __slots__ = ("factors", "ecm", "pm1", "pp1", "tf", "last_date", "cofactor_prp")
+    def __init__(self):
+        self.factors = set()
+        self.ecm = {}       # (B1, B2) : count
+        self.pm1 = set()    # (B1, B2, E)
+        self.pp1 = set()    # (B1, B2, start1, start2)
+        self.tf = 0         # bit i is set if [2^(i-1); 2^(i)] was trial factored
+        self.last_date = "" # most recent date of an assignment or result, "YYYY-MM-DD"
+        self.cofactor_prp = False # True if the server reports that the cofactor is a probable prime
+
+# returns a bit mask with bits low, ..., high-1 set
+def tf_bits(low, high):
+    return (1 << high) - (1 << low)
+
+def add_ecm(report, c, B1, B2):
+    assert(B1 <= B2)
+    assert(c >= 0) # actually, there are entries where count == 0
+    report.ecm[(B1,B2)] = report.ecm.get((B1,B2), 0) + c
+
+def add_pm1(report, B1, B2, E):
+    assert(B1 <= B2)
+    assert(E in [0,6,12,30,48])
+    report.pm1.add( (B1,B2,E) )
+
+def add_pp1(report, B1, B2, start1, start2):
+    assert(B1 <= B2)
+    report.pp1.add( (B1,B2,start1,start2) )
+
+# every line is "<exponent>\t<record type>\t<data>"
+# The handlers for the record types are called with (report, data, line), None means that the record is ignored.
+# History lines are dispatched again on their worktype, see HISTORY_HANDLERS.
+
+def parse_factored(report, data, l):
+    #41681   Factored        1052945423;16647332713153;2853686272534246492102086015457
+    report.factors.update(int(f) for f in data.split(";"))
+
+def parse_unfactored(report, data, l):
+    #100000007	Unfactored	2^79
+    assert(data.startswith("2^"))
+    report.tf |= tf_bits(0, int(data[2:]))
+
+RE_PM1 = re.compile(r"^B1=([0-9]+)(?:,B2=([0-9]+))?(?:,E=([0-9]+))?$")
+def parse_pm1(report, data, l):
+    #100000007	PM1	B1=5000000,B2=150000000
+    m = RE_PM1.match(data)
+    if not m:
+        raise ParseError(f"could not parse PM1 result \"{data}\" in line \"{l}\"")
+    B1, B2, E = m.groups()
+    add_pm1(report, int(B1), int(B2 or B1), int(E or 0))
+
+def parse_prp_cofactor(report, data, l):
+    #41681   PRPCofactor     Verified (Factored);2017-11-09;kkmrkkblmbrbk;PRP_PRP_PRP_PRP_;3;37261;1;3
+    # "(Factored)" means that the cofactor is a probable prime, i.e. the number is fully factored
+    if "(Factored)" in data[:data.find(";")]:
+        report.cofactor_prp = True
+
+def parse_assigned(report, data, l):
+    # 41081	Assigned	2017-10-09;Chang Chia-Tche;PRP test;;0.0;updated on 2017-10-09;expired on 2017-10-13
+    date = data[:data.find(";")]
+    if date > report.last_date:
+        report.last_date = date
+
+def parse_history(report, data, l):
+    h = data.split(";")
+    if h[0] > report.last_date:
+        report.last_date = h[0]
+    worktype, result = h[2], h[3]
+    if worktype not in HISTORY_HANDLERS:
+        raise ParseError(f"unknown worktype {worktype}")
+    handler = HISTORY_HANDLERS[worktype]
+    if handler:
+        handler(report, result, l)
+
+RECORD_HANDLERS = {
+    "Factored":    parse_factored,
+    "PRPCofactor": parse_prp_cofactor,
+    "Unfactored":  parse_unfactored,
+    # 100000007	LL	Verified;2018-02-26;G0rfi3ld;F9042256B193FAA0;3178317
+    "LL":          None,
+    # 20825573	PRP	Verified;2020-10-12;gLauss;738AD2BB0D72E3AA;1276614;1;3
+    "PRP":         None,
+    "PM1":         parse_pm1,
+    "Assigned":    parse_assigned,
+    "History":     parse_history,
+}
+
+def parse_factor(report, result, l):
+    # 41681   History 2015-04-26;Serge Batalov;F-ECM;Factor: 2853686272534246492102086015457
+    # 41681   History 2008-08-26;-Anonymous-;F;Factor: 16647332713153
+    report.factors.add(int(result.split(" ")[1]))
+
+RE_NF = re.compile(r"^no factor (?:from 2\^([0-9]+)[ ]*)?to 2\^([0-9]+)[ ]*$")
+def parse_nf(report, result, l):
+    # 100000007	History	2007-07-04;ComputerraRU;NF;no factor to 2^50
+    m = RE_NF.match(result)
+    if not m:
+        raise ParseError(f"could not parse NF result \"{result}\" in line \"{l}\"")
+    low, high = m.groups()
+    report.tf |= tf_bits(int(low or 0), int(high))
+
+RE_NF_ECM = re.compile(r"^([0-9]+) curves?, B1=([0-9]+)(?:, B2=([0-9]+)$)?")
+def parse_nf_ecm(report, result, l):
+    # 41681   History 2011-01-23;James Hintz;NF-ECM;3 curves, B1=250000, B2=25000000
+    m = RE_NF_ECM.match(result)
+    if not m:
+        raise ParseError(f"could not parse NF-ECM result \"{result}\" in line \"{l}\"")
+    c, B1, B2 = m.groups()
+    add_ecm(report, int(c), int(B1), int(B2 or B1))
+
+RE_NF_PM1 = re.compile(r"^B1=([0-9]+)(?:, B2=([0-9]+))?(?:, E=([0-9]+))?$")
+def parse_nf_pm1(report, result, l):
+    # 3999971	History	2018-12-21;Jocelyn Larouche;NF-PM1;B1=3999971, B2=399997100, E=12
+    m = RE_NF_PM1.match(result)
+    if not m:
+        raise ParseError(f"could not parse NF-PM1 result \"{result}\" in line \"{l}\"")
+    B1, B2, E = m.groups()
+    add_pm1(report, int(B1), int(B2 or B1), int(E or 0))
+
+RE_F_PM1 = re.compile(r"^Factor: ([0-9]+)(?: / \(P-1, B1=([0-9]+)(?:, B2=([0-9]+))?(?:, E=([0-9]+))?\))?$")
+def parse_f_pm1(report, result, l):
+    # 123031	History	2013-08-29;BloodIce;F-PM1;Factor: 3158950722867400921
+    # 2000177	History	2019-01-15;Jocelyn Larouche;F-PM1;Factor: 131059942116526306804441369 / (P-1, B1=1000000)
+    m = RE_F_PM1.match(result)
+    if not m:
+        raise ParseError(f"Could not parse F-PM1 result \"{result}\" in line \"{l}\"")
+    f, B1, B2, E = m.groups()
+    report.factors.add(int(f))
+    if B1:
+        report.pm1.add( (int(B1), int(B2 or B1), int(E or 0)) )
+
+RE_F_PP1 = re.compile(r"^Start=([0-9]+)/([0-9]+), B1=([0-9]+), B2=([0-9]+), Factor: ([0-9]+)$")
+def parse_f_pp1(report, result, l):
+    m = RE_F_PP1.match(result)
+    if not m:
+        raise ParseError(f"could not parse F-PP1 result \"{result}\" in line \"{l}\"")
+    start1, start2, B1, B2, f = map(int, m.groups())
+    report.factors.add(f)
+    add_pp1(report, B1, B2, start1, start2)
+
+RE_NF_PP1 = re.compile(r"^Start=([0-9]+)/([0-9]+), B1=([0-9]+)(?:, B2=([0-9]+))?$")
+def parse_nf_pp1(report, result, l):
+    # 41017	History	2021-04-27;gLauss;NF-PP1;Start=2/7, B1=10000000, B2=1000000000
+    m = RE_NF_PP1.match(result)
+    if not m:
+        raise ParseError(f"could not parse NF-PP1 result \"{result}\" in line \"{l}\"")
+    start1, start2, B1, B2 = m.groups()
+    add_pp1(report, int(B1), int(B2 or B1), int(start1), int(start2))
+
+HISTORY_HANDLERS = {
+    "F":      parse_factor,
+    "F-ECM":  parse_factor,
+    # we don't care for factorization purposes
+    "CERT":   None,
+    "C-PRP":  None,
+    "C-LL":   None,
+    "NF":     parse_nf,
+    "NF-ECM": parse_nf_ecm,
+    "NF-PM1": parse_nf_pm1,
+    "F-PM1":  parse_f_pm1,
+    "F-PP1":  parse_f_pp1,
+    "NF-PP1": parse_nf_pp1,
+}
+
+# parses the lines of the report for exponent n, returns a Report
+def parse_report(n, lines):
+    report = Report()
+    exponent = str(n)
+    for l in lines:
+        fields = l.split("\t", 2)
+        if len(fields) != 3 or fields[0] != exponent or fields[1] not in RECORD_HANDLERS:
+            raise ParseError(f"could not parse line \"{l}\"")
+        handler = RECORD_HANDLERS[fields[1]]
+        if handler:
+            handler(report, fields[2], l)
+    return report
+
+# returns (last_date, digest) of the report of an exponent without parsing it:
+# the most recent date of an assignment or result ("YYYY-MM-DD" or "") and a hash of all records.
+# If the digest did not change, the exponent has the same status as before,
+# but it may have stopped being recent (see is_recent()) in the meantime.
+def fingerprint(lines):
+    last_date = ""
+    for l in lines:
+        fields = l.split("\t", 2)
+        if len(fields) == 3 and fields[1] in ("History", "Assigned"):
+            date = fields[2][:fields[2].find(";")]
+            if date > last_date:
+                last_date = date
+    # the order of the records does not matter
+    digest = hashlib.sha1("\n".join(sorted(lines)).encode("utf-8")).hexdigest()
+    return last_date, digest
+
+# parses a P-1 or P+1 line for a Mersenne number as written by worktodo_PM1() / worktodo_PP1()
+#     Pminus1=[AID,]1,2,n,-1,B1,B2[,how_far_factored][,"factors"]
+#     Pplus1=[AID,]1,2,n,-1,B1,B2,nth_run[,how_far_factored][,"factors"]
+# or a P-1 line of Prime95 for which Prime95 chooses the bounds itself
+#     Pfactor=[AID,]1,2,n,-1,how_far_factored,tests_saved[,"factors"]
+# returns (worktype, n, B1, B2, nth_run, how_far_factored) or None for all other lines.
+# nth_run is None for P-1, how_far_factored is None if it is missing. B1 and B2 are None for Pfactor,
+# and Pfactor lines with tests_saved=0 are None as well, because Prime95 does no P-1 for them.
+def parse_worktodo_line(l):
+    l = l.strip()
+    worktype, eq, args = l.partition("=")
+    if not eq or worktype not in ("Pminus1", "Pplus1", "Pfactor"):
+        return None
+    args = args.partition("\"")[0].rstrip(",").split(",") # the known factors are quoted
+    if args[0] == "N/A" or len(args[0]) == 32:
+        args = args[1:] # assignment ID
+    try:
+        if worktype == "Pfactor":
+            k, b, n, c, how_far_factored = map(int, args[:5])
+            tests_saved = float(args[5])
+        else:
+            k, b, n, c, B1, B2 = map(int, args[:6])
+            rest = [int(a) for a in args[6:]]
+    except (ValueError, IndexError):
+        raise ParseError(f"could not parse worktodo line \"{l}\"")
+    if (k, b, c) != (1, 2, -1):
+        return None # not a Mersenne number
+    if worktype == "Pfactor":
+        return (worktype, n, None, None, None, how_far_factored) if tests_saved > 0 else None
+    nth_run = None
+    if worktype == "Pplus1":
+        nth_run = rest.pop(0) if rest else 1
+    return worktype, n, B1, B2, nth_run, rest[0] if rest else None
+
+# index of the P-1 / P+1 work which is known locally but not (yet) to the server, i.e. lines of a
+# Prime95 worktodo.txt and results which have not been reported yet. merge() adds it to a Report,
+# so that the same work is not generated again.
+#
+#     local = LocalWork()
+#     local.read_worktodo(open("worktodo.txt"))
+#     local.read_results(open("results.json.txt"))
+#     report = parse_report(n, lines)
+#     local.merge(n, report)
+class LocalWork:
+    def __init__(self):
+        self.pm1 = {} # n -> set of (B1, B2, E) like Report.pm1
+        self.pp1 = {} # n -> set of (B1, B2, start1, start2) like Report.pp1
+
+    def add_pm1(self, n, B1, B2, E=0):
+        self.pm1.setdefault(n, set()).add( (B1, max(B1, B2), E) )
+
+    def add_pp1(self, n, B1, B2, start1=0, start2=0):
+        self.pp1.setdefault(n, set()).add( (B1, max(B1, B2), start1, start2) )
+
+    # B2=0 lets Prime95 choose B2, it is counted as a run without stage 2 to be on the safe side.
+    # The bounds of Pfactor lines are not known, they are counted as a run with the bounds of optimal_bounds(),
+    # which are close to the ones Prime95 chooses and to the ones of the "classic" policy.
+    # lines of other worktypes, comments and [Worker #1] sections are ignored.
+    def read_worktodo(self, f):
+        for l in f:
+            work = parse_worktodo_line(l)
+            if work is None:
+                continue
+            worktype, n, B1, B2, nth_run, how_far_factored = work
+            if worktype == "Pfactor":
+                B1, B2 = optimal_bounds(n, how_far_factored) or (PM1_B1_should(n, False),)*2
+                self.add_pm1(n, B1, B2)
+            elif worktype == "Pminus1":
+                self.add_pm1(n, B1, B2)
+            else:
+                # nth_run 1 and 2 are the start values 2/7 and 6/5, 3 is random
+                self.add_pp1(n, B1, B2, {1: 2, 2: 6}.get(nth_run, 0), {1: 7, 2: 5}.get(nth_run, 0))
+
+    # results.json.txt (one JSON object per line) and results.txt of Prime95 can be mixed, e.g.
+    #     {"status":"NF", "exponent":100019, "worktype":"P-1", "b1":1000000, "b2":30000000, ...}
+    #     {"status":"NF", "exponent":100019, "worktype":"P+1", "b1":500000, "b2":50000000, "start":"2/7", ...}
+    #     M100019 completed P-1, B1=1000000, B2=30000000, E=12, Wh8: 1A2B3C4D, AID: ...
+    #     UID: user/host, M100019 has a factor: 1800343 (P-1, B1=1000000, B2=30000000, E=12)
+    # Only lines mentioning P-1 or P+1 are parsed at all, everything else is skipped by a substring test.
+    # returns the number of lines mentioning P-1 or P+1 which could not be parsed
+    def read_results(self, f):
+        unknown = 0
+        for l in f:
+            if "P-1" in l:
+                method = "P-1"
+            elif "P+1" in l:
+                method = "P+1"
+            else:
+                continue
+            l = l.strip()
+            if l.startswith("{"):
+                try:
+                    r = json.loads(l)
+                    if r.get("k", 1) != 1 or r.get("b", 2) != 2 or r.get("c", -1) != -1:
+                        continue
+                    n, B1, B2 = int(r["exponent"]), int(r["b1"]), int(r.get("b2", r["b1"]))
+                    E = int(r.get("brent-suyama", 0))
+                    start1, _, start2 = str(r.get("start", "0/0")).partition("/")
+                    start1, start2 = int(start1), int(start2)
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    unknown += 1 # not a P-1 / P+1 result of a Mersenne number
+                    continue
+            else:
+                m = RE_RESULT.search(l)
+                if not m:
+                    unknown += 1
+                    continue
+                n, B1 = int(m.group(1)), int(m.group(2))
+                B2, E = int(m.group(3) or B1), int(m.group(4) or 0)
+                m = RE_RESULT_START.search(l)
+                start1, start2 = map(int, m.groups()) if m else (0, 0)
+            if method == "P-1":
+                self.add_pm1(n, B1, B2, E)
+            else:
+                self.add_pp1(n, B1, B2, start1, start2)
+        return unknown
+
+    # adds the local work of exponent n to the report, returns the number of runs which have been added
+    def merge(self, n, report):
+        pm1, pp1 = self.pm1.get(n, ()), self.pp1.get(n, ())
+        report.pm1.update(pm1)
+        report.pp1.update(pp1)
+        return len(pm1) + len(pp1)
+
+RE_RESULT = re.compile(r"\bM([0-9]+) .*?B1=([0-9]+)(?:, B2=([0-9]+))?(?:, E=([0-9]+))?")
+RE_RESULT_START = re.compile(r"[Ss]tart=([0-9]+)/([0-9]+)")
+
+# compact summary of everything which has been done for exponent n, see make_status()
+class ExponentStatus:
+    __slots__ = ("n", "factors", "tf", "ecm", "pm1_B1", "pm1_B1_stage2", "pm1_B2",
+                 "pp1_B1", "pp1_B1_stage2", "pp1_B1_start2", "pp1_B1_start6", "pp1_B2",
+                 "last_date", "recent", "fully_factored")
+    def __init__(self, n, factors=(), tf=0, ecm=(0.,)*len(ECMBOUNDS), pm1_B1=0, pm1_B1_stage2=0, pm1_B2=0,
+                 pp1_B1=0, pp1_B1_stage2=0, pp1_B1_start2=0, pp1_B1_start6=0, pp1_B2=0,
+                 last_date="", recent=False, fully_factored=False):
+        self.n = n
+        self.factors = factors             # sorted tuple of the known prime factors
+        self.tf = tf                       # 2^tf is the trial factoring depth, including TJAOI's 66 bits
+        self.ecm = ecm                     # equivalent number of ECM curves per ECMBOUNDS level, see ecm_curve_equivalents()
+        self.pm1_B1 = pm1_B1               # largest P-1 B1
+        self.pm1_B1_stage2 = pm1_B1_stage2 # largest P-1 B1 of a run with B2 >= 10*B1
+        self.pm1_B2 = pm1_B2               # largest P-1 B2
+        self.pp1_B1 = pp1_B1               # largest P+1 B1
+        self.pp1_B1_stage2 = pp1_B1_stage2 # largest P+1 B1 of a run with B2 > 10*B1
+        self.pp1_B1_start2 = pp1_B1_start2 # largest P+1 B1 of a run with start value 2/7
+        self.pp1_B1_start6 = pp1_B1_start6 # largest P+1 B1 of a run with start value 6/5
+        self.pp1_B2 = pp1_B2               # largest P+1 B2
+        self.last_date = last_date         # most recent assignment or result, "YYYY-MM-DD"
+        self.recent = recent               # True if there was activity <90 days ago
+        self.fully_factored = fully_factored
+
+    def __repr__(self):
+        return "ExponentStatus(" + ", ".join(f"{k}={getattr(self, k)!r}" for k in self.__slots__) + ")"
+
+# the cofactor of 2^n-1 is only checked locally for exponents up to this limit, see make_status()
+COFACTOR_CHECK_LIMIT = 50000
+
+# returns the cofactor of 2^n-1 after dividing all (prime) factors and if it is a probable prime or 1
+# Like PrimeNet's PRP-CF test, this is a base 3 Fermat test (base 2 is useless for Mersenne cofactors).
+# The result is cached, as it is expensive and plan() might be run for the same exponent again.
+@functools.lru_cache(maxsize=1024)
+def check_cofactor(n, factors):
+    cofactor, remainder = divmod(2**n-1, balanced_product(factors))
+    assert(remainder == 0)
+    return cofactor, cofactor == 1 or powmod(3, cofactor-1, cofactor) == 1
+
+# summarizes the Report of exponent n to an ExponentStatus
+# if factoring a composite factor takes longer than factor_timeout seconds, it is kept as it is
+# if the server did not report a PRP cofactor, it is checked locally for n <= cofactor_limit
+# factorize can be replaced by a function with the same arguments, e.g. in order to measure it
+def make_status(n, report, factor_timeout=60., cofactor_limit=COFACTOR_CHECK_LIMIT, factorize=factorize):
+    # check if factors are actually correct:
+    for f in report.factors:
+        assert(powmod(2,n,f) == 1)
+
+    # check if all reported factors are actually prime
+    # (sometimes, composite factors are reported by server)
+    # we first split them by gcds, e.g. [a, a*b] -> [a, b]. We can still have composite factors
+    # when the server reported only a*b but neither a nor b as factor. Then, we need to factorize ourselves.
+    factors = set()
+    for f in coprime_base(report.factors):
+        factors.update(factorize(f, timeout=factor_timeout, exponent=n))
+
+    # the PRP test of the cofactor by the server tells us if it is fully factored. Otherwise, we check it
+    # ourselves for small numbers (this is slow, as the cofactor has thousands of digits).
+    # Unfactored exponents are not checked, 2^n-1 would have to be prime.
+    fully_factored = report.cofactor_prp
+    if not fully_factored and factors and n <= cofactor_limit:
+        cofactor, fully_factored = check_cofactor(n, tuple(sorted(factors)))
+        if fully_factored and cofactor > 1:
+            factors.add(cofactor)
+
+    # convert the trial factoring bit mask to an integer, i.e. the number of consecutive bits done
+    # please note that TJAOI factored everything up to 66 bit
+    tf = report.tf | tf_bits(0, 66)
+    tf = (~tf & (tf+1)).bit_length() - 1
+
+    ecm = [0.] * len(ECMBOUNDS)
+    for (B1, B2), count in report.ecm.items():
+        for i, equivalents in enumerate(ecm_curve_equivalents(B1, B2)):
+            ecm[i] += count * equivalents
+
+    status = ExponentStatus(n, tuple(sorted(factors)), tf, tuple(ecm),
+                            last_date=report.last_date, fully_factored=fully_factored)
+    status.recent = bool(report.last_date) and is_recent(report.last_date)
+    for (B1, B2, E) in report.pm1:
+        status.pm1_B1 = max(status.pm1_B1, B1)
+        status.pm1_B2 = max(status.pm1_B2, B2)
+        if B2 / B1 >= 10:
+            status.pm1_B1_stage2 = max(status.pm1_B1_stage2, B1)
+    for (B1, B2, start1, start2) in report.pp1:
+        status.pp1_B1 = max(status.pp1_B1, B1)
+        status.pp1_B2 = max(status.pp1_B2, B2)
+        if B2 / B1 > 10:
+            status.pp1_B1_stage2 = max(status.pp1_B1_stage2, B1)
+        if start1 == 2:
+            status.pp1_B1_start2 = max(status.pp1_B1_start2, B1)
+        elif start1 == 6:
+            status.pp1_B1_start6 = max(status.pp1_B1_start6, B1)
+    return status
+
+#####################################################################
+# now the interesting part where the calculation what to do is done
+#####################################################################
+
+# only do P-1 / P+1 assigments, if B1 bound will increase by at least this factor
+# If it is set to 2 and P-1 was done until 10M, then no new 15M assignment will be generated
+DUPLICATE_WORK_FACTOR_PROPER_STAGE2 = 2.
+DUPLICATE_WORK_FACTOR_NO_STAGE2     = 1.3
+
+LOG2_10 = math.log2(10)
+
+# policies for the bounds of plan():
+#     "table"   - PM1_B1_should() / PP1_B1_should() and B2 chosen by Prime95
+#     "optimal" - optimal_bounds(), which takes the previous runs into account
+BOUNDS_POLICIES = ("table", "optimal")
+
+# returns the list of worktodo lines for an ExponentStatus
+# debug is an optional function which is called with a string for every decision
+def plan(status, debug=None, policy="table"):
+    n = status.n
+    how_far_factored = status.tf
+
+    # use ECM bounds to adapt how_far_factored
+    # as ECM is probabilistic, we want to be conservative and remove an extra 8 bits / 3 digits of factor size
+    # see ATH's reply at https://mersenneforum.org/showpost.php?p=577509&postcount=51
+    ecm_level = get_ecm_level(status.ecm)
+    ecm_factored = int(ecm_level * LOG2_10) - 8
+    if how_far_factored < ecm_factored:
+        if debug: debug(f"increased how_far_factored from {how_far_factored} to {ecm_factored} because of substantial ECM")
+        how_far_factored = ecm_factored
+
+    # B1 should be chosen accordingly, if you have done TF very high, you should start with larger bound
+    # e.g. TF = 80 makes ECM t20 useless
+    ECM_B1 = ecm_level_to_B1(ecm_level)
+    ECM_B1 = max(ECM_B1, ecm_level_to_B1(int(how_far_factored / LOG2_10)))
+
+    # hard cut off at 99, because prime95 cannot do larger
+    how_far_factored = min(how_far_factored, 99)
+
+    factors = status.factors
+    factors_known = bool(factors)
+
+    if debug:
+        debug(f"n:                {n}")
+        debug(f"how_far_factored: {how_far_factored}")
+        debug(f"Factors:          {set(factors)}")
+        debug(f"factors known:    {factors_known}")
+        debug(f"ECM Factoring:    { {ECMBOUNDS[i][0]: round(c, 1) for i, c in enumerate(status.ecm) if c >= 0.05} }")
+        debug(f"ECM level:        t{ecm_level:.1f}")
+        debug(f"ECM current B1:   {ECM_B1}")
+        debug(f"P-1 Factoring:    B1={status.pm1_B1}, B2={status.pm1_B2}")
+        debug(f"P+1 Factoring:    B1={status.pp1_B1}, B2={status.pp1_B2}")
+        debug(f"recent results:   {status.recent}")
+        debug(f"fully factored:   {status.fully_factored}")
+
+    # recently assigned or fully factored exponents will be skipped
+    if status.recent:
+        if debug: debug(f"skipping exponent {n}, because it is assigned or there has been work done <90 days ago")
+        return []
+    if status.fully_factored:
+        if debug: debug(f"skipping exponent {n}, because it is fully factored")
+        return []
+
+    if policy == "optimal":
+        return plan_optimal(status, how_far_factored, debug)
+
+    work = []
+
+    # calculate bounds
+    PM1_B1 = PM1_B1_should(n, factors_known)
+    PP1_B1 = PP1_B1_should(n, factors_known)
+    # if substantial ECM is already done, we might want to increase those bounds!
+    if any(status.ecm):
+        if 20*ECM_B1 > PM1_B1:
+            if debug: debug(f"increased desired P+1 B1 to 20*ECM_B1 because current ECM bound is already at B1={ECM_B1}")
+            PM1_B1 = 20*ECM_B1
+        if 10*ECM_B1 > PP1_B1:
+            if debug: debug(f"increased desired P+1 B1 to 10*ECM_B1 because current ECM bound is already at B1={ECM_B1}")
+            PP1_B1 = 10*ECM_B1
+
+    # check if it needs P-1 factoring
+    # don't do P-1 again if there was a proper run already
+    if status.pm1_B1_stage2 > PM1_B1 / DUPLICATE_WORK_FACTOR_PROPER_STAGE2:
+        if debug: debug(f"should not do P-1: B1={PM1_B1} recommended but {status.pm1_B1_stage2} already done with B2>=10*B1")
+    elif status.pm1_B1 > PM1_B1 / DUPLICATE_WORK_FACTOR_NO_STAGE2:
+        if debug: debug(f"should not do P-1: B1={PM1_B1} recommended but {status.pm1_B1} already done (albeit without stage2)")
+    else:
+        work.append(worktodo_PM1(n,PM1_B1,how_far_factored=how_far_factored,factors=factors))
+
+    # check if it needs P+1 factoring
+    if status.pm1_B1//2 > PP1_B1:
+        PP1_B1 = status.pm1_B1 // 2
+        if debug: debug(f"increased desired P+1 B1 to {PP1_B1} which is half of the already done P-1 bound")
+    # ignore it, if there was a proper P+1 run with or without stage 2
+    if status.pp1_B1_stage2 > PP1_B1 / DUPLICATE_WORK_FACTOR_PROPER_STAGE2:
+        if debug: debug(f"should not do PP1: B1={PP1_B1} recommended but {status.pp1_B1_stage2} already done with B2>10*B1")
+    elif status.pp1_B1 > PP1_B1 / DUPLICATE_WORK_FACTOR_NO_STAGE2:
+        if debug: debug(f"should not do PP1: B1={PP1_B1} recommended but {status.pp1_B1} already done (albeit without stage2)")
+    else:
+        nth_run = pp1_nth_run(status, PP1_B1)
+        work.append(worktodo_PP1(n,PP1_B1,B2=0,nth_run=nth_run,how_far_factored=how_far_factored,factors=factors))
+    return work
+
+# determine if we should use 2, 6 or a random value as start values of a P+1 run with bound B1
+# we want to use random only if there has been no 2 or 6 run before because they have higher likelyhood
+def pp1_nth_run(status, B1):
+    nth_run = 3 # random
+    if status.pp1_B1_start2 == 0:
+        nth_run = 1
+    elif status.pp1_B1_start6 == 0:
+        nth_run = 2
+    else:
+        # in degenerate cases where there was a run with the optimal values 2 or 6 run,
+        # but only to very low bounds, we still want to use it.
+        if status.pp1_B1_start2 < B1 * 0.01:
+            nth_run = 1
+        elif status.pp1_B1_start6 < B1 * 0.01:
+            nth_run = 2
+    return nth_run
+
+# the reason why plan() did not return any work, None if it did
+def skip_reason(status, work):
+    if work:
+        return None
+    if status.recent:
+        return "recent"
+    if status.fully_factored:
+        return "fully factored"
+    return "bounds done"
+
+# decision record of an exponent as a dict which can be written as JSON, with the status which
+# was used by plan() and the worktodo lines it returned. The factors are strings, as many JSON
+# parsers cannot handle large integers.
+def describe(status, work):
+    lines = []
+    for l in work:
+        worktype, n, B1, B2, nth_run, how_far_factored = parse_worktodo_line(l)
+        lines.append({"worktype": worktype, "B1": B1, "B2": B2, "nth_run": nth_run,
+                      "how_far_factored": how_far_factored, "line": l})
+    return {"n": status.n, "skip": skip_reason(status, work), "factors": [str(f) for f in status.factors],
+            "tf": status.tf, "ecm_level": round(get_ecm_level(status.ecm), 2),
+            "pm1": {"B1": status.pm1_B1, "B2": status.pm1_B2},
+            "pp1": {"B1": status.pp1_B1, "B2": status.pp1_B2},
+            "last_date": status.last_date, "recent": status.recent, "fully_factored": status.fully_factored,
+            "work": lines}
+
+#####################################################################
+# cost and benefit of the worktodo lines, for ranking them
+#####################################################################
+
+# Prime95 uses FFT lengths with small factors. The number of bits per FFT word which can be
+# handled with double precision decreases slowly with the FFT length, about 19.5 bits at 5K
+# (n = 100000) and 17.5 bits at 5760K (n = 100M).
+def fft_length(n):
+    best = None
+    for m in (1, 3, 5, 7):
+        L = m * 32
+        while n / L > 22. - 0.2 * math.log2(L):
+            L *= 2
+        best = L if best is None else min(best, L)
+    return best
+
+# GHz-days for a multiplication of FFT length L is GHZDAYS_PER_MUL * L * log2(L),
+# chosen such that a LL test of M100000007 (5760K FFT) is about 400 GHz-days
+GHZDAYS_PER_MUL = 3.1e-14
+# if B2 is 0, Prime95 chooses B2. The estimates assume this value of B2/B1.
+DEFAULT_B2_RATIO = 30
+# multiplications per prime in stage 2 (Prime95 pairs the primes)
+STAGE2_MULS_PER_PRIME = 0.5
+# stage 1 of P+1 needs about twice as many multiplications per bit of the exponent as P-1
+PP1_STAGE1_FACTOR = 2.
+
+LN2 = math.log(2)
+
+# returns the estimated number of multiplications of a P-1 (plus1=False) or P+1 run with bounds B1 and B2
+def multiplications(B1, B2, plus1=False):
+    stage1 = B1 / LN2 # bits of the product of all prime powers below B1
+    if plus1:
+        stage1 *= PP1_STAGE1_FACTOR
+    stage2 = max(0., B2 / math.log(B2) - B1 / math.log(B1)) * STAGE2_MULS_PER_PRIME if B2 > B1 else 0.
+    return stage1 + stage2
+
+# returns the GHz-days of a multiplication modulo 2^n-1
+def ghzdays_per_mul(n):
+    L = fft_length(n)
+    return GHZDAYS_PER_MUL * L * math.log2(L)
+
+# returns the estimated GHz-days of a P-1 (plus1=False) or P+1 run with bounds B1 and B2 of 2^n-1
+def estimate_cost(n, B1, B2, plus1=False):
+    return multiplications(B1, B2, plus1) * ghzdays_per_mul(n)
+
+# factors larger than 2^(how_far_factored + FACTOR_SIZE_BITS) are too unlikely to be found to matter
+FACTOR_SIZE_BITS = 100
+
+# returns a list of (log of the group order, probability) for the factor sizes which P-1 (plus1=False) or P+1
+# can find if there is no factor below 2^how_far_factored: there is a factor between 2^x and 2^(x+1) with
+# probability 1/x. P-1 finds a factor q = 2kn+1 if k is smooth, P+1 if (q+1)/2 is smooth.
+def factor_sizes(n, how_far_factored, plus1=False):
+    sizes = []
+    for x in range(max(how_far_factored, 1), how_far_factored + FACTOR_SIZE_BITS):
+        log_N = (x + 0.5) * LN2 - (LN2 if plus1 else math.log(2*n))
+        if log_N > 0:
+            sizes.append((log_N, 1 / x))
+    return sizes
+
+# probability that a group order of size e^log_N is B1-smooth except for one prime below B2
+def smooth_probability(log_N, B1, B2):
+    log_B1 = math.log(B1)
+    return min(semismooth(log_N / log_B1, math.log(max(B1, B2)) / log_B1), 1.)
+
+# returns the probability that a P-1 (plus1=False) or P+1 run with bounds B1 and B2 finds a factor of 2^n-1,
+# if there is no factor below 2^how_far_factored and the previous runs had the bounds prior_B1 and prior_B2.
+# P+1 only finds a factor with half of the start values.
+def estimate_probability(n, how_far_factored, B1, B2, prior_B1=0, prior_B2=0, plus1=False):
+    p = 0.
+    for log_N, weight in factor_sizes(n, how_far_factored, plus1):
+        new = smooth_probability(log_N, B1, B2)
+        if prior_B1 > 1:
+            new -= smooth_probability(log_N, prior_B1, prior_B2)
+        p += max(new, 0.) * weight
+    return p / 2 if plus1 else p
+
+# returns the estimated GHz-days of a P-1 or P+1 worktodo line
+def estimate_line_cost(line):
+    worktype, n, B1, B2, nth_run, how_far_factored = parse_worktodo_line(line)
+    return estimate_cost(n, B1, B2 or DEFAULT_B2_RATIO * B1, worktype == "Pplus1")
+
+# a reasonable stage 2 needs at least this many FFT sized buffers (of 8 bytes per FFT word)
+STAGE2_MIN_BUFFERS = 24
+
+# returns the memory in MB which stage 2 of P-1 or P+1 for 2^n-1 needs at least
+def stage2_memory(n):
+    return STAGE2_MIN_BUFFERS * fft_length(n) * 8 / 2**20
+
+# returns (GHz-days, probability to find a factor) of a worktodo line which plan() returned for status
+def estimate(status, line):
+    worktype, n, B1, B2, nth_run, how_far_factored = parse_worktodo_line(line)
+    if not B2:
+        B2 = DEFAULT_B2_RATIO * B1
+    if how_far_factored is None:
+        how_far_factored = status.tf
+    if worktype == "Pminus1":
+        prior_B1, prior_B2 = status.pm1_B1, status.pm1_B2
+    else:
+        # only earlier runs with the same start value find the same factors.
+        # their B2 is unknown, so they are counted without stage 2
+        prior_B1 = {1: status.pp1_B1_start2, 2: status.pp1_B1_start6}.get(nth_run, 0)
+        prior_B2 = prior_B1
+    plus1 = worktype == "Pplus1"
+    return (estimate_cost(n, B1, B2, plus1),
+            estimate_probability(n, how_far_factored, B1, B2, prior_B1, prior_B2, plus1))
+
+# sorts the candidates (line, GHz-days, probability) by the expected number of factors per GHz-day and
+# returns the best ones which fit into the budget in GHz-days (all if budget is None).
+# Lines which do not fit are skipped, but cheaper lines after them may still fit.
+def rank_work(candidates, budget=None):
+    selected = []
+    total = 0.
+    for line, cost, probability in sorted(candidates, key=lambda c: c[2] / c[1], reverse=True):
+        if budget is not None and total + cost > budget:
+            continue
+        selected.append((line, cost, probability))
+        total += cost
+    return selected
+
+# distributes the worktodo lines to `workers` workers such that all of them finish at about the same time
+# (longest processing time first: the most expensive line goes to the worker with the least work so far).
+# memory is None or a list with the memory in MB of every worker, a line only goes to a worker with enough
+# memory for stage 2 (to the worker with the most memory if there is none).
+# returns a list with the lines of every worker, in their original order, a list with the GHz-days of every worker
+# and a list of (line, MB for stage 2) of the lines which do not fit into the memory of any worker
+def split_work(lines, workers, memory=None):
+    assigned = [[] for _ in range(workers)]
+    load = [0.] * workers
+    too_large = []
+    costs = [estimate_line_cost(l) for l in lines]
+    for i in sorted(range(len(lines)), key=lambda i: costs[i], reverse=True):
+        candidates = range(workers)
+        if memory:
+            need = stage2_memory(parse_worktodo_line(lines[i])[1])
+            candidates = [w for w in range(workers) if memory[w] >= need]
+            if not candidates:
+                too_large.append((lines[i], need))
+                candidates = [max(range(workers), key=lambda w: memory[w])]
+        w = min(candidates, key=lambda w: load[w])
+        assigned[w].append(i)
+        load[w] += costs[i]
+    return [[lines[i] for i in sorted(a)] for a in assigned], load, too_large
+
+#####################################################################
+# optimal bounds, instead of PM1_B1_should() and PP1_B1_should()
+#####################################################################
+
+# the optimizer tries B1 with two significant digits from the list below and these ratios B2/B1.
+# With numpy, it first tries every OPTIMIZER_STEP-th B1 and the first B1 above the previous B1 for P-1, and then
+# the B1 around the local maxima of every ratio. The gain usually has a single maximum in B1, but after a previous
+# run it falls for smaller B1 (which hardly find new factors) and the maximum is often just above the previous B1.
+OPTIMIZER_B1 = [11000] + [int(m * 10**e) for e in range(4, 11) for m in (1.5, 2, 3, 5, 7, 10)]
+OPTIMIZER_B2_RATIOS = (1, 10, 20, 30, 50, 100, 200, 300, 500, 1000)
+OPTIMIZER_STEP = 4
+
+# the value of a GHz-day in expected new factors: the optimizer maximizes
+#     probability - FACTORS_PER_GHZDAY * GHz-days
+# so every additional GHz-day has to increase the probability by at least this much.
+# The default gives bounds of the same order as PM1_B1_should() for small exponents without known factors.
+FACTORS_PER_GHZDAY = 0.02
+
+# candidates (B1, B2) of the optimizer and their number of multiplications,
+# candidate b * len(OPTIMIZER_B2_RATIOS) + r has the b-th B1 and the r-th ratio
+@functools.lru_cache(maxsize=2)
+def optimizer_candidates(plus1):
+    candidates = [(B1, ratio * B1) for B1 in OPTIMIZER_B1 for ratio in OPTIMIZER_B2_RATIOS]
+    return candidates, [multiplications(B1, B2, plus1) for B1, B2 in candidates]
+
+# the multiplications of optimizer_candidates() as numpy array of shape (B1, ratio)
+@functools.lru_cache(maxsize=2)
+def optimizer_multiplications(plus1):
+    _, muls = optimizer_candidates(plus1)
+    return numpy.array(muls, dtype=float).reshape(len(OPTIMIZER_B1), len(OPTIMIZER_B2_RATIOS))
+
+# the semismooth table as flat numpy array
+@functools.lru_cache(maxsize=1)
+def semismooth_array():
+    return numpy.array(semismooth_table()).ravel()
+
+# semismooth() for numpy arrays u and r
+def semismooth_numpy(u, r):
+    table = semismooth_array()
+    width = DICKMAN_MAX_U * SEMISMOOTH_STEPS + 1
+    x = numpy.clip(u, 0, DICKMAN_MAX_U - 1e-9) * SEMISMOOTH_STEPS
+    y = (numpy.clip(r, 1, SEMISMOOTH_MAX_R - 1e-9) - 1) * SEMISMOOTH_STEPS
+    i, j = x.astype(numpy.intp), y.astype(numpy.intp)
+    x, y = x - i, y - j
+    k = j * width + i # index of table[j][i]
+    low = table.take(k)
+    low += x * (table.take(k+1) - low)
+    high = table.take(k+width)
+    high += x * (table.take(k+width+1) - high)
+    sigma = numpy.minimum(low + y * (high - low), 1.)
+    return numpy.where(u <= 1, 1., numpy.where(u >= DICKMAN_MAX_U, 0., sigma))
+
+# the semismooth table interpolated at r = log(B2) / log(B1) of every candidate of the optimizer (the same for
+# P-1 and P+1) as numpy array of shape (B1, ratio, u), clamped to 0..1 and 0 at the end of the table.
+# The optimizer only has to interpolate these rows in u, and u only depends on B1.
+@functools.lru_cache(maxsize=1)
+def optimizer_table():
+    candidates, _ = optimizer_candidates(False)
+    table = numpy.array(semismooth_table())
+    log_B1 = numpy.log([B1 for B1, _ in candidates])
+    r = numpy.log([max(B1, B2) for B1, B2 in candidates]) / log_B1
+    y = (numpy.clip(r, 1, SEMISMOOTH_MAX_R - 1e-9) - 1) * SEMISMOOTH_STEPS
+    j = y.astype(numpy.intp)
+    y -= j
+    rows = numpy.clip(table[j] + y[:, None] * (table[j+1] - table[j]), 0., 1.)
+    rows[:, -1] = 0.
+    return rows.reshape(len(OPTIMIZER_B1), len(OPTIMIZER_B2_RATIOS), -1)
+
+# returns a function which returns the probabilities of estimate_probability() for the candidates of the optimizer
+# whose B1 are given as indices into OPTIMIZER_B1, as numpy array of shape (B1, ratio).
+# The factor sizes and the probabilities of the previous run are only computed once.
+def candidate_probabilities(n, how_far_factored, prior_B1=0, prior_B2=0, plus1=False):
+    # the same as factor_sizes()
+    x = numpy.arange(max(how_far_factored, 1), how_far_factored + FACTOR_SIZE_BITS)
+    log_N = (x + 0.5) * LN2 - (LN2 if plus1 else math.log(2*n))
+    x, log_N = x[log_N > 0], log_N[log_N > 0]
+    weights = 1 / x / 2 if plus1 else 1 / x
+    prior = None
+    if prior_B1 > 1:
+        prior = semismooth_numpy(log_N / math.log(prior_B1), math.log(max(prior_B1, prior_B2)) / math.log(prior_B1))
+    table = optimizer_table()
+    rows = table.ravel()
+    width = table.shape[2]
+    offsets = numpy.arange(table.shape[1])[:, None] * width # of the ratios within the rows of a B1
+    log_B1 = numpy.log(OPTIMIZER_B1)
+    def probabilities(indices):
+        indices = numpy.array(indices, dtype=numpy.intp)
+        u = numpy.minimum(log_N[None, :] / log_B1[indices, None], DICKMAN_MAX_U - 1e-9) * SEMISMOOTH_STEPS
+        i = u.astype(numpy.intp)
+        u -= i
+        # index of the row of every candidate at u, shape (B1, ratio, factor size)
+        k = (i + indices[:, None] * table.shape[1] * width)[:, None, :] + offsets
+        low = rows.take(k)
+        sigma = low + u[:, None, :] * (rows.take(k+1) - low)
+        if prior is not None:
+            sigma = numpy.maximum(sigma - prior, 0.)
+        return sigma @ weights
+    return probabilities
+
+# candidate_probabilities() of all candidates for P+1, whose factor sizes do not depend on the exponent
+@functools.lru_cache(maxsize=1024)
+def pp1_probabilities(how_far_factored, prior_B1, prior_B2):
+    return candidate_probabilities(None, how_far_factored, prior_B1, prior_B2, True)(range(len(OPTIMIZER_B1)))
+
+# returns the bounds (B1, B2) for a P-1 (plus1=False) or P+1 run of 2^n-1 which maximize the probability
+# to find a new factor (see estimate_probability()) minus FACTORS_PER_GHZDAY times the GHz-days,
+# or None if no bounds are worth it
+def optimal_bounds(n, how_far_factored, prior_B1=0, prior_B2=0, plus1=False):
+    candidates, muls = optimizer_candidates(plus1)
+    value = FACTORS_PER_GHZDAY * ghzdays_per_mul(n)
+    if numpy is None:
+        best, best_gain = None, 0.
+        for bounds, m in zip(candidates, muls):
+            gain = estimate_probability(n, how_far_factored, *bounds, prior_B1, prior_B2, plus1) - value * m
+            if gain > best_gain:
+                best, best_gain = bounds, gain
+        return best
+    muls = optimizer_multiplications(plus1)
+    if plus1:
+        gains = pp1_probabilities(how_far_factored, prior_B1, prior_B2) - value * muls
+    else:
+        probabilities = candidate_probabilities(n, how_far_factored, prior_B1, prior_B2)
+        gains = numpy.full(muls.shape, -numpy.inf)
+        coarse = set(range(0, len(OPTIMIZER_B1), OPTIMIZER_STEP))
+        coarse.add(len(OPTIMIZER_B1) - 1)
+        coarse.add(min(bisect.bisect_left(OPTIMIZER_B1, prior_B1), len(OPTIMIZER_B1) - 1))
+        coarse = sorted(coarse)
+        g = gains[coarse] = probabilities(coarse) - value * muls[coarse]
+        # the B1 around the local maxima of any ratio
+        peaks = (g >= numpy.vstack((g[:1], g[:-1]))) & (g >= numpy.vstack((g[1:], g[-1:])))
+        fine = set()
+        for k in numpy.flatnonzero(peaks.any(axis=1)):
+            fine.update(range(max(coarse[k] - OPTIMIZER_STEP + 1, 0), min(coarse[k] + OPTIMIZER_STEP, len(OPTIMIZER_B1))))
+        fine = sorted(fine.difference(coarse))
+        if fine:
+            gains[fine] = probabilities(fine) - value * muls[fine]
+    # the first of several equal maxima, like the loop above
+    c = int(gains.argmax())
+    return candidates[c] if gains.flat[c] > 0 else None
+
+# the part of plan() for the "optimal" policy, after the exponents which should be skipped anyway
+def plan_optimal(status, how_far_factored, debug=None):
+    n, factors = status.n, status.factors
+    work = []
+    bounds = optimal_bounds(n, how_far_factored, status.pm1_B1, status.pm1_B2)
+    if bounds is None:
+        if debug: debug(f"should not do P-1: no bounds are worth it after B1={status.pm1_B1}, B2={status.pm1_B2}")
+    else:
+        B1, B2 = bounds
+        if debug: debug(f"optimal P-1 bounds: B1={B1}, B2={B2}")
+        work.append(worktodo_PM1(n,B1,B2,how_far_factored=how_far_factored,factors=factors))
+
+    # only the previous runs with the same start value count, their B2 is unknown
+    nth_run = pp1_nth_run(status, PP1_B1_should(n, bool(factors)))
+    prior_B1 = {1: status.pp1_B1_start2, 2: status.pp1_B1_start6}.get(nth_run, 0)
+    bounds = optimal_bounds(n, how_far_factored, prior_B1, prior_B1, plus1=True)
+    if bounds is None:
+        if debug: debug(f"should not do P+1: no bounds are worth it after B1={prior_B1} with the same start value")
+    else:
+        B1, B2 = bounds
+        if debug: debug(f"optimal P+1 bounds: B1={B1}, B2={B2}")
+        work.append(worktodo_PP1(n,B1,B2,nth_run=nth_run,how_far_factored=how_far_factored,factors=factors))
+    return work
@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+
+# local stand-in for the report_exponent page of the PrimeNet server, so that get_work.py can be
+# benchmarked (and tested) without load on mersenne.org. It serves the reports of a saved text report
+# (like --input of get_work.py, e.g. fixtures/reports.txt.xz) with a configurable latency and error rate.
+#
+# usage:
+#     python.exe primenet_standin.py fixtures/reports.txt.xz --port 8080 --latency 0.2 --error-rate 0.05
+#     python.exe get_work.py 100000 101000 1 --server http://127.0.0.1:8080
+
+import sys
+import argparse
+import bisect
+import random
+import threading
+import time
+import gzip
+import urllib.parse
+import http.server
+from get_work import open_input, read_reports
+
+# returns {n: [lines]} of a saved text report
+def load_reports(filename):
+    with open_input(filename) as f:
+        return dict(read_reports(f))
+
+class StandInServer:
+    # reports is {n: [lines]}, every request waits `latency` seconds and fails with
+    # probability `error_rate` (503 with Retry-After, like an overloaded server)
+    # the reports are compressed with gzip if the client accepts it, like the real server does
+    def __init__(self, reports, latency=0., error_rate=0., port=0, seed=0):
+        self.reports = reports
+        self.exponents = sorted(reports)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        server = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body = server.respond(self.path)
+                self.send_response(status)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                if status == 200 and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzip.compress(body, compresslevel=6)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                if status == 503:
+                    self.send_header("Retry-After", "1")
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass # the client gave up, e.g. because of its timeout
+            def log_message(self, format, *args):
+                pass
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = None
+
+    # returns (HTTP status, body) for a request path
+    def respond(self, path):
+        url = urllib.parse.urlsplit(path)
+        if url.path.rstrip("/") != "/report_exponent":
+            return 404, b"not found\n"
+        query = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+        try:
+            lo = int(query["exp_lo"][0])
+            hi = int(query.get("exp_hi", [""])[0] or lo)
+        except (KeyError, ValueError):
+            return 400, b"exp_lo and exp_hi must be numbers\n"
+        time.sleep(self.latency)
+        with self.lock:
+            self.requests += 1
+            failed = self.rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if failed:
+            return 503, b"server is busy\n"
+        start = bisect.bisect_left(self.exponents, lo)
+        stop = bisect.bisect_right(self.exponents, hi)
+        lines = [l for n in self.exponents[start:stop] for l in self.reports[n]]
+        return 200, ("\n".join(lines) + "\n").encode("utf-8")
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="primenet_standin.py",
+        description="local stand-in for the report_exponent page of the PrimeNet server")
+    parser.add_argument("reports", help="saved text report, optionally compressed with gzip or xz")
+    parser.add_argument("--port", type=int, default=8080, help="TCP port on 127.0.0.1 (default: 8080)")
+    parser.add_argument("--latency", type=float, default=0., metavar="SECONDS",
+        help="delay of every response (default: 0)")
+    parser.add_argument("--error-rate", type=float, default=0., metavar="P",
+        help="fraction of the requests which fail with 503 (default: 0)")
+    args = parser.parse_args(argv[1:])
+    reports = load_reports(args.reports)
+    server = StandInServer(reports, args.latency, args.error_rate, args.port)
+    print(f"serving {len(reports)} exponents at {server.url}/report_exponent/")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,116 @@
+# tests for numbertheory.py, run them with: python -m unittest test_numbertheory
+
+import random
+import time
+import unittest
+
+import numbertheory
+
+# the prime factors of 2^41681-1 found so far (TF, P-1 and ECM)
+FACTORS_41681 = [1052945423, 16647332713153, 2853686272534246492102086015457]
+
+class TestPrimality(unittest.TestCase):
+    def test_primes(self):
+        for p in [2, 3, 5, 997, 1009, 2**31-1, 2**61-1, 2**89-1, 2**127-1] + FACTORS_41681:
+            self.assertTrue(numbertheory.isprime(p), p)
+
+    def test_composites(self):
+        for n in [0, 1, 4, 561, 1009**2, (2**61-1)*(2**89-1), 2**67-1, 2**101-1]:
+            self.assertFalse(numbertheory.isprime(n), n)
+
+    def test_strong_pseudoprimes(self):
+        # strong pseudoprimes to base 2, the first ones also have small factors and are tested with bpsw() directly
+        for n in [2047, 3277, 4033, 4681, 8321, 15841, 29341, 42799, 49141, 52633, 65281, 74665, 80581, 85489]:
+            self.assertFalse(numbertheory.bpsw(n), n)
+        # strong pseudoprime to the bases 2 to 23 and to the bases 2 to 37
+        for n in [3825123056546413051, 318665857834031151167461]:
+            self.assertFalse(numbertheory.isprime(n), n)
+        # strong Lucas pseudoprimes
+        for n in [5459, 5777, 10877, 16109, 18971, 22499, 24569, 25199, 40309, 58519]:
+            self.assertFalse(numbertheory.bpsw(n), n)
+
+    def test_next_prime(self):
+        self.assertEqual([numbertheory.next_prime(n) for n in [0, 1, 2, 7, 24, 1000]], [2, 2, 3, 11, 29, 1009])
+
+class TestFactorization(unittest.TestCase):
+    def test_coprime_base(self):
+        self.assertEqual(numbertheory.coprime_base([]), [])
+        self.assertEqual(numbertheory.coprime_base([1, 7]), [7])
+        self.assertEqual(numbertheory.coprime_base([6, 10, 15]), [2, 3, 5])
+        self.assertEqual(numbertheory.coprime_base([12, 18]), [2, 3])
+        a, b, c = FACTORS_41681
+        self.assertEqual(numbertheory.coprime_base([a, a*b, b*c]), [a, b, c])
+        self.assertEqual(numbertheory.coprime_base([a*b, a*b]), [a*b])
+
+    def test_factorize(self):
+        a, b, c = FACTORS_41681
+        self.assertEqual(numbertheory.factorize(1), [])
+        self.assertEqual(numbertheory.factorize(360), [2, 2, 2, 3, 3, 5])
+        self.assertEqual(numbertheory.factorize(a*b, exponent=41681), [a, b])
+        self.assertEqual(numbertheory.factorize(b*c, exponent=41681), [b, c])
+        self.assertEqual(numbertheory.factorize(a*b*c, exponent=41681), [a, b, c])
+        self.assertEqual(numbertheory.factorize(a*a*b), [a, a, b])
+
+    def test_ecm_curve(self):
+        # the 41 bit factor is found by a few curves with small bounds
+        a, b, c = FACTORS_41681
+        rng = random.Random(1)
+        for _ in range(200):
+            f = numbertheory.ecm_curve(b*c, 2000, 100000, rng)
+            if f:
+                break
+        self.assertEqual(f, b)
+
+    def test_deadline(self):
+        # two 30 digit primes, no method finds them before the deadline
+        m = numbertheory.next_prime(10**29 + 12345) * numbertheory.next_prime(3 * 10**29)
+        rng = random.Random(1)
+        start = time.monotonic()
+        self.assertIsNone(numbertheory.ecm_curve(m, 3000000, 150000000, rng, start + 0.2))
+        self.assertIsNone(numbertheory.pminus1(m, 10**7, deadline=start + 0.4))
+        self.assertEqual(numbertheory.factorize(m, timeout=0.5), [m])
+        self.assertLess(time.monotonic() - start, 3)
+
+# the pure Python fallback and gmpy2 (if it is installed) must give exactly the same results
+class TestBackends(unittest.TestCase):
+    def run_backends(self, f):
+        results = []
+        try:
+            for use_gmpy2 in [False] + ([True] if numbertheory.gmpy2 else []):
+                numbertheory.USE_GMPY2 = use_gmpy2
+                numbertheory.bpsw_memo.cache_clear()
+                results.append(f())
+        finally:
+            numbertheory.USE_GMPY2 = numbertheory.gmpy2 is not None
+            numbertheory.bpsw_memo.cache_clear()
+        for r in results[1:]:
+            self.assertEqual(r, results[0])
+        return results[0]
+
+    @unittest.skipIf(numbertheory.gmpy2 is None, "gmpy2 is not installed")
+    def test_gmpy2_installed(self):
+        self.assertTrue(numbertheory.USE_GMPY2)
+
+    def test_factorize(self):
+        a, b, c = FACTORS_41681
+        self.assertEqual(self.run_backends(lambda: numbertheory.factorize(a*b*c)), [a, b, c])
+        self.assertEqual(self.run_backends(lambda: numbertheory.factorize(b*c, exponent=41681)), [b, c])
+
+    def test_ecm_curve(self):
+        a, b, c = FACTORS_41681
+        found = self.run_backends(lambda: [numbertheory.ecm_curve(b*c, 11000, 550000, random.Random(i)) for i in range(10)])
+        self.assertIn(b, found)
+        self.assertTrue(all(type(f) is int for f in found if f))
+
+    def test_brent_rho(self):
+        a, b, c = FACTORS_41681
+        found = self.run_backends(lambda: [numbertheory.brent_rho(a*c, random.Random(i), 1 << 16) for i in range(3)])
+        self.assertEqual(found, [a, a, a])
+        self.assertTrue(all(type(f) is int for f in found))
+
+    def test_isprime(self):
+        numbers = list(range(10**6, 10**6 + 2000)) + [3825123056546413051, 318665857834031151167461, 2**127-1]
+        self.assertEqual(self.run_backends(lambda: [numbertheory.isprime(n) for n in numbers])[-3:], [False, False, True])
+
+if __name__ == "__main__":
+    unittest.main()
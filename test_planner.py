@@ -0,0 +1,117 @@
+# tests for the local work of planner.py (--worktodo and --results), run them with: python -m unittest test_planner
+
+import io
+import unittest
+
+import planner
+from planner import LocalWork, ParseError, Report, parse_worktodo_line
+
+AID = "0123456789ABCDEF0123456789ABCDEF"
+
+class TestParseWorktodoLine(unittest.TestCase):
+    def test_assignment_id(self):
+        for prefix in ["", "N/A,", AID + ","]:
+            self.assertEqual(parse_worktodo_line(f"Pminus1={prefix}1,2,100019,-1,1000000,30000000,67\n"),
+                             ("Pminus1", 100019, 1000000, 30000000, None, 67))
+            self.assertEqual(parse_worktodo_line(f"Pplus1={prefix}1,2,100019,-1,500000,0,2"),
+                             ("Pplus1", 100019, 500000, 0, 2, None))
+
+    def test_written_lines(self):
+        # the lines written by worktodo_PM1() and worktodo_PP1() are parsed again
+        l = planner.worktodo_PM1(100019, 1000000, 30000000, how_far_factored=67, factors=[1800343])
+        self.assertEqual(parse_worktodo_line(l), ("Pminus1", 100019, 1000000, 30000000, None, 67))
+        l = planner.worktodo_PP1(100019, 500000, B2=0, nth_run=3, how_far_factored=68)
+        self.assertEqual(parse_worktodo_line(l), ("Pplus1", 100019, 500000, 0, 3, 68))
+
+    def test_pfactor(self):
+        self.assertEqual(parse_worktodo_line(f"Pfactor={AID},1,2,100019,-1,67,2"), ("Pfactor", 100019, None, None, None, 67))
+        self.assertEqual(parse_worktodo_line("Pfactor=N/A,1,2,100019,-1,67,1.3,\"1800343\""), ("Pfactor", 100019, None, None, None, 67))
+        self.assertIsNone(parse_worktodo_line("Pfactor=1,2,100019,-1,67,0"))
+
+    def test_other_lines(self):
+        for l in ["", "[Worker #1]", "; comment", f"Test={AID},100019,67,1", "ECM2=1,2,100019,-1,50000,5000000,10",
+                  "Pminus1=1,2,100019,1,1000000,30000000", "Pminus1=1,3,100019,-1,1000000,30000000",
+                  "Pplus1=2,2,100019,-1,500000,0,1", "Pfactor=1,10,100019,-1,67,2"]:
+            self.assertIsNone(parse_worktodo_line(l), l)
+
+    def test_errors(self):
+        for l in ["Pminus1=1,2,100019,-1,1e6,30000000", "Pminus1=1,2,100019", "Pfactor=1,2,100019,-1,67"]:
+            with self.assertRaises(ParseError):
+                parse_worktodo_line(l)
+
+class TestLocalWork(unittest.TestCase):
+    def test_read_worktodo(self):
+        local = LocalWork()
+        local.read_worktodo(io.StringIO("\n".join([
+            "[Worker #1]",
+            "Pminus1=N/A,1,2,100019,-1,1000000,30000000,67",
+            "Pminus1=1,2,100043,-1,2000000,0",       # Prime95 chooses B2
+            f"Pplus1={AID},1,2,100019,-1,500000,50000000,1,67",
+            "Pplus1=N/A,1,2,100019,-1,600000,0,2",
+            "Pplus1=N/A,1,2,100043,-1,700000,0,3",
+            "Pplus1=N/A,1,2,100049,-1,800000,0",     # nth_run defaults to 1
+            "Pminus1=N/A,1,2,100057,1,1000000,30000000,67", # 2^n+1 is not a Mersenne number
+            "Test=N/A,100069,67,1",
+        ])))
+        self.assertEqual(local.pm1, {100019: {(1000000, 30000000, 0)}, 100043: {(2000000, 2000000, 0)}})
+        # nth_run 1 and 2 are the start values 2/7 and 6/5, 3 and above are random (0/0)
+        self.assertEqual(local.pp1, {
+            100019: {(500000, 50000000, 2, 7), (600000, 600000, 6, 5)},
+            100043: {(700000, 700000, 0, 0)},
+            100049: {(800000, 800000, 2, 7)},
+        })
+
+    def test_read_worktodo_pfactor(self):
+        local = LocalWork()
+        local.read_worktodo(io.StringIO(f"Pfactor={AID},1,2,100019,-1,67,2\nPfactor=N/A,1,2,100043,-1,67,0\n"))
+        B1, B2 = planner.optimal_bounds(100019, 67)
+        self.assertEqual(local.pm1, {100019: {(B1, B2, 0)}})
+        # the planner does not generate P-1 work again for the queued Pfactor line
+        report = Report()
+        report.tf = planner.tf_bits(1, 68)
+        local.merge(100019, report)
+        status = planner.make_status(100019, report)
+        self.assertFalse(any(l.startswith("Pminus1") for l in planner.plan(status)))
+
+    def test_read_results(self):
+        local = LocalWork()
+        unknown = local.read_results(io.StringIO("\n".join([
+            '{"status":"NF", "exponent":100019, "worktype":"P-1", "b1":1000000, "b2":30000000, "brent-suyama":12}',
+            '{"status":"NF", "exponent":100019, "worktype":"P+1", "b1":500000, "b2":50000000, "start":"2/7"}',
+            '{"status":"NF", "exponent":100043, "worktype":"P-1", "b1":2000000}',
+            '{"status":"NF", "k":3, "b":2, "n":100049, "c":-1, "exponent":100049, "worktype":"P-1", "b1":2000000}',
+            '{"status":"NF", "exponent":100049, "worktype":"P-1"}',
+            "M100057 completed P-1, B1=1000000, B2=30000000, E=12, Wh8: 1A2B3C4D, AID: " + AID,
+            "[Mon Jan  1 12:00:00 2024]",
+            "UID: user/host, M100069 has a factor: 1800343 (P-1, B1=3000000, B2=90000000)",
+            "[Mon Jan  1 12:00:00 2024] M100103 completed P+1, B1=500000, B2=25000000, start=6/5, Wh8: 1A2B3C4D",
+            "M100109 completed P-1, Wh8: 1A2B3C4D",
+            "M100129 no factor from 2^67 to 2^68",
+        ])))
+        self.assertEqual(local.pm1, {
+            100019: {(1000000, 30000000, 12)},
+            100043: {(2000000, 2000000, 0)},
+            100057: {(1000000, 30000000, 12)},
+            100069: {(3000000, 90000000, 0)},
+        })
+        self.assertEqual(local.pp1, {100019: {(500000, 50000000, 2, 7)}, 100103: {(500000, 25000000, 6, 5)}})
+        # the JSON line without b1 and the text line without bounds
+        self.assertEqual(unknown, 2)
+
+    def test_merge(self):
+        local = LocalWork()
+        local.add_pm1(100019, 1000000, 30000000)
+        local.add_pm1(100019, 2000000, 0)
+        local.add_pp1(100019, 500000, 0, 2, 7)
+        report = Report()
+        report.pm1.add( (1000000, 30000000, 0) )
+        self.assertEqual(local.merge(100019, report), 3)
+        self.assertEqual(report.pm1, {(1000000, 30000000, 0), (2000000, 2000000, 0)})
+        self.assertEqual(report.pp1, {(500000, 500000, 2, 7)})
+        # no local work for this exponent
+        report = Report()
+        self.assertEqual(local.merge(100043, report), 0)
+        self.assertEqual((report.pm1, report.pp1), (set(), set()))
+
+if __name__ == "__main__":
+    unittest.main()